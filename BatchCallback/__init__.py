@@ -0,0 +1,35 @@
+import os
+import hmac
+import json
+import base64
+import hashlib
+import logging
+import azure.functions as func
+
+# Speech 서비스 배치 완료 웹훅 수신 -> batch-completed 큐에 작업ID 전달 (실제 처리는 BatchComplete 함수)
+#   - HTTP 함수는 응답시간 제한이 있어 병합/요약을 여기서 직접 하지 않음
+def main(req: func.HttpRequest, msg: func.Out[str]) -> func.HttpResponse:
+    # 웹훅 등록시 검증 요청: 받은 토큰을 그대로 돌려줌
+    validation_token = req.params.get("validationToken") or req.headers.get("Validation-Token")
+    if validation_token:
+        return func.HttpResponse(validation_token, status_code=200)
+
+    body = req.get_body()
+    secret = os.environ.get("BATCH_WEBHOOK_SECRET")
+    if secret:
+        expected = base64.b64encode(hmac.new(secret.encode("utf-8"), body, hashlib.sha256).digest()).decode()
+        signature = req.headers.get("X-MicrosoftSpeechServices-Signature", "")
+        if not hmac.compare_digest(expected, signature):
+            logging.warning("[BatchCallback] 서명 불일치, 요청 무시")
+            return func.HttpResponse(status_code=401)
+
+    event = req.headers.get("X-MicrosoftSpeechServices-Event", "")
+    if event.lower() != "transcriptioncompletion":
+        return func.HttpResponse(status_code=200)
+
+    tid = json.loads(body).get("self", "").rstrip("/").split("/")[-1]
+    if not tid:
+        return func.HttpResponse("transcription id 없음", status_code=400)
+    msg.set(json.dumps({"tid": tid}))
+    logging.info(f"[BatchCallback] 배치 완료 이벤트 수신: {tid}")
+    return func.HttpResponse(status_code=202)
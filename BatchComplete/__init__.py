@@ -0,0 +1,11 @@
+import json
+import logging
+import azure.functions as func
+from ..BlobTrigger.pipeline import complete_batch_job
+
+# batch-completed 큐 메시지({"tid": ...})로 배치 결과 저장 -> (gpt4otranscribe도 끝났으면) 병합/요약
+#   - 웹훅(BatchCallback) 외에 같은 형식의 메시지를 직접 넣어 재처리할 수도 있음
+def main(msg: func.QueueMessage):
+    tid = json.loads(msg.get_body().decode("utf-8"))["tid"]
+    logging.info(f"[BatchComplete] 배치 완료 처리 시작: {tid}")
+    complete_batch_job(tid)
@@ -0,0 +1,12 @@
+import json
+import logging
+import azure.functions as func
+from ..BlobTrigger.queue_pipeline import handle_batch_poll
+
+# batch-poll 큐 메시지({"meeting_dir", "run_id", "tid", "attempt", "submitted_at"})로 배치 상태 확인
+#   - 진행 중이면 다음 조회 간격만큼 지연된 메시지를 다시 넣고 바로 종료 (BATCH_COMPLETION_MODE=poll일 때)
+#   - {"tid", "meeting_dir", "webhook_deadline": true}: 웹훅 모드 대기시간 확인 (웹훅 유실시 완료/실패 처리)
+def main(msg: func.QueueMessage):
+    message = json.loads(msg.get_body().decode("utf-8"))
+    logging.info(f"[BatchPoll] 배치 상태 확인: {message['tid']} ({message['meeting_dir']})")
+    handle_batch_poll(message)
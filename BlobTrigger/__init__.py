@@ -1,46 +1,52 @@
 import os
 import azure.functions as func
 import logging
-from azure.storage.blob import BlobServiceClient
-import json
-from .stt_utils import stt_gpt4otranscribe, stt_batch, merge, summarize
+from .blob_utils import spool_audio_stream, to_wav_spool
+from .audio_processing import AUDIO_CONTENT_TYPES
+from .clients import get_blob_service
+from .pipeline import run_pipeline, BATCH_COMPLETION_MODE
+from .queue_pipeline import start_queue_pipeline
+from .queues import PIPELINE_MODE
+from .metrics import PipelineMetrics
 
 def main(blob: func.InputStream):
     blob_path = blob.name
     container_name = os.environ.get("BLOB_CONTAINER_NAME", "meeting")
-    wav_bytes = blob.read()
     logging.info(f"[BlobTrigger] New blob: {blob_path}, size={blob.length}")
     meeting_dir = os.path.dirname(blob_path)
 
     if meeting_dir.startswith(f"{container_name}/"):
         meeting_dir = os.path.relpath(meeting_dir, container_name)
-
+    audio_blob_path = f"{meeting_dir}/{os.path.basename(blob_path)}"
+    audio_format = os.path.splitext(blob_path)[1].lstrip(".").lower()
+    if audio_format not in AUDIO_CONTENT_TYPES:
+        logging.warning(f"[BlobTrigger] 지원하지 않는 오디오 형식, 무시: {blob_path}")
+        return
+
+    # 단계별 실행시간/읽고 쓴 바이트/API 지연·재시도·토큰/최대 RSS -> {meeting_dir}/metrics.json
+    metrics = PipelineMetrics(meeting_dir)
+
+    # 트리거로 받은 오디오를 한 번만 spool 파일로 복사해 모든 단계에서 공유 (재다운로드 X)
+    #   - flac/ogg(Opus) 업로드는 여기서 PCM wav spool로 한 번만 디코딩 (배치 전사는 압축 원본 blob을 그대로 사용)
+    with metrics.stage("download"):
+        audio_file = to_wav_spool(spool_audio_stream(blob), audio_format)
+    blob_service = None
     try:
-        blob_service = BlobServiceClient(
-            account_url=f"https://{os.environ['BLOB_ACCOUNT_NAME']}.blob.core.windows.net",
-            credential=os.environ["BLOB_ACCOUNT_KEY"]
-        )
-
-        # gpt4otranscribe 전사 -> script_gpt4otranscribe.txt [1]
-        stt_gpt4otranscribe(meeting_dir=meeting_dir, blob_service=blob_service, container_name=container_name) ###test
-
-        meta_blob_path = f"{meeting_dir}/meeting_metadata.json"
-        meta_blob_client = blob_service.get_blob_client(container=container_name, blob=meta_blob_path)
-        meta_json = json.loads(meta_blob_client.download_blob().readall())
-        num_participants = int(meta_json.get('num_participants', 5))
-        meeting_id = os.path.basename(meeting_dir)
-        wav_blob_path = f"{meeting_dir}/meeting_audio_raw.wav"
-        
-        # batch transcription 전사 -> script_batch_extracted.txt [2]
-        stt_batch(meeting_id=meeting_id, wav_blob_path=wav_blob_path, max_num_speakers=num_participants) ###test
-
-        # [1] + [2] -> script_final.txt [3]
-        merge(meeting_dir, blob_service, container_name)
-
-        # [3] 요약 -> summary.txt
-        summarize(meeting_dir, blob_service, container_name) ###test
+        blob_service = get_blob_service()
 
-        logging.info(f"[BlobTrigger] 후처리 실행 완료: {meeting_dir} (참가자수: {num_participants})")
+        if PIPELINE_MODE == "queue":
+            # batch 작업등록 + 청크 준비까지만 하고, 청크별 전사/병합/요약은 단계 큐 함수들이 이어서 진행
+            start_queue_pipeline(meeting_dir, audio_file, blob_service, container_name, metrics, audio_blob_path)
+        else:
+            # batch 작업등록 > (batch 처리 중) gpt4otranscribe 전사 > 병합 > 요약 (단계별 캐시, BATCH_COMPLETION_MODE 참고)
+            run_pipeline(meeting_dir, audio_file, blob_service, container_name, metrics=metrics, audio_blob_path=audio_blob_path)
 
     except Exception as e:
         logging.error(f"[BlobTrigger] 처리 중 오류 발생: {e}")
+        if PIPELINE_MODE == "queue" or BATCH_COMPLETION_MODE == "webhook":
+            # ingest / (웹훅 모드) gpt4otranscribe 실패는 트리거 재시도에 맡김 (완료된 단계는 캐시로 생략)
+            raise
+    finally:
+        audio_file.close()
+        if blob_service is not None:
+            metrics.save(blob_service, container_name)
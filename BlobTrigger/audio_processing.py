@@ -1,14 +1,52 @@
 import io
+import os
 import re
 import json
+import math
+import struct
 import difflib
 import isodate
-from pydub import AudioSegment
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
 from datetime import timedelta
 
+import numpy as np
+import soundfile as sf
+
 MAX_SIZE_MB = 15  # gpt-4o-transcribe API 호출 시 안전한 wav 청크 최대 크기(MB)
 CHUNK_SIZE_BYTES = MAX_SIZE_MB * 1024 * 1024
-OVERLAP_SEC = 0  # 청크간 문맥 연결을 위해 앞뒤로 겹칠 길이(초), 현재 사용 안 함
+OVERLAP_SEC = 0  # 청크간 문맥 연결을 위해 앞뒤로 겹칠 길이(초), 0이면 무음 구간 경계로 자름 (SILENCE_SPLIT_ENABLED)
+
+# 무음 기반 청크 경계/무음 제거 (프레임별 에너지(dBFS)를 numpy로 계산하는 간단한 VAD)
+#   - 청크 끝(크기 한도) 앞 SILENCE_SEARCH_SEC초 안에서 가장 긴 무음의 가운데를 경계로 사용, 무음이 없으면 크기 한도에서 자름
+#   - SILENCE_TRIM_SEC > 0 이면 그보다 긴 무음은 앞뒤 SILENCE_KEEP_SEC초만 남기고 전사 전에 잘라냄 (청크 경계는 그대로, chunk_plan.json에 청크별 전송 길이 기록)
+SILENCE_SPLIT_ENABLED = os.environ.get("SILENCE_SPLIT_ENABLED", "true").lower() == "true"
+SILENCE_TRIM_SEC = float(os.environ.get("SILENCE_TRIM_SEC", "0"))
+SILENCE_SEARCH_SEC = 30
+SILENCE_MIN_SEC = 0.3   # 경계 후보로 볼 최소 무음 길이
+SILENCE_KEEP_SEC = 0.5
+VAD_FRAME_SEC = 0.03
+VAD_MARGIN_DB = 10      # 구간 잡음 바닥(하위 10% 에너지) + 마진 미만이면 무음
+VAD_MAX_DBFS = -35      # 단, 이 값 이상은 무음으로 보지 않음 (말소리만 있는 구간 보호)
+VAD_BLOCK_SEC = 60      # 에너지 계산시 한 번에 읽는 길이
+PCM_DTYPES = {16: np.int16, 32: np.int32}
+
+# 압축 오디오 전송
+#   - 업로드 원본: meeting_audio_raw.{wav|flac|ogg} 모두 트리거, flac/ogg(Opus)는 받은 뒤 PCM wav spool로 한 번만 디코딩
+#   - gpt-4o-transcribe 전송 청크: TRANSCRIBE_AUDIO_FORMAT(flac/ogg)로 인코딩해 전송, 청크 길이는 크기 대신
+#     TRANSCRIBE_MAX_CHUNK_SEC(모델 최대 입력 길이 1500초 이내)로 제한. 인코딩 결과가 API 한도를 넘으면 Opus로 재인코딩
+AUDIO_CONTENT_TYPES = {"wav": "audio/wav", "flac": "audio/flac", "ogg": "audio/ogg"}
+SF_FORMATS = {"flac": ("FLAC", "PCM_16"), "ogg": ("OGG", "OPUS")}
+TRANSCRIBE_AUDIO_FORMAT = os.environ.get("TRANSCRIBE_AUDIO_FORMAT", "flac")
+TRANSCRIBE_MAX_CHUNK_SEC = int(os.environ.get("TRANSCRIBE_MAX_CHUNK_SEC", "1400"))
+API_MAX_UPLOAD_BYTES = 25 * 1024 * 1024 - 64 * 1024  # gpt-4o-transcribe 파일 한도(25MB)에서 여유분 제외
+CODEC_BLOCK_SEC = 10  # 인코딩/디코딩시 한 번에 처리하는 길이
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+# wav 헤더 정보: data_offset/data_size는 바이트 단위, frames는 샘플(프레임) 수
+WavInfo = namedtuple("WavInfo", ["rate", "channels", "bits", "block_align", "data_offset", "data_size", "frames"])
 
 # ISO8601 문자열(예: PT5.32S)을 초(float)로 변환
 def iso_to_sec(iso: str) -> float:
@@ -22,65 +60,425 @@ def fmt(sec: float) -> str:
     ms = int((sec % 1) * 100)
     return f"{int(hours):02}:{int(minutes):02}:{int(sec):02}.{ms:02}"
 
-# "[시:분:초.밀리]" 형태의 문자열에서 시간을 초(float)로 파싱
-def parse_time(s):
-    m = re.search(r'\[\((\d{2}):(\d{2}):(\d{2})\.(\d{2})\)\]', s)
-    if not m:
-        return None
-    h, m_, s_, ms = map(int, m.groups())
-    return h * 3600 + m_ * 60 + s_ + ms / 100
+# bytes 또는 파일 핸들(spool)을 처음부터 읽을 수 있는 파일 객체로 통일
+def as_audio_file(wav):
+    if isinstance(wav, (bytes, bytearray, memoryview)):
+        return io.BytesIO(wav)
+    wav.seek(0)
+    return wav
 
-# wav 파일을 지정한 크기(바이트) 단위로 청크 분할
-def chunk_wav_bytes(wav_bytes, rate=16000, chunk_bytes=CHUNK_SIZE_BYTES):
-    audio = AudioSegment.from_file(io.BytesIO(wav_bytes), format="wav")
-    total_ms = len(audio)
-    chunk_ms = int(chunk_bytes / (rate * 2) * 1000)
-    chunks = []
-    start = 0
-    while start < total_ms:
-        end = min(start + chunk_ms, total_ms)
-        chunk = audio[start:end]
-        buf = io.BytesIO()
-        chunk.export(buf, format="wav")
-        chunks.append(buf.getvalue())
-        if end == total_ms:
+# wav 헤더(RIFF)만 읽어 포맷과 data 청크 위치(바이트 오프셋/크기) 반환 - 오디오 디코딩 없음
+def read_wav_header(wav):
+    f = as_audio_file(wav)
+    riff = f.read(12)
+    if len(riff) < 12 or riff[:4] != b"RIFF" or riff[8:12] != b"WAVE":
+        raise ValueError("RIFF/WAVE 형식의 wav 파일이 아닙니다.")
+    fmt_chunk = None
+    while True:
+        hdr = f.read(8)
+        if len(hdr) < 8:
+            raise ValueError("wav 파일에서 data 청크를 찾을 수 없습니다.")
+        chunk_id, size = hdr[:4], struct.unpack("<I", hdr[4:])[0]
+        if chunk_id == b"fmt ":
+            fmt_chunk = struct.unpack("<HHIIHH", f.read(size + (size & 1))[:16])
+        elif chunk_id == b"data":
+            data_offset = f.tell()
+            file_end = f.seek(0, io.SEEK_END)
+            # 스트리밍 기록 등으로 크기가 비어있거나(0/0xFFFFFFFF) 실제보다 크면 파일 끝까지로 간주
+            if size in (0, 0xFFFFFFFF) or data_offset + size > file_end:
+                size = file_end - data_offset
             break
-        start = end
-    return chunks
-
-# wav 전체 길이 기준으로 각 청크의 시작/끝 오프셋 반환
-def get_chunk_offsets(wav_bytes, chunk_bytes=CHUNK_SIZE_BYTES, overlap_sec=OVERLAP_SEC, rate=16000):
-    audio = AudioSegment.from_file(io.BytesIO(wav_bytes), format="wav")
-    total_ms = len(audio)
-    chunk_ms = int(chunk_bytes / (rate * 2) * 1000)
-    overlap_ms = overlap_sec * 1000
-    offsets = []
+        else:
+            f.seek(size + (size & 1), io.SEEK_CUR)
+    if fmt_chunk is None:
+        raise ValueError("wav 파일에서 fmt 청크를 찾을 수 없습니다.")
+    audio_format, channels, rate, _, block_align, bits = fmt_chunk
+    if audio_format not in (WAVE_FORMAT_PCM, WAVE_FORMAT_EXTENSIBLE):
+        raise ValueError(f"PCM wav만 지원합니다. (format={audio_format})")
+    size -= size % block_align
+    return WavInfo(rate, channels, bits, block_align, data_offset, size, size // block_align)
+
+# PCM wav 헤더(44바이트) 생성
+def wav_header(data_size, rate=16000, channels=1, bits=16):
+    block_align = channels * bits // 8
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_size, b"WAVE",
+        b"fmt ", 16, WAVE_FORMAT_PCM, channels, rate, rate * block_align, block_align, bits,
+        b"data", data_size
+    )
+
+# 압축 오디오(flac/ogg 등) 파일 핸들을 16bit PCM wav로 디코딩해 dst에 기록 (CODEC_BLOCK_SEC씩 처리, 헤더는 마지막에 보정)
+def decode_to_wav(src, dst):
+    src.seek(0)
+    with sf.SoundFile(src) as f:
+        rate, channels = f.samplerate, f.channels
+        dst.write(wav_header(0, rate, channels, 16))
+        size = 0
+        for block in f.blocks(blocksize=rate * CODEC_BLOCK_SEC, dtype="int16"):
+            data = block.tobytes()
+            dst.write(data)
+            size += len(data)
+    dst.seek(0)
+    dst.write(wav_header(size, rate, channels, 16))
+    dst.seek(0)
+    return dst
+
+# wav bytes를 flac/ogg(Opus) bytes로 인코딩 (audio_format이 wav면 그대로)
+def encode_audio(wav_bytes, audio_format):
+    if audio_format == "wav":
+        return bytes(wav_bytes)
+    fmt, subtype = SF_FORMATS[audio_format]
+    out = io.BytesIO()
+    with sf.SoundFile(io.BytesIO(wav_bytes)) as src:
+        with sf.SoundFile(out, "w", src.samplerate, src.channels, subtype, format=fmt) as dst:
+            for block in src.blocks(blocksize=src.samplerate * CODEC_BLOCK_SEC, dtype="int16"):
+                dst.write(block)
+    return out.getvalue()
+
+# gpt-4o-transcribe 전송용 청크 인코딩 -> (bytes, 실제 포맷). flac이 API 한도를 넘으면 Opus로 재인코딩
+def encode_transcribe_chunk(wav_bytes, audio_format=TRANSCRIBE_AUDIO_FORMAT):
+    data = encode_audio(wav_bytes, audio_format)
+    if len(data) > API_MAX_UPLOAD_BYTES and audio_format == "flac":
+        return encode_audio(wav_bytes, "ogg"), "ogg"
+    return data, audio_format
+
+# 전사 청크 크기(PCM 바이트): wav 전송은 CHUNK_SIZE_BYTES, 압축 전송은 TRANSCRIBE_MAX_CHUNK_SEC 길이
+def transcribe_chunk_bytes(info, audio_format=TRANSCRIBE_AUDIO_FORMAT):
+    if audio_format == "wav":
+        return CHUNK_SIZE_BYTES
+    return TRANSCRIBE_MAX_CHUNK_SEC * info.rate * info.block_align
+
+# 청크별 (시작, 끝) 프레임 구간 계산 - chunk_wav_bytes/get_chunk_offsets가 같은 경계를 쓰도록 공통화
+def chunk_frame_ranges(info, chunk_bytes=CHUNK_SIZE_BYTES, overlap_sec=0):
+    chunk_frames = max(1, chunk_bytes // info.block_align)
+    overlap_frames = int(overlap_sec * info.rate)
+    ranges = []
     start = 0
-    while start < total_ms:
-        end = min(start + chunk_ms, total_ms)
-        offsets.append((start / 1000, end / 1000))
-        if end == total_ms:
+    while start < info.frames:
+        end = min(start + chunk_frames, info.frames)
+        ranges.append((start, end))
+        if end == info.frames:
             break
-        start = end - overlap_ms
-    return offsets
-
-# 배치 전사 스크립트(txt)를 청크별 구간으로 나누기
-def split_batch_script_by_chunks(batch_txt, chunk_offsets):
-    import re
-    def parse_times(line):
-        m = re.search(r'\[\((\d{2}):(\d{2}):(\d{2})\.(\d{2})\)\]', line)
-        m2 = re.search(r'\[(\d+\.\d+) s,', line)
-        if not m or not m2:
-            return None, None, line
-        h, mi, s, ms = map(int, m.groups())
-        offset = h*3600 + mi*60 + s + ms/100
-        dur = float(m2.group(1))
-        return offset, offset+dur, line
-
-    lines = batch_txt.splitlines()
-    lines_with_times = [parse_times(line) for line in lines if parse_time(line) is not None]
-    chunk_texts = []
-    for start, end in chunk_offsets:
-        chunk_lines = [l for s, e, l in lines_with_times if s is not None and e is not None and (s < end and e > start)]
-        chunk_texts.append('\n'.join(chunk_lines))
-    return chunk_texts
+        start = max(end - overlap_frames, start + 1)
+    return ranges
+
+# wav의 [start_frame, end_frame) 구간만 읽어 새 헤더를 붙인 wav bytes로 반환
+#   - bytes 입력은 memoryview 슬라이스로 복사 없이 잘라내고, 파일 핸들은 해당 바이트 범위만 읽음
+def read_wav_range(wav, info, start_frame, end_frame):
+    begin = info.data_offset + start_frame * info.block_align
+    size = (end_frame - start_frame) * info.block_align
+    header = wav_header(size, info.rate, info.channels, info.bits)
+    if isinstance(wav, (bytes, bytearray, memoryview)):
+        return header + memoryview(wav)[begin:begin + size]
+    wav.seek(begin)
+    return header + wav.read(size)
+
+# wav를 지정한 크기(바이트) 단위 청크로 하나씩 생성 (한 번에 청크 하나만 메모리에 올림)
+def iter_wav_chunks(wav, chunk_bytes=CHUNK_SIZE_BYTES):
+    info = read_wav_header(wav)
+    for start, end in chunk_frame_ranges(info, chunk_bytes):
+        yield read_wav_range(wav, info, start, end)
+
+# wav 파일을 지정한 크기(바이트) 단위로 청크 분할 (wav: bytes 또는 파일 핸들)
+def chunk_wav_bytes(wav_bytes, rate=16000, chunk_bytes=CHUNK_SIZE_BYTES):
+    return list(iter_wav_chunks(wav_bytes, chunk_bytes))
+
+# wav의 여러 [start, end) 프레임 구간을 이어붙여 wav bytes 하나로 반환 (무음 제거한 청크용)
+def read_wav_segments(wav, info, segments):
+    if len(segments) == 1:
+        return read_wav_range(wav, info, *segments[0])
+    parts = []
+    for start, end in segments:
+        parts.append(read_wav_range(wav, info, start, end)[44:])
+    data = b"".join(parts)
+    return wav_header(len(data), info.rate, info.channels, info.bits) + data
+
+# [start, end) 프레임 구간의 VAD 프레임별 에너지(dBFS) 배열 (VAD_BLOCK_SEC씩 읽어 메모리 사용 일정)
+def frame_dbfs(wav, info, start, end, frame_sec=VAD_FRAME_SEC):
+    dtype = PCM_DTYPES[info.bits]
+    frame_len = max(1, int(frame_sec * info.rate))
+    block_frames = frame_len * max(1, int(VAD_BLOCK_SEC / frame_sec))
+    full_scale = float(2 ** (info.bits - 1))
+    out = []
+    for block_start in range(start, end - frame_len + 1, block_frames):
+        block_end = min(block_start + block_frames, end)
+        n = (block_end - block_start) // frame_len * frame_len
+        if n == 0:
+            break
+        pcm = np.frombuffer(read_wav_range(wav, info, block_start, block_start + n)[44:], dtype=dtype)
+        samples = pcm.reshape(-1, info.channels).astype(np.float32).mean(axis=1) / full_scale
+        rms = np.sqrt(np.mean(samples.reshape(-1, frame_len) ** 2, axis=1))
+        out.append(20 * np.log10(np.maximum(rms, 1e-6)))
+    return np.concatenate(out) if out else np.zeros(0, dtype=np.float32)
+
+# 에너지 배열에서 min_frames 이상 이어지는 무음 구간들의 (시작, 끝) 인덱스 배열
+def silence_runs(db, min_frames):
+    if len(db) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    threshold = min(np.percentile(db, 10) + VAD_MARGIN_DB, VAD_MAX_DBFS)
+    padded = np.concatenate(([False], db < threshold, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    starts, ends = edges[0::2], edges[1::2]
+    keep = ends - starts >= min_frames
+    return starts[keep], ends[keep]
+
+# 청크 끝 후보(limit) 앞 search_sec초 안에서 가장 긴 무음의 가운데 프레임 (없으면 limit)
+def find_split_frame(wav, info, start, limit, search_sec=SILENCE_SEARCH_SEC):
+    frame_len = max(1, int(VAD_FRAME_SEC * info.rate))
+    lo = max(start + 1, limit - int(search_sec * info.rate))
+    db = frame_dbfs(wav, info, lo, limit)
+    starts, ends = silence_runs(db, int(SILENCE_MIN_SEC / VAD_FRAME_SEC))
+    if len(starts) == 0:
+        return limit
+    lengths = ends - starts
+    best = np.flatnonzero(lengths == lengths.max())[-1]  # 가장 긴 무음 (같으면 뒤쪽)
+    return int(lo + (starts[best] + ends[best]) // 2 * frame_len)
+
+# 청크 [start, end) 안에서 trim_sec보다 긴 무음을 앞뒤 keep_sec만 남기고 뺀 나머지 프레임 구간들
+def trim_silence(wav, info, start, end, trim_sec=SILENCE_TRIM_SEC, keep_sec=SILENCE_KEEP_SEC):
+    frame_len = max(1, int(VAD_FRAME_SEC * info.rate))
+    starts, ends = silence_runs(frame_dbfs(wav, info, start, end), int(trim_sec / VAD_FRAME_SEC))
+    keep = int(keep_sec * info.rate)
+    segments, pos = [], start
+    for s, e in zip(starts * frame_len + start, ends * frame_len + start):
+        cut_start, cut_end = s + keep, e - keep
+        if cut_end <= cut_start:
+            continue
+        if cut_start > pos:
+            segments.append((pos, int(cut_start)))
+        pos = int(cut_end)
+    if pos < end:
+        segments.append((pos, end))
+    return tuple(segments) or ((start, end),)
+
+# 청크 계획: start/end는 원본 기준 청크 경계(프레임), segments는 실제로 전사에 보낼 원본 프레임 구간들
+AudioChunk = namedtuple("AudioChunk", ["start", "end", "segments"])
+
+# 오디오 청크 계획 수립 (wav: bytes 또는 파일 핸들)
+#   - split: 무음 구간에서 경계를 정함 (False거나 지원하지 않는 비트수면 크기 한도로 자름)
+#   - trim_sec: 0보다 크면 청크 안의 긴 무음을 잘라냄
+def plan_audio_chunks(wav, info=None, chunk_bytes=CHUNK_SIZE_BYTES, split=None, trim_sec=None):
+    info = info or read_wav_header(wav)
+    split = SILENCE_SPLIT_ENABLED if split is None else split
+    trim_sec = SILENCE_TRIM_SEC if trim_sec is None else trim_sec
+    vad_ok = info.bits in PCM_DTYPES
+    if not (split and vad_ok):
+        bounds = chunk_frame_ranges(info, chunk_bytes)
+    else:
+        chunk_frames = max(1, chunk_bytes // info.block_align)
+        bounds, start = [], 0
+        while start < info.frames:
+            limit = start + chunk_frames
+            if limit >= info.frames:
+                bounds.append((start, info.frames))
+                break
+            end = find_split_frame(wav, info, start, limit)
+            bounds.append((start, end))
+            start = end
+    return [
+        AudioChunk(s, e, trim_silence(wav, info, s, e, trim_sec) if trim_sec > 0 and vad_ok else ((s, e),))
+        for s, e in bounds
+    ]
+
+# 청크 계획 -> chunk_plan.json 내용 (원본 기준 청크 경계와 무음 제거 후 전송 길이)
+#   - 병합은 원본 시각 기준 청크 경계(start/end)로 배치 전사를 나눔 (gpt 전사문에는 시각이 없어 청크 안 시각 변환은 쓰지 않음)
+def chunk_plan_dict(plan, rate):
+    chunks = []
+    for i, chunk in enumerate(plan):
+        sent = sum(e - s for s, e in chunk.segments)
+        chunks.append({"index": i + 1, "start": chunk.start / rate, "end": chunk.end / rate,
+                       "sent_sec": round(sent / rate, 3)})
+    total = sum(c.end - c.start for c in plan)
+    sent = sum(e - s for c in plan for s, e in c.segments)
+    return {"rate": rate, "audio_sec": round(total / rate, 3), "sent_sec": round(sent / rate, 3), "chunks": chunks}
+
+# 각 청크의 시작/끝 오프셋(초) 반환 (wav: bytes 또는 파일 핸들, 무음 제거 없이 plan_audio_chunks로 계산한 경계)
+#   - overlap_sec > 0 이면 기존처럼 크기 단위로 겹치게 자른 경계
+#   - chunk_bytes: 지정하지 않으면 전사 청크 크기(transcribe_chunk_bytes)
+def get_chunk_offsets(wav_bytes, chunk_bytes=None, overlap_sec=OVERLAP_SEC, rate=16000):
+    info = read_wav_header(wav_bytes)
+    chunk_bytes = chunk_bytes or transcribe_chunk_bytes(info)
+    if overlap_sec > 0:
+        return [(start / info.rate, end / info.rate) for start, end in chunk_frame_ranges(info, chunk_bytes, overlap_sec)]
+    return [(c.start / info.rate, c.end / info.rate) for c in plan_audio_chunks(wav_bytes, info, chunk_bytes, trim_sec=0)]
+
+# 배치 전사 결과(script_batch.json)를 발화구간 배열로 한 번만 파싱 (시작시각 순 정렬)
+#   - offsets/durations/confidences: 초/신뢰도 float 배열, speakers: 화자번호 int 배열(-1: 미상), texts: 발화문 (인덱스 = 구간 번호)
+#   - words: 발화별 표시 단어 타임스탬프 [(단어, 시작초, 길이초), ...] (displayWords, 단어 타임스탬프를 요청하지 않은 결과면 빈 목록)
+BatchSegments = namedtuple("BatchSegments", ["offsets", "durations", "speakers", "confidences", "texts", "max_duration", "words"])
+
+# displayWords 항목의 시각(초): offsetInTicks/durationInTicks(100ns)가 있으면 사용, 없으면 ISO8601
+def word_sec(word, key):
+    ticks = word.get(f"{key}InTicks")
+    return ticks / 10_000_000 if ticks is not None else iso_to_sec(word[key])
+
+def parse_batch_segments(json_bytes):
+    data = json.loads(json_bytes)
+    phrases = sorted(data.get("recognizedPhrases", []), key=lambda p: iso_to_sec(p["offset"]))
+    offsets, durations, speakers, confidences = array("d"), array("d"), array("i"), array("d")
+    texts, words = [], []
+    for p in phrases:
+        best = p["nBest"][0]
+        offsets.append(iso_to_sec(p["offset"]))
+        durations.append(iso_to_sec(p["duration"]))
+        speakers.append(int(p.get("speaker", -1)))
+        confidences.append(float(best.get("confidence", 0.0)))
+        texts.append(best["display"].strip())
+        words.append([(w["displayText"], word_sec(w, "offset"), word_sec(w, "duration")) for w in best.get("displayWords", [])])
+    return BatchSegments(offsets, durations, speakers, confidences, texts, max(durations, default=0.0), words)
+
+# 클라이언트 실시간 전사 journal(script_realtime.jsonl, 한 줄에 발화 1개)을 배치 결과와 같은 발화구간 배열로 파싱
+#   - 줄 형식: {"speaker": "Guest-1", "offset_sec": 12.3, "duration_sec": 4.5, "text": "...", "confidence": 0.9}
+#   - 화자 "Guest-N"은 N으로, 미상(Unknown)은 -1, 신뢰도가 없으면 nan(알 수 없음, 선택 재전사 대상 아님) / 마지막 줄이 잘려 있으면(기록 중 종료) 무시
+def parse_realtime_segments(jsonl_bytes):
+    rows = []
+    for line in jsonl_bytes.decode("utf-8").splitlines():
+        try:
+            row = json.loads(line)
+        except ValueError:
+            continue
+        if row.get("text", "").strip():
+            rows.append(row)
+    rows.sort(key=lambda r: r["offset_sec"])
+    offsets, durations, speakers, confidences = array("d"), array("d"), array("i"), array("d")
+    texts = []
+    for r in rows:
+        digits = "".join(ch for ch in str(r.get("speaker", "")) if ch.isdigit())
+        offsets.append(float(r["offset_sec"]))
+        durations.append(float(r.get("duration_sec", 0.0)))
+        speakers.append(int(digits) if digits else -1)
+        confidence = r.get("confidence")
+        confidences.append(math.nan if confidence is None else float(confidence))
+        texts.append(r["text"].strip())
+    return BatchSegments(offsets, durations, speakers, confidences, texts, max(durations, default=0.0), [[] for _ in rows])
+
+# 발화구간 한 개를 txt 한 줄로 출력 (script_batch_extracted.txt 포맷)
+def render_segment(segs, i, text=None):
+    speaker = segs.speakers[i] if segs.speakers[i] >= 0 else "?"
+    text = segs.texts[i] if text is None else text
+    confidence = "-" if math.isnan(segs.confidences[i]) else f"{segs.confidences[i]*100:.1f}"
+    return f"[({fmt(segs.offsets[i])})] speaker-{speaker} : {text}  [{segs.durations[i]:.2f} s, {confidence} %]"
+
+# 발화구간(전체 또는 indices) txt 출력
+def render_batch_txt(segs, indices=None):
+    indices = range(len(segs.texts)) if indices is None else indices
+    return "\n".join(render_segment(segs, i) for i in indices)
+
+# [start, end) 초 구간과 겹치는 발화구간 인덱스 (시작시각 정렬 + bisect로 후보만 확인)
+def segments_in_range(segs, start, end):
+    lo = bisect_left(segs.offsets, start - segs.max_duration)
+    hi = bisect_left(segs.offsets, end)
+    return [i for i in range(lo, hi) if segs.offsets[i] + segs.durations[i] > start]
+
+# ---------------------------------------------------------------- 정렬 기반 병합 (MERGE_MODE=align)
+
+NON_WORD = re.compile(r"[^\w]+")
+ALIGN_WINDOW_WORDS = 400  # 한 번에 정렬하는 배치 단어 수 (긴 단어열 전체를 한 번에 비교하면 반복 단어가 많을 때 매우 느림)
+
+# 정렬 비교용 단어 정규화 (문장부호 제거, 소문자)
+def norm_word(word):
+    return NON_WORD.sub("", word).lower()
+
+# 발화구간 i의 단어별 (정규화 단어, 중간 시각초): 단어 타임스탬프가 있으면 사용, 없으면 발화 길이를 글자수 비율로 나눠 추정
+def segment_words(segs, i):
+    if segs.words[i]:
+        return [(norm_word(w), start + dur / 2) for w, start, dur in segs.words[i]]
+    tokens = segs.texts[i].split()
+    total = sum(len(t) for t in tokens) or 1
+    result, pos = [], 0
+    for t in tokens:
+        result.append((norm_word(t), segs.offsets[i] + segs.durations[i] * (pos + len(t) / 2) / total))
+        pos += len(t)
+    return result
+
+# 두 단어열의 일치 구간 [(a 위치, b 위치, 길이), ...] (단어열을 앞에서부터 창 단위로 나눠 difflib로 비교)
+#   - 창 앞 3/4 안의 일치 구간만 확정하고(걸친 구간은 잘라서), 마지막 확정 위치부터 다음 창을 다시 잡음 (창 경계에서 어긋나지 않게)
+#   - 창 안에 일치 구간이 없으면 두 단어열 길이 비율대로 건너뜀
+def windowed_matching_blocks(a, b, window=ALIGN_WINDOW_WORDS):
+    blocks, i, j = [], 0, 0
+    ratio = len(b) / max(1, len(a))
+    while i < len(a) and j < len(b):
+        i_end = min(len(a), i + window)
+        j_end = min(len(b), j + int(window * ratio * 1.5) + 1)
+        final = i_end == len(a)
+        found = [(m.a, m.b, m.size) for m in difflib.SequenceMatcher(None, a[i:i_end], b[j:j_end], autojunk=False).get_matching_blocks() if m.size]
+        if not final:
+            cut = (i_end - i) * 3 // 4
+            found = [(ma, mb, min(size, cut - ma)) for ma, mb, size in found if ma < cut]
+        if not found:
+            if final:
+                break
+            step = (i_end - i) // 2
+            i, j = i + step, j + int(step * ratio)
+            continue
+        blocks += [(i + ma, j + mb, size) for ma, mb, size in found]
+        ma, mb, size = found[-1]
+        i, j = i + ma + size, j + mb + size
+        if final:
+            break
+    return blocks
+
+# 일치 구간 목록 -> difflib get_opcodes()와 같은 형식 [(tag, a0, a1, b0, b1), ...]
+def blocks_to_opcodes(blocks, len_a, len_b):
+    opcodes, i, j = [], 0, 0
+    for a, b, size in blocks + [(len_a, len_b, 0)]:
+        if i < a and j < b:
+            opcodes.append(("replace", i, a, j, b))
+        elif i < a:
+            opcodes.append(("delete", i, a, j, b))
+        elif j < b:
+            opcodes.append(("insert", i, a, j, b))
+        if size:
+            opcodes.append(("equal", a, a + size, b, b + size))
+        i, j = a + size, b + size
+    return opcodes
+
+# 배치 단어열 [(정규화 단어, 발화구간), ...]과 gpt 전사문(시각 정보 없음)을 정렬(difflib)해 gpt 단어마다 발화구간 배정
+#   - equal: 같은 위치 배치 단어의 발화로 / replace: 길이 비율로 대응 / insert(gpt에만 있는 단어): 직전 배치 단어의 발화로
+#   - 반환: ({발화구간: [gpt 단어...]}, {발화구간: [일치 단어수, 배치 단어수]})
+def align_words(bwords, gpt_text):
+    assigned, counts = {}, {}
+    for _, i in bwords:
+        counts.setdefault(i, [0, 0])[1] += 1
+    gtokens = gpt_text.split()
+    if not bwords or not gtokens:
+        return assigned, counts
+    bnorm, gnorm = [w for w, _ in bwords], [norm_word(t) for t in gtokens]
+    for tag, b0, b1, g0, g1 in blocks_to_opcodes(windowed_matching_blocks(bnorm, gnorm), len(bnorm), len(gnorm)):
+        for k in range(g1 - g0):
+            if tag == "equal":
+                pos = b0 + k
+                counts[bwords[pos][1]][0] += 1
+            elif tag == "replace":
+                pos = b0 + k * (b1 - b0) // (g1 - g0)
+            else:  # insert
+                pos = max(b0 - 1, 0)
+            assigned.setdefault(bwords[pos][1], []).append(gtokens[g0 + k])
+    return assigned, counts
+
+# gpt 청크 전사문을 [start, end) 구간의 배치 단어열과 정렬 (align_words)
+#   - 배치 단어는 중간 시각이 청크 구간 안에 있는 것만 사용 → 청크 경계에 걸친 발화도 중복 없이 두 청크로 나뉨
+def align_chunk(segs, start, end, gpt_text):
+    bwords = [(w, i) for i in segments_in_range(segs, start, end)
+              for w, t in segment_words(segs, i) if w and start <= t < end]
+    return align_words(bwords, gpt_text)
+
+# 청크별 정렬 결과를 발화구간 단위로 모음
+#   - 반환: (texts {발화구간: gpt 문장}, ratios {발화구간: 배치 단어 중 gpt와 일치한 비율})
+#   - gpt 청크가 없는 구간의 발화는 ratios에 없음 (배치 문장 유지)
+def align_segments(segs, chunk_offsets, gpt_chunks):
+    words, counts = {}, {}
+    for c, (start, end) in enumerate(chunk_offsets):
+        gtxt = gpt_chunks[c] if c < len(gpt_chunks) else ""
+        if not gtxt.strip():
+            continue
+        assigned, chunk_counts = align_chunk(segs, start, end, gtxt)
+        for i, ws in assigned.items():
+            words.setdefault(i, []).extend(ws)
+        for i, (matched, total) in chunk_counts.items():
+            acc = counts.setdefault(i, [0, 0])
+            acc[0] += matched
+            acc[1] += total
+    ratios = {i: matched / total for i, (matched, total) in counts.items() if total}
+    return {i: " ".join(ws) for i, ws in words.items()}, ratios
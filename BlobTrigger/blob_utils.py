@@ -1,7 +1,24 @@
+import os
+import shutil
+import tempfile
+
+from azure.core.exceptions import ResourceExistsError
+
+from .metrics import add_bytes
+from .audio_processing import decode_to_wav, AUDIO_CONTENT_TYPES
+
+AUDIO_SPOOL_MAX_MB = int(os.environ.get("AUDIO_SPOOL_MAX_MB", "32"))  # 이 크기를 넘으면 메모리 대신 임시파일에 보관
+COPY_BLOCK_SIZE = 4 * 1024 * 1024
+
+# blob 전체를 bytes로 읽어옴 (읽은 크기는 현재 단계 metrics에 누적)
+def download_blob_bytes(blob_service, container_name, blob_path):
+    data = blob_service.get_blob_client(container=container_name, blob=blob_path).download_blob().readall()
+    add_bytes(read=len(data))
+    return data
+
 # blob에서 프롬프트(txt) 파일을 읽어옴
 def get_prompt_from_blob(blob_service, container_name, prompt_filename):
-    blob_client = blob_service.get_blob_client(container=container_name, blob=prompt_filename)
-    return blob_client.download_blob().readall().decode("utf-8")
+    return download_blob_bytes(blob_service, container_name, prompt_filename).decode("utf-8")
 
 # 문자열 또는 바이너리 데이터를 blob에 저장 (데이터 비어있으면 skip)
 def upload_blob(data, blob_path, blob_service, container_name, verbose=True):
@@ -12,5 +29,97 @@ def upload_blob(data, blob_path, blob_service, container_name, verbose=True):
             print(f"[WARN] 업로드 데이터가 비어있음: {blob_path}")
         return
     blob_service.get_blob_client(container=container_name, blob=blob_path).upload_blob(data, overwrite=True)
+    add_bytes(written=len(data))
     if verbose:
         print(f"[OK] blob 저장: {blob_path}")
+
+# blob이 없을 때만 생성 (이미 있으면 False) - 여러 함수 실행 중 하나만 다음 단계를 시작하도록 선점 표시에 사용
+def create_blob_once(data, blob_path, blob_service, container_name):
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    try:
+        blob_service.get_blob_client(container=container_name, blob=blob_path).upload_blob(data, overwrite=False)
+    except ResourceExistsError:
+        return False
+    add_bytes(written=len(data))
+    return True
+
+# blob 트리거 입력 스트림을 spool 임시파일로 한 번만 복사 (모든 단계가 이 파일 핸들을 공유)
+def spool_audio_stream(stream, max_mem_mb=AUDIO_SPOOL_MAX_MB):
+    spool = tempfile.SpooledTemporaryFile(max_size=max_mem_mb * 1024 * 1024)
+    shutil.copyfileobj(stream, spool, COPY_BLOCK_SIZE)
+    add_bytes(read=spool.tell())
+    spool.seek(0)
+    return spool
+
+# 업로드 원본이 압축 오디오(flac/ogg)면 PCM wav spool로 디코딩해 반환 (원본 spool은 닫음), wav면 그대로
+def to_wav_spool(spool, audio_format, max_mem_mb=AUDIO_SPOOL_MAX_MB):
+    if audio_format == "wav":
+        return spool
+    wav = tempfile.SpooledTemporaryFile(max_size=max_mem_mb * 1024 * 1024)
+    try:
+        decode_to_wav(spool, wav)
+    finally:
+        spool.close()
+    return wav
+
+# 회의 폴더의 원본 오디오 blob 경로 (meeting_audio_raw.wav/.flac/.ogg 중 있는 것, 없으면 None)
+def find_meeting_audio_blob(blob_service, container_name, meeting_dir):
+    for ext in AUDIO_CONTENT_TYPES:
+        blob_path = f"{meeting_dir}/meeting_audio_raw.{ext}"
+        if blob_service.get_blob_client(container=container_name, blob=blob_path).exists():
+            return blob_path
+    return None
+
+# blob의 필요한 바이트 범위만 읽는 파일 핸들 대용 (seek/tell/read마다 범위 다운로드)
+#   - read_wav_header/read_wav_range에 그대로 넘겨 원본 wav 전체를 받지 않고 일부 구간만 읽을 때 사용
+class BlobRangeReader:
+    def __init__(self, blob_client):
+        self.blob_client = blob_client
+        self.size = blob_client.get_blob_properties().size
+        self.pos = 0
+
+    def seek(self, pos, whence=0):
+        self.pos = [pos, self.pos + pos, self.size + pos][whence]
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def read(self, size):
+        size = min(size, self.size - self.pos)
+        if size <= 0:
+            return b""
+        data = self.blob_client.download_blob(offset=self.pos, length=size).readall()
+        add_bytes(read=len(data))
+        self.pos += len(data)
+        return data
+
+    def close(self):
+        pass
+
+# 회의 원본 오디오의 일부 구간만 읽을 때: wav면 범위 읽기 핸들(BlobRangeReader), 압축 원본이면 전체를 받아 디코딩한 wav spool
+def open_meeting_audio(blob_service, container_name, meeting_dir):
+    blob_path = find_meeting_audio_blob(blob_service, container_name, meeting_dir)
+    if blob_path is None:
+        raise FileNotFoundError(f"회의 오디오 파일 없음: {meeting_dir}")
+    if blob_path.endswith(".wav"):
+        return BlobRangeReader(blob_service.get_blob_client(container=container_name, blob=blob_path))
+    return download_meeting_audio(blob_service, container_name, meeting_dir)
+
+# 회의 원본 오디오를 받아 PCM wav spool로 반환 (트리거 스트림 없이 단계 함수를 단독 호출할 때 사용)
+def download_meeting_audio(blob_service, container_name, meeting_dir):
+    blob_path = find_meeting_audio_blob(blob_service, container_name, meeting_dir)
+    if blob_path is None:
+        raise FileNotFoundError(f"회의 오디오 파일 없음: {meeting_dir}")
+    spool = download_blob_to_spool(blob_service, container_name, blob_path)
+    return to_wav_spool(spool, blob_path.rsplit(".", 1)[-1])
+
+# blob을 직접 spool 임시파일로 다운로드 (트리거 스트림 없이 단계 함수를 단독 호출할 때 사용)
+def download_blob_to_spool(blob_service, container_name, blob_path, max_mem_mb=AUDIO_SPOOL_MAX_MB):
+    spool = tempfile.SpooledTemporaryFile(max_size=max_mem_mb * 1024 * 1024)
+    blob_client = blob_service.get_blob_client(container=container_name, blob=blob_path)
+    blob_client.download_blob(max_concurrency=4).readinto(spool)
+    add_bytes(read=spool.tell())
+    spool.seek(0)
+    return spool
@@ -0,0 +1,95 @@
+import os
+import threading
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from openai import AzureOpenAI
+from azure.core.pipeline.transport import RequestsTransport
+from azure.storage.blob import BlobServiceClient
+from azure.storage.queue import QueueClient, TextBase64EncodePolicy
+
+# 연결 풀/타임아웃 설정 (청크 동시 전사/병합 개수보다 풀 크기가 커야 연결 재사용이 됨)
+HTTP_POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", "16"))
+HTTP_CONNECT_TIMEOUT_SEC = float(os.environ.get("HTTP_CONNECT_TIMEOUT_SEC", "10"))
+HTTP_READ_TIMEOUT_SEC = float(os.environ.get("HTTP_READ_TIMEOUT_SEC", "600"))  # 긴 오디오 전사 응답 대기 고려
+HTTP_TIMEOUTS = (HTTP_CONNECT_TIMEOUT_SEC, HTTP_READ_TIMEOUT_SEC)  # requests 호출용 (connect, read)
+# Blob 엔드포인트 (기본: https://<BLOB_ACCOUNT_NAME>.blob.core.windows.net, 로컬 Azurite면 http://127.0.0.1:10000/devstoreaccount1)
+BLOB_ACCOUNT_URL = os.environ.get("BLOB_ACCOUNT_URL")
+# 단계 큐 연결 문자열이 들어있는 앱 설정 이름 (queueTrigger 바인딩의 connection과 같아야 함, Azurite면 UseDevelopmentStorage=true)
+QUEUE_CONNECTION_SETTING = os.environ.get("QUEUE_CONNECTION_SETTING", "AzureWebJobsStorage")
+
+# 모듈 단위 클라이언트 저장소: 같은 워커 프로세스의 호출/함수 실행(warm invocation) 사이에서 keep-alive 연결을 공유
+_clients = {}
+_clients_lock = threading.Lock()
+
+def _get_or_create(key, factory):
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = factory()
+        return _clients[key]
+
+# keep-alive 풀을 쓰는 requests 세션 (Speech REST API, 결과 파일 다운로드용)
+def _new_http_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_MAXSIZE, pool_maxsize=HTTP_POOL_MAXSIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.verify = False
+    return session
+
+def get_http_session():
+    return _get_or_create("http_session", _new_http_session)
+
+# Azure OpenAI 클라이언트 (api_version별 1개, httpx 연결 풀 공유)
+def get_openai_client(api_version):
+    def factory():
+        return AzureOpenAI(
+            api_version=api_version,
+            azure_endpoint=os.environ["OPENAI_ENDPOINT_URI"],
+            api_key=os.environ["OPENAI_ENDPOINT_KEY"],
+            http_client=httpx.Client(
+                verify=False,
+                limits=httpx.Limits(max_connections=HTTP_POOL_MAXSIZE, max_keepalive_connections=HTTP_POOL_MAXSIZE),
+                timeout=httpx.Timeout(HTTP_READ_TIMEOUT_SEC, connect=HTTP_CONNECT_TIMEOUT_SEC),
+            )
+        )
+    return _get_or_create(("openai", api_version), factory)
+
+# Blob 서비스 클라이언트 (계정 키 인증, 풀 크기를 지정한 requests 세션 사용)
+def get_blob_service():
+    def factory():
+        session = _new_http_session()
+        session.verify = True
+        return BlobServiceClient(
+            account_url=BLOB_ACCOUNT_URL or f"https://{os.environ['BLOB_ACCOUNT_NAME']}.blob.core.windows.net",
+            credential=os.environ["BLOB_ACCOUNT_KEY"],
+            # transport를 직접 넘기면 클라이언트의 connection_timeout/read_timeout은 무시되므로 transport에 지정
+            transport=RequestsTransport(session=session, session_owner=False,
+                                        connection_timeout=HTTP_CONNECT_TIMEOUT_SEC, read_timeout=HTTP_READ_TIMEOUT_SEC),
+        )
+    return _get_or_create("blob_service", factory)
+
+# Storage 큐 클라이언트 (큐 이름별 1개)
+#   - queueTrigger는 기본적으로 base64 메시지를 읽으므로 같은 인코딩으로 전송
+def get_queue_client(queue_name):
+    def factory():
+        return QueueClient.from_connection_string(
+            os.environ[QUEUE_CONNECTION_SETTING], queue_name,
+            message_encode_policy=TextBase64EncodePolicy(),
+        )
+    return _get_or_create(("queue", queue_name), factory)
+
+# 저장소에서 key의 객체를 가져오거나 factory()로 만들어 보관 (다른 모듈의 프로세스 공유 객체용, 예: stt_engines의 전사 엔진)
+def get_or_create_client(key, factory):
+    return _get_or_create(key, factory)
+
+# 저장소의 클라이언트를 직접 지정 (벤치마크/로컬 실행에서 가짜 서비스 주입용)
+#   - key: "blob_service", "http_session", ("openai", api_version), ("queue", queue_name), ("stt_engine", 엔진명)
+def set_client(key, client):
+    with _clients_lock:
+        _clients[key] = client
+
+# 저장소 비우기 (다음 호출에서 실제 클라이언트를 새로 생성)
+def clear_clients():
+    with _clients_lock:
+        _clients.clear()
@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource  # Linux/macOS 전용 (최대 RSS 조회)
+except ImportError:
+    resource = None
+
+try:
+    from opentelemetry import trace  # 선택 의존성: 설치되어 있고 OTEL_TRACING_ENABLED=true 일 때만 span 생성
+except ImportError:
+    trace = None
+
+PIPELINE_METRICS_ENABLED = os.environ.get("PIPELINE_METRICS_ENABLED", "true").lower() == "true"
+OTEL_TRACING_ENABLED = os.environ.get("OTEL_TRACING_ENABLED", "false").lower() == "true"
+METRICS_FILE_NAME = "metrics.json"  # 회의 폴더에 저장되는 단계별 측정값
+
+# 현재 실행 중인 단계 기록 (스레드/호출마다 독립, 풀 스레드로는 propagate()로 전달)
+_current_stage = contextvars.ContextVar("pipeline_stage", default=None)
+
+def _tracer():
+    if OTEL_TRACING_ENABLED and trace is not None:
+        return trace.get_tracer("aimeeting.pipeline")
+    return None
+
+# 프로세스 최대 RSS(MB) - 프로세스 시작 후 최고치라 단계 종료 시점까지의 누적 최대값
+def peak_rss_mb():
+    if resource is None:
+        return None
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)  # Linux: KB 단위
+
+# 지연시간 목록의 백분위수 (nearest-rank)
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))]
+
+# 단계 하나의 측정값: 실행시간, 읽은/쓴 바이트, API 호출별 지연/재시도/토큰, 최대 RSS
+class StageRecord:
+    def __init__(self, name, span=None):
+        self.name = name
+        self.span = span
+        self.started_at = datetime.utcnow().isoformat()
+        self.wall_sec = None
+        self.cached = False
+        self.error = None
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.apis = {}
+        self.peak_rss_mb = None
+        self._lock = threading.Lock()
+
+    def add_bytes(self, read=0, written=0):
+        with self._lock:
+            self.bytes_read += read
+            self.bytes_written += written
+
+    def add_api(self, name, latency_sec, retries=0, prompt_tokens=None, completion_tokens=None,
+                request_bytes=0, error=None):
+        with self._lock:
+            api = self.apis.setdefault(name, {
+                "latencies": [], "retries": 0, "errors": 0,
+                "prompt_tokens": 0, "completion_tokens": 0, "request_bytes": 0,
+            })
+            api["latencies"].append(latency_sec)
+            api["retries"] += retries or 0
+            api["errors"] += 1 if error else 0
+            api["prompt_tokens"] += prompt_tokens or 0
+            api["completion_tokens"] += completion_tokens or 0
+            api["request_bytes"] += request_bytes or 0
+        if self.span is not None:
+            self.span.add_event(f"api.{name}", {"latency_sec": latency_sec, "retries": retries or 0, "error": str(error or "")})
+
+    def to_dict(self):
+        apis = {}
+        for name, api in self.apis.items():
+            lat = api["latencies"]
+            apis[name] = {
+                "calls": len(lat),
+                "errors": api["errors"],
+                "retries": api["retries"],
+                "latency_sec": {
+                    "total": round(sum(lat), 3),
+                    "p50": round(percentile(lat, 50), 3),
+                    "p95": round(percentile(lat, 95), 3),
+                    "max": round(max(lat), 3),
+                },
+                "prompt_tokens": api["prompt_tokens"],
+                "completion_tokens": api["completion_tokens"],
+                "request_bytes": api["request_bytes"],
+            }
+        return {
+            "stage": self.name,
+            "started_at": self.started_at,
+            "wall_sec": self.wall_sec,
+            "cached": self.cached,
+            "error": self.error,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+            "peak_rss_mb": self.peak_rss_mb,
+            "apis": apis,
+        }
+
+# 함수 실행(invocation) 1회의 단계별 측정값 모음 -> {meeting_dir}/metrics.json
+class PipelineMetrics:
+    def __init__(self, meeting_dir, invocation="BlobTrigger"):
+        self.meeting_dir = meeting_dir
+        self.invocation = invocation
+        self.started_at = datetime.utcnow().isoformat()
+        self.t0 = time.perf_counter()
+        self.stages = []
+        self._lock = threading.Lock()
+
+    # 단계 실행 구간 측정: with metrics.stage("merge") as rec: ...
+    @contextmanager
+    def stage(self, name):
+        tracer = _tracer()
+        span_cm = tracer.start_as_current_span(f"pipeline.{name}") if tracer else None
+        span = span_cm.__enter__() if span_cm else None
+        rec = StageRecord(name, span)
+        with self._lock:
+            self.stages.append(rec)
+        token = _current_stage.set(rec)
+        t0 = time.perf_counter()
+        try:
+            yield rec
+        except Exception as e:
+            rec.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            rec.wall_sec = round(time.perf_counter() - t0, 3)
+            rec.peak_rss_mb = peak_rss_mb()
+            _current_stage.reset(token)
+            logging.info(
+                f"[Metrics] {name}: {rec.wall_sec}s, read={rec.bytes_read}B, written={rec.bytes_written}B, "
+                f"apis={ {k: len(v['latencies']) for k, v in rec.apis.items()} }, peak_rss={rec.peak_rss_mb}MB"
+                + (" (cached)" if rec.cached else "")
+            )
+            if span is not None:
+                span.set_attributes({
+                    "meeting_dir": self.meeting_dir, "wall_sec": rec.wall_sec, "cached": rec.cached,
+                    "bytes_read": rec.bytes_read, "bytes_written": rec.bytes_written,
+                    "peak_rss_mb": rec.peak_rss_mb or 0, "error": rec.error or "",
+                })
+                span_cm.__exit__(None, None, None)
+
+    def to_dict(self):
+        with self._lock:
+            stages = [rec.to_dict() for rec in self.stages]
+        return {
+            "meeting_dir": self.meeting_dir,
+            "invocation": self.invocation,
+            "started_at": self.started_at,
+            "wall_sec": round(time.perf_counter() - self.t0, 3),
+            "peak_rss_mb": peak_rss_mb(),
+            "stages": stages,
+        }
+
+    # 측정값 저장 (실패해도 파이프라인 결과에는 영향 없도록 경고만)
+    def save(self, blob_service, container_name, file_name=METRICS_FILE_NAME):
+        if not PIPELINE_METRICS_ENABLED:
+            return
+        try:
+            data = json.dumps(self.to_dict(), ensure_ascii=False, indent=2).encode("utf-8")
+            blob_service.get_blob_client(container=container_name, blob=f"{self.meeting_dir}/{file_name}").upload_blob(data, overwrite=True)
+        except Exception as e:
+            logging.warning(f"[WARN] metrics 저장 실패: {e}")
+
+# 현재 단계 기록 (단계 밖에서 호출되면 None)
+def current_stage():
+    return _current_stage.get()
+
+# 현재 단계에 읽은/쓴 바이트 누적
+def add_bytes(read=0, written=0):
+    rec = _current_stage.get()
+    if rec is not None:
+        rec.add_bytes(read, written)
+
+# 외부 API 호출 1회 측정: with api_call("chat") as call: ...; call["retries"] = n
+#   - call dict에 retries/prompt_tokens/completion_tokens/request_bytes를 채우면 함께 기록
+@contextmanager
+def api_call(name, **fields):
+    call = dict(fields)
+    t0 = time.perf_counter()
+    error = None
+    try:
+        yield call
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        rec = _current_stage.get()
+        if rec is not None:
+            rec.add_api(name, round(time.perf_counter() - t0, 3), error=error, **call)
+
+# 스레드 풀에 넘기는 함수가 호출한 쪽 단계에 기록되도록 현재 단계를 함께 전달
+def propagate(fn):
+    rec = _current_stage.get()
+    if rec is None:
+        return fn
+
+    def wrapped(*args, **kwargs):
+        token = _current_stage.set(rec)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current_stage.reset(token)
+    return wrapped
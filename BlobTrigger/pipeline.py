@@ -0,0 +1,289 @@
+import os
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from .stt_utils import (
+    stt_gpt4otranscribe, submit_batch, wait_batch, collect_batch, batch_job_status, delete_batch_job, merge_step, summarize,
+    draft_from_realtime, transcribe_model_id, BATCH_DEADLINE_SEC, LLM_MODEL, GPT4O_TRANSCRIBE_CONTEXT, SUMMARY_MAP_THRESHOLD_TOKENS, SUMMARY_SECTION_TOKENS,
+    REALTIME_JOURNAL_FILE, MERGE_REQUEST_TOKENS, MERGE_TXT2_MARGIN, MERGE_MODE, ALIGN_MIN_RATIO, BATCH_WORD_TIMESTAMPS,
+    TRANSCRIBE_SCOPE, RETRANSCRIBE_MAX_CONFIDENCE, RETRANSCRIBE_GROUP_SEC
+)
+from .audio_processing import (
+    CHUNK_SIZE_BYTES, SILENCE_SPLIT_ENABLED, SILENCE_TRIM_SEC, TRANSCRIBE_AUDIO_FORMAT, TRANSCRIBE_MAX_CHUNK_SEC
+)
+from .blob_utils import get_prompt_from_blob, upload_blob, download_blob_bytes, create_blob_once
+from .clients import get_blob_service
+from .metrics import PipelineMetrics
+from .queues import enqueue, enqueue_merge_if_ready, fail_batch_run, QUEUE_BATCH_POLL, CLAIMS_DIR
+from .stage_cache import (
+    file_sha256, text_sha256, stage_key, load_manifest, stage_recorded, is_stage_done, mark_stage_done
+)
+
+# 배치 전사 완료 처리 방식
+#   - poll   : BlobTrigger 안에서 상태를 조회하며 완료까지 대기 후 병합/요약까지 진행
+#   - webhook: BlobTrigger는 작업 등록 + gpt4otranscribe까지만 하고 종료, 완료 웹훅(BatchCallback)이 나머지를 진행
+#              (웹훅 유실 대비로 BATCH_DEADLINE_SEC 뒤에 batch-poll 큐로 대기시간 확인 메시지를 보냄)
+BATCH_COMPLETION_MODE = os.environ.get("BATCH_COMPLETION_MODE", "poll")
+BATCH_JOBS_DIR = "batch_jobs"  # 웹훅 모드: 컨테이너 루트의 batch_jobs/<작업ID>.json 에 회의 정보 기록
+METRICS_BATCH_COMPLETE_FILE = "metrics_batch_complete.json"  # 웹훅 모드: 배치 완료 처리 실행의 단계별 측정값
+# 클라이언트 실시간 전사 journal(script_realtime.jsonl)이 있으면
+#   - draft: 업로드 직후 journal만으로 초안 요약(summary_draft.txt) 생성
+#   - 배치가 gpt4otranscribe 완료 후 REALTIME_BASELINE_WAIT_SEC초 안에 안 끝나면(또는 실패하면) journal을 병합 기준으로
+#     먼저 script_final.txt/summary.txt 생성, 배치가 끝나면 배치 기준으로 다시 병합해 덮어씀 (poll 모드 / queue 모드)
+REALTIME_TRANSCRIPT_ENABLED = os.environ.get("REALTIME_TRANSCRIPT_ENABLED", "true").lower() == "true"
+REALTIME_BASELINE_WAIT_SEC = float(os.environ.get("REALTIME_BASELINE_WAIT_SEC", "600"))
+# 병합 기준(baseline)별 병합/요약 단계명
+FINISH_STAGES = {"batch": ("merge", "summarize"), "realtime": ("merge_realtime", "summarize_realtime")}
+
+# 회의 메타데이터(meeting_metadata.json) 읽기
+def load_meeting_meta(meeting_dir, blob_service, container_name):
+    meta_blob_client = blob_service.get_blob_client(container=container_name, blob=f"{meeting_dir}/meeting_metadata.json")
+    return json.loads(meta_blob_client.download_blob().readall())
+
+# 실시간 전사 journal 내용 해시 (없거나 REALTIME_TRANSCRIPT_ENABLED=false면 None)
+def realtime_journal_hash(meeting_dir, blob_service, container_name):
+    journal_blob = f"{meeting_dir}/{REALTIME_JOURNAL_FILE}"
+    if not REALTIME_TRANSCRIPT_ENABLED or not blob_service.get_blob_client(container=container_name, blob=journal_blob).exists():
+        return None
+    return text_sha256(download_blob_bytes(blob_service, container_name, journal_blob).decode("utf-8"))
+
+# 단계별 캐시 키: 오디오 내용 해시 + (LLM 단계는) 프롬프트 해시/모델명
+#   - realtime_hash: 실시간 전사 journal 해시, 있으면 draft / merge_realtime / summarize_realtime 키도 생성
+def pipeline_keys(audio_hash, num_participants, blob_service, container_name, realtime_hash=None):
+    gpt_key = stage_key(audio_hash, transcribe_model_id(), GPT4O_TRANSCRIBE_CONTEXT, CHUNK_SIZE_BYTES,
+                        SILENCE_SPLIT_ENABLED, SILENCE_TRIM_SEC, TRANSCRIBE_AUDIO_FORMAT, TRANSCRIBE_MAX_CHUNK_SEC)
+    batch_key = stage_key(audio_hash, "batch", num_participants, *(["display_words"] if BATCH_WORD_TIMESTAMPS else []))
+    merge_prompt = get_prompt_from_blob(blob_service, container_name, "prompt_merge.txt")
+    merge_opts = (text_sha256(merge_prompt), LLM_MODEL, MERGE_REQUEST_TOKENS, MERGE_TXT2_MARGIN, MERGE_MODE, ALIGN_MIN_RATIO)
+    if TRANSCRIBE_SCOPE == "selective":
+        # 선택 재전사: gpt4otranscribe 단계 없이 배치(또는 실시간) 전사 + 재전사 설정으로 script_final.txt 결정
+        merge_opts = ("selective", transcribe_model_id(), TRANSCRIBE_AUDIO_FORMAT, RETRANSCRIBE_MAX_CONFIDENCE, RETRANSCRIBE_GROUP_SEC)
+        gpt_key = audio_hash
+    merge_key = stage_key(gpt_key, batch_key, *merge_opts)
+    summary_prompt = get_prompt_from_blob(blob_service, container_name, "prompt_summarize.txt")
+    summary_opts = (text_sha256(summary_prompt), LLM_MODEL, SUMMARY_MAP_THRESHOLD_TOKENS, SUMMARY_SECTION_TOKENS)
+    summary_key = stage_key(merge_key, *summary_opts)
+    keys = {"gpt4otranscribe": gpt_key, "batch": batch_key, "merge": merge_key, "summarize": summary_key}
+    if realtime_hash:
+        keys["draft"] = stage_key(realtime_hash, *summary_opts)
+        keys["merge_realtime"] = stage_key(gpt_key, realtime_hash, *merge_opts)
+        keys["summarize_realtime"] = stage_key(keys["merge_realtime"], *summary_opts)
+    return keys
+
+# 캐시 대상이 아닌 구간(다운로드, 배치 등록/대기 등)도 metrics에 단계로 기록하며 실행
+def timed(ctx, stage, fn, *args, **kwargs):
+    with ctx["metrics"].stage(stage):
+        return fn(*args, **kwargs)
+
+# 캐시를 확인해 단계 실행, 성공하면 완료 기록 (실행시간/API 호출 등은 ctx["metrics"]에 기록)
+#   - requires: 앞 단계가 모두 완료 기록된 경우에만 이 단계의 결과를 캐시에 기록 (부분 결과로 만든 산출물은 재사용 X)
+def run_stage(ctx, stage, fn, *args, requires=(), **kwargs):
+    manifest, keys = ctx["manifest"], ctx["keys"]
+    with ctx["metrics"].stage(stage) as rec:
+        if is_stage_done(manifest, stage, keys[stage], ctx["blob_service"], ctx["container_name"]):
+            logging.info(f"[Pipeline] 캐시 사용, 단계 생략: {stage}")
+            rec.cached = True
+            return
+        outputs = fn(*args, **kwargs)
+        if outputs and all(stage_recorded(manifest, name, keys[name]) for name in requires):
+            mark_stage_done(manifest, stage, keys[stage], outputs, ctx["blob_service"], ctx["container_name"], ctx["meeting_dir"])
+
+# [1] gpt4otranscribe + [2] batch 결과로 병합 -> 요약
+#   - baseline="realtime": [2] 대신 실시간 전사 journal을 기준으로 병합 (배치가 늦거나 실패했을 때)
+#   - TRANSCRIBE_SCOPE=selective: [1] 없이 [2]의 저신뢰 구간만 재전사해 script_final.txt 생성
+def finish_pipeline(ctx, audio_file=None, baseline="batch"):
+    meeting_dir, blob_service, container_name = ctx["meeting_dir"], ctx["blob_service"], ctx["container_name"]
+    merge_stage, summary_stage = FINISH_STAGES[baseline]
+    merge_fn, requires = merge_step(baseline)
+    # [1] + [2] -> script_final.txt [3]
+    run_stage(ctx, merge_stage, merge_fn, meeting_dir, blob_service, container_name, audio_file=audio_file, baseline=baseline,
+              requires=requires)
+    # [3] 요약 -> summary.txt
+    run_stage(ctx, summary_stage, summarize, meeting_dir, blob_service, container_name, requires=[merge_stage])
+    logging.info(f"[Pipeline] 후처리 실행 완료({baseline} 기준): {meeting_dir}")
+
+# 웹훅 모드 마무리: BlobTrigger(gpt4otranscribe 완료 쪽)와 BatchCallback(배치 완료 쪽)이 서로의 완료 기록을 동시에 봐도
+# 선점 blob(queue_claims/<요약 캐시 키>.finish)을 먼저 만든 쪽만 병합/요약 (실패하면 선점 표시를 지워 재시도가 다시 진행)
+#   - 트리거 재시도로 배치 작업이 둘 이상 등록돼도 결과 키가 같으면 한 번만 마무리
+#   - baseline="realtime": 배치 실패/대기시간 초과시 실시간 전사 journal 기준으로 마무리 (선점 표시도 해당 요약 키로 따로)
+def finish_webhook_job(ctx, tid, audio_file=None, baseline="batch"):
+    meeting_dir, blob_service, container_name = ctx["meeting_dir"], ctx["blob_service"], ctx["container_name"]
+    claim_blob = f"{meeting_dir}/{CLAIMS_DIR}/{ctx['keys'][FINISH_STAGES[baseline][1]]}.finish"
+    if not create_blob_once(tid, claim_blob, blob_service, container_name):
+        logging.info(f"[Pipeline] 다른 실행에서 병합/요약 진행: {meeting_dir} ({tid})")
+        return
+    try:
+        finish_pipeline(ctx, audio_file, baseline=baseline)
+    except Exception:
+        blob_service.get_blob_client(container=container_name, blob=claim_blob).delete_blob()
+        raise
+
+# BlobTrigger 진입점에서 호출: 전사 2종 -> 병합 -> 요약
+#   - audio_file: 원본 오디오를 PCM wav로 받아둔 파일 핸들, audio_blob_path: 원본 오디오 blob 경로 (배치 전사 입력, wav/flac/ogg)
+#   - metrics: 단계별 측정값 기록용 PipelineMetrics (없으면 새로 만들고 저장은 호출한 쪽 몫)
+def run_pipeline(meeting_dir, audio_file, blob_service, container_name, metrics=None, audio_blob_path=None):
+    metrics = metrics or PipelineMetrics(meeting_dir)
+    with metrics.stage("prepare"):
+        meta_json = load_meeting_meta(meeting_dir, blob_service, container_name)
+        num_participants = int(meta_json.get('num_participants', 5))
+        audio_sec = meta_json.get('wav_metadata', {}).get('duration_sec')
+        wav_blob_path = audio_blob_path or f"{meeting_dir}/meeting_audio_raw.wav"
+
+        # 키가 같고 산출물이 남아있는 단계는 재실행 생략
+        realtime_hash = realtime_journal_hash(meeting_dir, blob_service, container_name)
+        keys = pipeline_keys(file_sha256(audio_file), num_participants, blob_service, container_name, realtime_hash)
+        ctx = {
+            "meeting_dir": meeting_dir, "blob_service": blob_service, "container_name": container_name,
+            "manifest": load_manifest(blob_service, container_name, meeting_dir), "keys": keys, "metrics": metrics,
+        }
+
+    # batch transcription 작업을 먼저 등록해두고, 서비스가 처리하는 동안 gpt4otranscribe 전사를 함께 진행
+    tid = None
+    if not is_stage_done(ctx["manifest"], "batch", keys["batch"], blob_service, container_name):
+        tid = timed(ctx, "batch_submit", submit_batch, wav_blob_path=wav_blob_path, max_num_speakers=num_participants)
+
+    gpt_args = dict(meeting_dir=meeting_dir, blob_service=blob_service, container_name=container_name, audio_file=audio_file)
+    draft_args = ("draft", draft_from_realtime, meeting_dir, blob_service, container_name)
+    full_transcribe = TRANSCRIBE_SCOPE != "selective"  # selective면 배치 완료 후 병합 단계에서 저신뢰 구간만 전사
+    if tid and BATCH_COMPLETION_MODE == "webhook":
+        save_batch_job(tid, meeting_dir, wav_blob_path, keys, blob_service, container_name)
+        enqueue_batch_deadline(tid, meeting_dir)
+        if "draft" in keys:
+            run_stage(ctx, *draft_args)
+        if full_transcribe:
+            run_stage(ctx, "gpt4otranscribe", stt_gpt4otranscribe, **gpt_args)
+        ctx["manifest"] = load_manifest(blob_service, container_name, meeting_dir)
+        if full_transcribe and not stage_recorded(ctx["manifest"], "gpt4otranscribe", keys["gpt4otranscribe"]):
+            # 전사 결과가 없으면 BatchCallback도 병합하지 않으므로 실패로 끝내 blob 트리거 재시도 (__init__에서 다시 raise)
+            logging.error(f"[Pipeline] gpt4otranscribe 실패, 병합 불가: {meeting_dir} ({tid})")
+            raise RuntimeError(f"gpt4otranscribe 실패: {meeting_dir}")
+        # 배치가 먼저 끝나 웹훅이 이미 처리됐으면 여기서 마무리, 아니면 BatchCallback이 마무리
+        #   - 배치가 먼저 실패 처리됐으면(작업 기록의 status) 실시간 전사 기준으로 마무리
+        failed_status = (load_batch_job(tid, blob_service, container_name) or {}).get("status")
+        if stage_recorded(ctx["manifest"], "batch", keys["batch"]):
+            finish_webhook_job(ctx, tid, audio_file)
+        elif failed_status and "merge_realtime" in keys:
+            finish_webhook_job(ctx, tid, audio_file, baseline="realtime")
+        elif failed_status:
+            logging.error(f"[Pipeline] 배치 작업 실패({failed_status}), 실시간 전사 journal도 없어 병합 불가: {meeting_dir} ({tid})")
+        else:
+            logging.info(f"[Pipeline] 배치 완료 웹훅 대기: {tid}")
+        return
+
+    #   - batch 완료대기 -> script_batch_extracted.txt [2]
+    #   - gpt4otranscribe 전사 -> script_gpt4otranscribe.txt [1]
+    #   - (journal 있으면) 초안 요약 -> summary_draft.txt
+    #   - 초안 요약은 병합/요약과 겹쳐 진행되고, 함수는 둘 다 끝나야 종료 (with 블록)
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        draft_future = pool.submit(run_stage, ctx, *draft_args) if "draft" in keys else None
+        batch_future = pool.submit(timed, ctx, "batch_wait", wait_batch, tid, wav_blob_path, audio_sec) if tid else None
+        if full_transcribe:
+            pool.submit(run_stage, ctx, "gpt4otranscribe", stt_gpt4otranscribe, **gpt_args).result()
+        # 배치가 늦으면 실시간 전사 기준으로 먼저 병합/요약 (배치가 끝나면 아래에서 배치 기준으로 다시 병합)
+        realtime_finished = False
+        if batch_future and "merge_realtime" in keys and not wait([batch_future], timeout=REALTIME_BASELINE_WAIT_SEC).done:
+            logging.info(f"[Pipeline] 배치 전사 지연({REALTIME_BASELINE_WAIT_SEC:.0f}s 초과), 실시간 전사 기준으로 먼저 병합")
+            finish_pipeline(ctx, audio_file, baseline="realtime")
+            realtime_finished = True
+        batch_outputs = batch_future.result() if batch_future else None
+        if batch_outputs:
+            mark_stage_done(ctx["manifest"], "batch", keys["batch"], batch_outputs, blob_service, container_name, meeting_dir)
+        if batch_outputs or not tid or "merge_realtime" not in keys:
+            finish_pipeline(ctx, audio_file)
+        elif not realtime_finished:
+            # 배치 실패/대기시간 초과: 실시간 전사 기준 결과로 마무리
+            finish_pipeline(ctx, audio_file, baseline="realtime")
+        if draft_future:
+            draft_future.result()
+
+# 웹훅 모드: 배치 작업ID로 회의를 찾을 수 있게 기록 (run_id: PIPELINE_MODE=queue 실행ID, 있으면 완료시 병합 큐로 넘김)
+def save_batch_job(tid, meeting_dir, wav_blob_path, keys, blob_service, container_name, run_id=None):
+    job = {"tid": tid, "meeting_dir": meeting_dir, "wav_blob_path": wav_blob_path, "keys": keys, "run_id": run_id}
+    upload_blob(json.dumps(job, ensure_ascii=False, indent=2), f"{BATCH_JOBS_DIR}/{tid}.json",
+                blob_service, container_name, verbose=False)
+
+# 웹훅 모드: 배치 작업 기록 읽기 (없으면 None)
+def load_batch_job(tid, blob_service, container_name):
+    job_blob = blob_service.get_blob_client(container=container_name, blob=f"{BATCH_JOBS_DIR}/{tid}.json")
+    if not job_blob.exists():
+        return None
+    return json.loads(job_blob.download_blob().readall())
+
+# 웹훅 모드: 완료 웹훅이 유실돼도 회의가 멈춰 있지 않도록 BATCH_DEADLINE_SEC 뒤에 대기시간 확인 메시지 전송
+#   - batch-poll 큐 재사용 (BatchPoll이 webhook_deadline 메시지면 complete_batch_job(tid, deadline=True) 호출)
+def enqueue_batch_deadline(tid, meeting_dir, run_id=None):
+    enqueue(QUEUE_BATCH_POLL, {"meeting_dir": meeting_dir, "run_id": run_id, "tid": tid, "webhook_deadline": True},
+            delay_sec=BATCH_DEADLINE_SEC)
+
+# 웹훅 모드 배치 실패/취소/대기시간 초과 처리 (poll 모드처럼 실시간 전사 journal이 있으면 journal 기준으로 마무리)
+#   - 작업 기록(batch_jobs/<작업ID>.json)에 status를 먼저 남김: gpt4otranscribe가 아직이면 BlobTrigger가 이 기록을 보고 마무리
+#   - queue 모드로 등록된 작업이면 실패 표시 후 journal 기준 병합 메시지만 전송 (fail_batch_run)
+def fail_batch_job(ctx, job, status):
+    meeting_dir, blob_service, container_name, keys = ctx["meeting_dir"], ctx["blob_service"], ctx["container_name"], ctx["keys"]
+    tid = job["tid"]
+    logging.error(f"[Pipeline] 배치 작업 실패({status}): {tid} ({meeting_dir})")
+    upload_blob(json.dumps(dict(job, status=status), ensure_ascii=False, indent=2), f"{BATCH_JOBS_DIR}/{tid}.json",
+                blob_service, container_name, verbose=False)
+    if job.get("run_id"):
+        fail_batch_run(meeting_dir, job["run_id"], keys, blob_service, container_name)
+        return
+    if "merge_realtime" not in keys:
+        logging.error(f"[Pipeline] 실시간 전사 journal 없음, 병합 불가: {meeting_dir}")
+        return
+    ctx["manifest"] = load_manifest(blob_service, container_name, meeting_dir)
+    if all(stage_recorded(ctx["manifest"], stage, keys[stage]) for stage in merge_step("realtime")[1]):
+        finish_webhook_job(ctx, tid, baseline="realtime")
+
+# 배치 완료 웹훅(BatchCallback)에서 호출: 결과 저장 후 gpt4otranscribe도 끝났으면 병합/요약 진행
+#   - queue 모드로 등록된 작업이면 병합/요약은 직접 하지 않고 병합 큐로 넘김
+#   - 배치가 실패/취소됐으면 fail_batch_job (실시간 전사 기준 마무리 또는 실패 기록)
+#   - deadline=True: 대기시간 확인 메시지(enqueue_batch_deadline)로 호출, 이미 처리됐으면 생략하고 아직 진행 중이면 작업 삭제 후 실패 처리
+#   - 이 실행의 측정값은 BlobTrigger의 metrics.json과 겹치지 않게 METRICS_BATCH_COMPLETE_FILE로 저장
+def complete_batch_job(tid, deadline=False):
+    container_name = os.environ.get("BLOB_CONTAINER_NAME", "meeting")
+    blob_service = get_blob_service()
+    job = load_batch_job(tid, blob_service, container_name)
+    if job is None:
+        logging.warning(f"[Pipeline] 등록되지 않은 배치 작업: {tid}")
+        return
+    meeting_dir, keys = job["meeting_dir"], job["keys"]
+    if deadline and (job.get("status") or stage_recorded(load_manifest(blob_service, container_name, meeting_dir), "batch", keys["batch"])):
+        return
+
+    ctx = {
+        "meeting_dir": meeting_dir, "blob_service": blob_service, "container_name": container_name,
+        "manifest": None, "keys": keys, "metrics": PipelineMetrics(meeting_dir, invocation="BatchComplete"),
+    }
+    try:
+        with ctx["metrics"].stage("batch_collect"):
+            status = batch_job_status(tid).get("status")
+            if status not in {"Succeeded", "Failed"}:
+                if not deadline:
+                    logging.warning(f"[Pipeline] 배치 작업 미완료({status}), 완료 처리 생략: {tid}")
+                    return
+                logging.error(f"[Pipeline] 배치 완료 웹훅 대기시간 초과({BATCH_DEADLINE_SEC:.0f}s), 작업 삭제: {tid}")
+                delete_batch_job(tid)
+                status = "Timeout"
+            elif deadline:
+                logging.warning(f"[Pipeline] 배치 완료 웹훅 미수신, 대기시간 확인에서 완료 처리({status}): {tid}")
+            outputs = collect_batch(tid, job["wav_blob_path"]) if status == "Succeeded" else None
+            if outputs:
+                ctx["manifest"] = load_manifest(blob_service, container_name, meeting_dir)
+                mark_stage_done(ctx["manifest"], "batch", keys["batch"], outputs, blob_service, container_name, meeting_dir)
+        if status != "Succeeded":
+            fail_batch_job(ctx, job, status)
+            return
+        if not outputs:
+            return
+        if job.get("run_id"):
+            enqueue_merge_if_ready(meeting_dir, job["run_id"], keys, blob_service, container_name)
+            return
+        ctx["manifest"] = load_manifest(blob_service, container_name, meeting_dir)
+        if all(stage_recorded(ctx["manifest"], stage, keys[stage]) for stage in merge_step()[1]):
+            finish_webhook_job(ctx, tid)
+        else:
+            # gpt4otranscribe가 끝나면 BlobTrigger가 마무리, 실패하면 BlobTrigger가 오류로 끝나 재시도됨
+            logging.info(f"[Pipeline] gpt4otranscribe 진행 중, 병합은 BlobTrigger에서 진행: {meeting_dir}")
+    finally:
+        ctx["metrics"].save(blob_service, container_name, METRICS_BATCH_COMPLETE_FILE)
@@ -0,0 +1,237 @@
+import os
+import json
+import time
+import uuid
+import logging
+from itertools import islice
+from datetime import datetime
+
+from .pipeline import (
+    load_meeting_meta, pipeline_keys, realtime_journal_hash, run_stage, timed, save_batch_job, enqueue_batch_deadline,
+    complete_batch_job, BATCH_COMPLETION_MODE, REALTIME_BASELINE_WAIT_SEC, FINISH_STAGES
+)
+from .stt_utils import (
+    stage_transcribe_chunks, transcribe_chunk_blob, submit_batch, batch_job_status, batch_poll_delays,
+    delete_batch_job, collect_batch, merge_step, summarize, draft_from_realtime, BATCH_DEADLINE_SEC, TRANSCRIBE_SCOPE
+)
+from .blob_utils import upload_blob, download_blob_bytes
+from .clients import get_blob_service
+from .metrics import PipelineMetrics
+from .queues import (
+    enqueue, enqueue_merge_if_ready, fail_batch_run, batch_failed, QUEUE_TRANSCRIBE_CHUNK, QUEUE_BATCH_POLL, QUEUE_SUMMARIZE, QUEUE_JOB_FILE
+)
+from .stage_cache import (
+    file_sha256, stage_key, load_manifest, stage_recorded, is_stage_done, mark_stage_done
+)
+
+# 청크 단위 완료 기록 이름/키 (stage_cache/gpt4otranscribe_chunk_NNN.json)
+def chunk_stage(index):
+    return f"gpt4otranscribe_chunk_{index+1:03}"
+
+def chunk_stage_key(keys, index):
+    return stage_key(keys["gpt4otranscribe"], index)
+
+# n번째 배치 상태조회까지 기다릴 시간(초) (inline 폴링과 같은 간격)
+def batch_poll_delay(audio_sec, attempt):
+    return next(islice(batch_poll_delays(audio_sec), attempt, None))
+
+# 단계 실행 결과가 완료 기록되지 않았으면 예외 -> 큐 메시지 재시도 (maxDequeueCount 초과시 <큐>-poison)
+def require_stage(ctx, stage):
+    if not stage_recorded(ctx["manifest"], stage, ctx["keys"][stage]):
+        raise RuntimeError(f"{stage} 단계 실패: {ctx['meeting_dir']}")
+
+# BlobTrigger(queue 모드)에서 호출: 배치 등록 + 청크 준비 후 단계 큐에 메시지 전송하고 바로 종료
+#   - 같은 회의에 새 오디오가 올라오면 run_id가 바뀌어, 이전 실행의 남은 메시지는 무시됨
+def start_queue_pipeline(meeting_dir, audio_file, blob_service, container_name, metrics, audio_blob_path):
+    with metrics.stage("prepare"):
+        meta_json = load_meeting_meta(meeting_dir, blob_service, container_name)
+        num_participants = int(meta_json.get('num_participants', 5))
+        audio_sec = meta_json.get('wav_metadata', {}).get('duration_sec')
+        realtime_hash = realtime_journal_hash(meeting_dir, blob_service, container_name)
+        keys = pipeline_keys(file_sha256(audio_file), num_participants, blob_service, container_name, realtime_hash)
+        manifest = load_manifest(blob_service, container_name, meeting_dir)
+        ctx = {
+            "meeting_dir": meeting_dir, "blob_service": blob_service, "container_name": container_name,
+            "manifest": manifest, "keys": keys, "metrics": metrics,
+        }
+    run_id = uuid.uuid4().hex[:12]
+
+    # [2] 배치 작업은 먼저 등록 (서비스가 처리하는 동안 청크 전사 진행)
+    tid = None
+    if not is_stage_done(manifest, "batch", keys["batch"], blob_service, container_name):
+        tid = timed(ctx, "batch_submit", submit_batch, wav_blob_path=audio_blob_path, max_num_speakers=num_participants)
+        if tid is None:
+            # 배치 없이는 병합 메시지가 나가지 않으므로 청크 메시지를 보내기 전에 실패로 끝내 blob 트리거 재시도
+            logging.error(f"[Queue] 배치 작업 등록 실패, 병합 진행 불가: {meeting_dir}")
+            raise RuntimeError(f"배치 작업 등록 실패: {meeting_dir}")
+
+    # [1] 청크 오디오 준비 (완료 기록된 청크는 다시 보내지 않음, selective면 병합 단계에서 저신뢰 구간만 전사)
+    chunks, plan_blob = [], None
+    if TRANSCRIBE_SCOPE != "selective" and not is_stage_done(manifest, "gpt4otranscribe", keys["gpt4otranscribe"],
+                                                             blob_service, container_name):
+        with metrics.stage("ingest"):
+            chunks, plan_blob = stage_transcribe_chunks(meeting_dir, blob_service, container_name, audio_file)
+
+    job = {
+        "run_id": run_id, "meeting_dir": meeting_dir, "audio_blob_path": audio_blob_path, "audio_sec": audio_sec,
+        "keys": keys, "chunks": chunks, "plan_blob": plan_blob, "created_at": datetime.utcnow().isoformat(),
+    }
+    upload_blob(json.dumps(job, ensure_ascii=False, indent=2), f"{meeting_dir}/{QUEUE_JOB_FILE}",
+                blob_service, container_name, verbose=False)
+
+    pending = [
+        i for i in range(len(chunks))
+        if not is_stage_done(manifest, chunk_stage(i), chunk_stage_key(keys, i), blob_service, container_name)
+    ]
+    if "draft" in keys and not is_stage_done(manifest, "draft", keys["draft"], blob_service, container_name):
+        enqueue(QUEUE_SUMMARIZE, {"meeting_dir": meeting_dir, "run_id": run_id, "variant": "draft"})
+    for i in pending:
+        enqueue(QUEUE_TRANSCRIBE_CHUNK, {"meeting_dir": meeting_dir, "run_id": run_id, "index": i})
+    if tid and BATCH_COMPLETION_MODE == "webhook":
+        save_batch_job(tid, meeting_dir, audio_blob_path, keys, blob_service, container_name, run_id=run_id)
+        enqueue_batch_deadline(tid, meeting_dir, run_id)
+    elif tid:
+        enqueue(QUEUE_BATCH_POLL, {"meeting_dir": meeting_dir, "run_id": run_id, "tid": tid, "attempt": 0,
+                                   "submitted_at": time.time()}, delay_sec=batch_poll_delay(audio_sec, 0))
+    logging.info(f"[Queue] ingest 완료: {meeting_dir} (run_id={run_id}, 청크 {len(pending)}/{len(chunks)}개 전사 요청, 배치={tid or '완료됨'})")
+
+    # 청크 전사 완료 전에 모든 청크가 이미 완료 기록된 경우(재업로드 등) 여기서 병합 시작
+    if chunks and not pending:
+        finish_transcribe_chunks(ctx, job)
+    enqueue_merge_if_ready(meeting_dir, run_id, keys, blob_service, container_name)
+
+# 단계 큐 메시지로 실행 정보(ctx, pipeline_job.json) 구성 (다른 실행으로 대체된 메시지면 (None, None))
+def load_job_ctx(message, invocation):
+    container_name = os.environ.get("BLOB_CONTAINER_NAME", "meeting")
+    blob_service = get_blob_service()
+    meeting_dir = message["meeting_dir"]
+    job = json.loads(download_blob_bytes(blob_service, container_name, f"{meeting_dir}/{QUEUE_JOB_FILE}"))
+    if job["run_id"] != message["run_id"]:
+        logging.warning(f"[Queue] 새 업로드로 대체된 실행의 메시지, 무시: {meeting_dir} ({message['run_id']})")
+        return None, None
+    ctx = {
+        "meeting_dir": meeting_dir, "blob_service": blob_service, "container_name": container_name,
+        "manifest": load_manifest(blob_service, container_name, meeting_dir), "keys": dict(job["keys"]),
+        "metrics": PipelineMetrics(meeting_dir, invocation=invocation),
+    }
+    return ctx, job
+
+# 모든 청크가 완료 기록됐으면 gpt4otranscribe 단계 완료 기록 (여러 청크가 동시에 해도 같은 내용)
+def finish_transcribe_chunks(ctx, job):
+    manifest, keys = ctx["manifest"], ctx["keys"]
+    stages = [chunk_stage(i) for i in range(len(job["chunks"]))]
+    if not all(stage_recorded(manifest, s, chunk_stage_key(keys, i)) for i, s in enumerate(stages)):
+        return False
+    outputs = [name for s in stages for name in manifest["stages"][s]["outputs"]] + [job["plan_blob"]]
+    mark_stage_done(manifest, "gpt4otranscribe", keys["gpt4otranscribe"], outputs,
+                    ctx["blob_service"], ctx["container_name"], ctx["meeting_dir"])
+    return True
+
+# TranscribeChunk: 청크 1개 전사 -> 청크 완료 기록 -> (마지막 청크면) gpt4otranscribe 완료 기록 + 병합 시작 확인
+def handle_transcribe_chunk(message):
+    ctx, job = load_job_ctx(message, "TranscribeChunk")
+    if ctx is None:
+        return
+    index = message["index"]
+    stage = chunk_stage(index)
+    ctx["keys"][stage] = chunk_stage_key(ctx["keys"], index)
+    meeting_dir, blob_service, container_name = ctx["meeting_dir"], ctx["blob_service"], ctx["container_name"]
+    try:
+        run_stage(ctx, stage, transcribe_chunk_blob, job["chunks"], index, blob_service, container_name)
+        require_stage(ctx, stage)
+        ctx["manifest"] = load_manifest(blob_service, container_name, meeting_dir)
+        if finish_transcribe_chunks(ctx, job):
+            enqueue_merge_if_ready(meeting_dir, job["run_id"], ctx["keys"], blob_service, container_name)
+            # 배치가 먼저 실패했으면 실시간 전사 기준 병합도 여기서 시작
+            if "merge_realtime" in ctx["keys"] and batch_failed(meeting_dir, job["run_id"], blob_service, container_name):
+                enqueue_merge_if_ready(meeting_dir, job["run_id"], ctx["keys"], blob_service, container_name, baseline="realtime")
+    finally:
+        ctx["metrics"].save(blob_service, container_name, f"metrics_{stage}.json")
+
+# BatchPoll: 배치 상태 확인, 진행 중이면 다음 조회 간격만큼 지연된 메시지를 다시 넣고 종료 (함수 안에서 sleep 대기 X)
+#   - 완료되면 결과 저장 + batch 완료 기록 후 병합 시작 확인, BATCH_DEADLINE_SEC가 지나도 안 끝나면 작업 삭제
+#   - 실시간 전사 journal이 있으면: 등록 후 REALTIME_BASELINE_WAIT_SEC가 지났거나 배치가 실패했을 때 journal 기준 병합도 시작
+#   - webhook_deadline 메시지: 웹훅 모드 대기시간 확인 (complete_batch_job 참고, inline 웹훅 모드도 이 큐 사용)
+def handle_batch_poll(message):
+    if message.get("webhook_deadline"):
+        complete_batch_job(message["tid"], deadline=True)
+        return
+    ctx, job = load_job_ctx(message, "BatchPoll")
+    if ctx is None:
+        return
+    tid, attempt = message["tid"], message.get("attempt", 0)
+    meeting_dir, blob_service, container_name = ctx["meeting_dir"], ctx["blob_service"], ctx["container_name"]
+    try:
+        with ctx["metrics"].stage("batch_poll"):
+            status = batch_job_status(tid).get("status")
+            elapsed = time.time() - message.get("submitted_at", time.time())
+            logging.info(f"[Queue] Batch STT 진행상태: {status} ({elapsed:.0f}s 경과, 조회 {attempt + 1}회)")
+        realtime = "merge_realtime" in ctx["keys"]
+        if status not in {"Succeeded", "Failed"}:
+            if elapsed >= BATCH_DEADLINE_SEC:
+                logging.error(f"[Queue] Batch STT 대기시간 초과({BATCH_DEADLINE_SEC:.0f}s), 작업 삭제: {tid}")
+                delete_batch_job(tid)
+                fail_batch_run(meeting_dir, job["run_id"], ctx["keys"], blob_service, container_name)
+                return
+            if realtime and elapsed >= REALTIME_BASELINE_WAIT_SEC:
+                enqueue_merge_if_ready(meeting_dir, job["run_id"], ctx["keys"], blob_service, container_name, baseline="realtime")
+            enqueue(QUEUE_BATCH_POLL, dict(message, attempt=attempt + 1),
+                    delay_sec=batch_poll_delay(job["audio_sec"], attempt + 1))
+            return
+        if status != "Succeeded":
+            logging.error(f"[Queue] 배치 작업 실패({status}): {tid} ({meeting_dir})")
+            fail_batch_run(meeting_dir, job["run_id"], ctx["keys"], blob_service, container_name)
+            return
+        with ctx["metrics"].stage("batch_collect"):
+            outputs = collect_batch(tid, job["audio_blob_path"])
+            if not outputs:
+                raise RuntimeError(f"배치 결과 저장 실패: {tid}")
+            mark_stage_done(ctx["manifest"], "batch", ctx["keys"]["batch"], outputs, blob_service, container_name, meeting_dir)
+        enqueue_merge_if_ready(meeting_dir, job["run_id"], ctx["keys"], blob_service, container_name)
+    finally:
+        ctx["metrics"].save(blob_service, container_name, "metrics_batch_poll.json")
+
+# 실시간 전사 기준 결과를 만들려는데 배치 기준 결과가 이미 있으면 True (늦게 도착한 메시지가 덮어쓰지 않게)
+def superseded_by_batch(ctx, baseline, stage):
+    return baseline != "batch" and stage_recorded(ctx["manifest"], stage, ctx["keys"][stage])
+
+# Merge: [1] + [2](또는 실시간 전사 journal) -> script_final.txt, 완료되면 요약 메시지 전송
+def handle_merge(message):
+    ctx, job = load_job_ctx(message, "Merge")
+    if ctx is None:
+        return
+    baseline = message.get("baseline", "batch")
+    stage = FINISH_STAGES[baseline][0]
+    meeting_dir, blob_service, container_name = ctx["meeting_dir"], ctx["blob_service"], ctx["container_name"]
+    try:
+        if superseded_by_batch(ctx, baseline, "merge"):
+            logging.info(f"[Queue] 배치 기준 병합 결과가 이미 있어 {stage} 생략: {meeting_dir}")
+            return
+        merge_fn, requires = merge_step(baseline)
+        run_stage(ctx, stage, merge_fn, meeting_dir, blob_service, container_name, baseline=baseline, requires=requires)
+        require_stage(ctx, stage)
+        enqueue(QUEUE_SUMMARIZE, {"meeting_dir": meeting_dir, "run_id": job["run_id"], "variant": baseline})
+    finally:
+        ctx["metrics"].save(blob_service, container_name, f"metrics_{stage}.json")
+
+# Summarize: script_final.txt -> summary.txt
+#   - variant: batch / realtime(병합 기준), draft(실시간 전사 journal -> summary_draft.txt, 실패해도 재시도하지 않음)
+def handle_summarize(message):
+    ctx, job = load_job_ctx(message, "Summarize")
+    if ctx is None:
+        return
+    variant = message.get("variant", "batch")
+    meeting_dir, blob_service, container_name = ctx["meeting_dir"], ctx["blob_service"], ctx["container_name"]
+    stage = "draft" if variant == "draft" else FINISH_STAGES[variant][1]
+    try:
+        if variant == "draft":
+            run_stage(ctx, stage, draft_from_realtime, meeting_dir, blob_service, container_name)
+            return
+        if superseded_by_batch(ctx, variant, "summarize"):
+            logging.info(f"[Queue] 배치 기준 요약이 이미 있어 {stage} 생략: {meeting_dir}")
+            return
+        run_stage(ctx, stage, summarize, meeting_dir, blob_service, container_name, requires=[FINISH_STAGES[variant][0]])
+        require_stage(ctx, stage)
+        logging.info(f"[Queue] 후처리 실행 완료({variant} 기준): {meeting_dir} ({job['run_id']})")
+    finally:
+        ctx["metrics"].save(blob_service, container_name, f"metrics_{stage}.json")
@@ -0,0 +1,68 @@
+import os
+import json
+import math
+import logging
+
+from azure.core.exceptions import ResourceNotFoundError
+
+from .blob_utils import create_blob_once
+from .clients import get_queue_client
+from .stage_cache import load_manifest, stage_recorded
+from .stt_utils import merge_step
+
+# 후처리 실행 방식
+#   - inline: BlobTrigger 한 번의 실행 안에서 전사 -> 병합 -> 요약 (BATCH_COMPLETION_MODE 참고)
+#   - queue : BlobTrigger는 청크 준비(ingest)와 배치 등록만 하고, 청크별 전사 / 배치 완료 확인 / 병합 / 요약은
+#             단계 큐 메시지로 나눠 각 함수(TranscribeChunk, BatchPoll, Merge, Summarize)가 처리
+#             (단계마다 stage_cache에 완료 기록, 실패한 메시지만 큐 재시도)
+PIPELINE_MODE = os.environ.get("PIPELINE_MODE", "inline")
+QUEUE_TRANSCRIBE_CHUNK = "transcribe-chunk"  # 청크 1개 전사
+QUEUE_BATCH_POLL = "batch-poll"              # 배치 상태 확인 (미완료면 지연 메시지로 다시 넣음)
+QUEUE_MERGE = "pipeline-merge"
+QUEUE_SUMMARIZE = "pipeline-summarize"
+QUEUE_JOB_FILE = "pipeline_job.json"  # 회의 폴더: 실행ID(run_id), 캐시 키, 청크 오디오 목록 등 단계 함수들이 공유하는 정보
+CLAIMS_DIR = "queue_claims"           # 회의 폴더: 다음 단계 시작 선점 표시 (<run_id>.<단계명>), 배치 실패 표시 (<run_id>.batch_failed)
+
+# 단계 큐에 메시지 전송 (delay_sec: 그 시간 뒤에 보이는 메시지, 큐가 없으면 만들고 다시 전송)
+def enqueue(queue_name, payload, delay_sec=0):
+    queue = get_queue_client(queue_name)
+    body = json.dumps(payload, ensure_ascii=False)
+    visibility = math.ceil(delay_sec) if delay_sec else None
+    try:
+        queue.send_message(body, visibility_timeout=visibility)
+    except ResourceNotFoundError:
+        queue.create_queue()
+        queue.send_message(body, visibility_timeout=visibility)
+
+# 배치 실패/대기시간 초과 기록 후 실시간 전사 기준 병합 시작 확인
+#   - gpt4otranscribe가 아직이면 마지막 청크(handle_transcribe_chunk)가 batch_failed로 확인해 병합 시작
+def fail_batch_run(meeting_dir, run_id, keys, blob_service, container_name):
+    create_blob_once(run_id, f"{meeting_dir}/{CLAIMS_DIR}/{run_id}.batch_failed", blob_service, container_name)
+    if "merge_realtime" in keys:
+        enqueue_merge_if_ready(meeting_dir, run_id, keys, blob_service, container_name, baseline="realtime")
+
+# 이 실행(run_id)의 배치가 실패 기록됐는지
+def batch_failed(meeting_dir, run_id, blob_service, container_name):
+    return blob_service.get_blob_client(container=container_name, blob=f"{meeting_dir}/{CLAIMS_DIR}/{run_id}.batch_failed").exists()
+
+# gpt4otranscribe / batch 단계가 모두 완료 기록됐으면 병합 메시지를 한 번만 전송 (두 단계 중 늦게 끝난 쪽에서 호출)
+#   - TRANSCRIBE_SCOPE=selective: batch만 (실시간 기준이면 조건 없이) - merge_step 참고
+#   - 같은 실행(run_id)의 마지막 청크 여러 개가 동시에 끝나도 선점 blob을 먼저 만든 쪽만 전송
+#   - baseline="realtime": batch 대신 실시간 전사 journal 기준 병합 (gpt4otranscribe만 완료되면 전송, 선점 표시도 따로)
+#   - 반환: 이번 호출에서 병합 메시지를 보냈는지
+def enqueue_merge_if_ready(meeting_dir, run_id, keys, blob_service, container_name, baseline="batch"):
+    _, required = merge_step(baseline)
+    manifest = load_manifest(blob_service, container_name, meeting_dir)
+    if not all(stage_recorded(manifest, stage, keys[stage]) for stage in required):
+        return False
+    claim_blob = f"{meeting_dir}/{CLAIMS_DIR}/{run_id}.merge" + ("" if baseline == "batch" else f"_{baseline}")
+    if not create_blob_once(run_id, claim_blob, blob_service, container_name):
+        return False
+    try:
+        enqueue(QUEUE_MERGE, {"meeting_dir": meeting_dir, "run_id": run_id, "baseline": baseline})
+    except Exception:
+        # 전송 실패시 선점 표시를 지워 다음 호출(재시도)이 다시 보낼 수 있게 함
+        blob_service.get_blob_client(container=container_name, blob=claim_blob).delete_blob()
+        raise
+    logging.info(f"[Queue] 병합 시작({baseline} 기준): {meeting_dir} ({run_id})")
+    return True
@@ -0,0 +1,68 @@
+import os
+import json
+import hashlib
+from datetime import datetime
+
+from .blob_utils import upload_blob
+
+STAGE_CACHE_ENABLED = os.environ.get("STAGE_CACHE_ENABLED", "true").lower() == "true"
+CACHE_DIR_NAME = "stage_cache"  # 회의 폴더 안에 단계별 캐시 키/산출물 목록을 <단계명>.json blob으로 저장
+HASH_BLOCK_SIZE = 4 * 1024 * 1024
+
+# 파일 핸들 내용 전체의 sha256 (4MB씩 읽어 메모리 사용 일정)
+def file_sha256(f):
+    h = hashlib.sha256()
+    f.seek(0)
+    while True:
+        block = f.read(HASH_BLOCK_SIZE)
+        if not block:
+            break
+        h.update(block)
+    f.seek(0)
+    return h.hexdigest()
+
+# 문자열 sha256 (프롬프트 해시 등)
+def text_sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+# 단계 캐시 키: 입력(오디오 해시, 앞 단계 키, 프롬프트 해시, 모델명, 옵션)을 이어붙여 해시
+def stage_key(*parts):
+    return text_sha256("|".join(str(p) for p in parts))
+
+# 회의 폴더의 stage_cache/*.json 읽어 manifest 구성 (없으면 빈 manifest)
+#   - 단계마다 blob을 따로 두어, 서로 다른 함수 실행(예: 배치 완료 웹훅)이 동시에 기록해도 덮어쓰지 않음
+def load_manifest(blob_service, container_name, meeting_dir):
+    prefix = f"{meeting_dir}/{CACHE_DIR_NAME}/"
+    stages = {}
+    for b in blob_service.get_container_client(container_name).list_blobs(name_starts_with=prefix):
+        if b.name.endswith(".json"):
+            stage = os.path.splitext(os.path.basename(b.name))[0]
+            stages[stage] = json.loads(blob_service.get_blob_client(container=container_name, blob=b.name).download_blob().readall())
+    return {"stages": stages}
+
+# manifest에 기록된 단계 키가 주어진 키와 같은지 (산출물 존재 여부는 확인하지 않음)
+def stage_recorded(manifest, stage, key):
+    return manifest["stages"].get(stage, {}).get("key") == key
+
+# 캐시 키가 같고 기록된 산출물 blob이 모두 남아있으면 완료된 단계로 판단
+def is_stage_done(manifest, stage, key, blob_service, container_name):
+    if not STAGE_CACHE_ENABLED:
+        return False
+    entry = manifest["stages"].get(stage)
+    if not entry or entry.get("key") != key or not entry.get("outputs"):
+        return False
+    return all(
+        blob_service.get_blob_client(container=container_name, blob=name).exists()
+        for name in entry["outputs"]
+    )
+
+# 단계 완료 기록 후 stage_cache/<단계명>.json 저장
+def mark_stage_done(manifest, stage, key, outputs, blob_service, container_name, meeting_dir):
+    entry = {
+        "key": key,
+        "outputs": list(outputs),
+        "finished_at": datetime.utcnow().isoformat(),
+    }
+    manifest["stages"][stage] = entry
+    upload_blob(json.dumps(entry, ensure_ascii=False, indent=2), f"{meeting_dir}/{CACHE_DIR_NAME}/{stage}.json",
+                blob_service, container_name, verbose=False)
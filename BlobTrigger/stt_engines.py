@@ -0,0 +1,149 @@
+import io
+import os
+import logging
+import threading
+import importlib.util
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait
+
+import soundfile as sf
+
+from .audio_processing import AUDIO_CONTENT_TYPES
+from .clients import get_openai_client, get_or_create_client
+from .metrics import api_call
+
+# 전사 엔진 (call_gpt4otranscribe 뒤에서 실제 전사를 수행)
+#   - openai: Azure OpenAI gpt-4o-transcribe API
+#   - local : 로컬 CPU Whisper 계열 모델(faster-whisper, int8 양자화)을 프로세스 풀에서 실행 (오디오를 외부로 보내지 않음)
+#   - 화자 분리는 두 엔진 모두 배치 전사(Speech batch) 결과를 그대로 사용 (병합 단계)
+STT_ENGINE = os.environ.get("STT_ENGINE", "openai")
+LOCAL_STT_MODEL = os.environ.get("LOCAL_STT_MODEL", "large-v3-turbo")  # faster-whisper 모델명 또는 변환된 모델 폴더 경로
+LOCAL_STT_COMPUTE_TYPE = os.environ.get("LOCAL_STT_COMPUTE_TYPE", "int8")
+LOCAL_STT_PROCESSES = int(os.environ.get("LOCAL_STT_PROCESSES", "2"))  # 모델을 1개씩 올리는 워커 프로세스 수 (메모리 = 모델 크기 × 개수)
+LOCAL_STT_CPU_THREADS = int(os.environ.get("LOCAL_STT_CPU_THREADS", str(max(1, (os.cpu_count() or 1) // LOCAL_STT_PROCESSES))))
+LOCAL_STT_BATCH_SIZE = int(os.environ.get("LOCAL_STT_BATCH_SIZE", "8"))  # 한 요청 안의 30초 구간들을 묶어 추론하는 개수 (1이면 순차 디코딩)
+LOCAL_STT_BEAM_SIZE = int(os.environ.get("LOCAL_STT_BEAM_SIZE", "1"))
+LOCAL_STT_VAD = os.environ.get("LOCAL_STT_VAD", "true").lower() == "true"  # 무음 구간은 디코딩하지 않음
+LOCAL_STT_RATE = 16000
+LOCAL_STT_WINDOW_SEC = 30  # Whisper 입력 창 길이 (VAD를 끈 묶음 추론은 이 길이로 잘라 넣음)
+
+# gpt-4o-transcribe API 전사 (기존 call_gpt4otranscribe 동작)
+class OpenAITranscribeEngine:
+    name = "openai"
+
+    def cache_id(self, model):
+        return model
+
+    def transcribe(self, audio_bytes, prompt="", audio_format="wav", model=None):
+        client = get_openai_client("2025-03-01-preview")
+        file_tuple = (f"audio.{audio_format}", io.BytesIO(audio_bytes), AUDIO_CONTENT_TYPES[audio_format])
+        with api_call("gpt4o_transcribe", request_bytes=len(audio_bytes)):
+            rsp = client.audio.transcriptions.create(
+                file=file_tuple,
+                model=model,
+                response_format="json",
+                prompt=prompt,
+                language="ko",
+                temperature=0.2,
+            )
+        return rsp.to_dict()
+
+# ---------------------------------------------------------------- 로컬 CPU 엔진 (워커 프로세스 쪽)
+
+_worker_model = None
+
+# 워커 프로세스 시작시 모델을 한 번만 로드 (요청마다 다시 로드하지 않음)
+def _init_local_worker(model, compute_type, cpu_threads, batch_size):
+    global _worker_model
+    from faster_whisper import WhisperModel, BatchedInferencePipeline
+    whisper = WhisperModel(model, device="cpu", compute_type=compute_type, cpu_threads=cpu_threads, num_workers=1)
+    _worker_model = BatchedInferencePipeline(model=whisper) if batch_size > 1 else whisper
+
+def _local_worker_ready():
+    return os.getpid()
+
+# VAD 없이 묶음 추론할 때 넘기는 구간 목록: 오디오 전체를 30초 창으로 나눔 (초 단위)
+#   - BatchedInferencePipeline은 vad_filter=False면 clip_timestamps 없이 30초 이상 오디오를 받지 않음
+def fixed_clip_timestamps(duration_sec, window_sec=LOCAL_STT_WINDOW_SEC):
+    clips, start = [], 0.0
+    while start < duration_sec:
+        clips.append({"start": start, "end": min(start + window_sec, duration_sec)})
+        start += window_sec
+    return clips
+
+# 오디오 1건 전사 (wav/flac/ogg bytes -> 16kHz mono float32 -> 모델), 반환은 API 응답과 같은 {"text": ...}
+def _local_transcribe(audio_bytes, prompt, batch_size, beam_size, vad):
+    audio, rate = sf.read(io.BytesIO(audio_bytes), dtype="float32", always_2d=True)
+    audio = audio.mean(axis=1)
+    if rate != LOCAL_STT_RATE:
+        from faster_whisper.audio import decode_audio
+        audio = decode_audio(io.BytesIO(audio_bytes), sampling_rate=LOCAL_STT_RATE)  # PyAV로 리샘플
+    kwargs = {"language": "ko", "initial_prompt": prompt or None, "beam_size": beam_size, "vad_filter": vad}
+    if batch_size > 1:
+        kwargs["batch_size"] = batch_size
+        if not vad:
+            kwargs["clip_timestamps"] = fixed_clip_timestamps(len(audio) / LOCAL_STT_RATE)
+    segments, info = _worker_model.transcribe(audio, **kwargs)
+    text = " ".join(s.text.strip() for s in segments)  # generator: 여기서 실제 디코딩
+    return {"text": text, "duration": info.duration}
+
+# 로컬 Whisper 계열 모델 전사
+#   - 워커 프로세스 LOCAL_STT_PROCESSES개가 모델을 1개씩 올려두고, 청크 전사 스레드들이 요청을 나눠 보냄
+#   - 프로세스 풀은 첫 요청에서 생성해 같은 함수 워커의 다음 실행에서도 재사용 (spawn: 부모의 스레드/연결 상태를 복제하지 않음)
+#   - faster-whisper는 선택 의존성 (requirements.txt에 없음, STT_ENGINE=local일 때만 설치)
+class LocalWhisperEngine:
+    name = "local"
+
+    def __init__(self, model=LOCAL_STT_MODEL, compute_type=LOCAL_STT_COMPUTE_TYPE, processes=LOCAL_STT_PROCESSES,
+                 cpu_threads=LOCAL_STT_CPU_THREADS, batch_size=LOCAL_STT_BATCH_SIZE, beam_size=LOCAL_STT_BEAM_SIZE, vad=LOCAL_STT_VAD):
+        self.model = model
+        self.compute_type = compute_type
+        self.processes = processes
+        self.cpu_threads = cpu_threads
+        self.batch_size = batch_size
+        self.beam_size = beam_size
+        self.vad = vad
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def cache_id(self, model):
+        return f"local:{self.model}:{self.compute_type}:{self.beam_size}:{self.batch_size}:{self.vad}"
+
+    def pool(self):
+        with self._lock:
+            if self._pool is None:
+                if importlib.util.find_spec("faster_whisper") is None:
+                    raise RuntimeError("STT_ENGINE=local 에는 faster-whisper 패키지가 필요합니다 (pip install faster-whisper)")
+                logging.info(f"[STT] 로컬 엔진 시작: {self.model} ({self.compute_type}), 프로세스 {self.processes} × 스레드 {self.cpu_threads}")
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_local_worker,
+                    initargs=(self.model, self.compute_type, self.cpu_threads, self.batch_size),
+                )
+            return self._pool
+
+    # 워커 프로세스를 모두 띄워 모델 로드까지 끝냄 (첫 요청 지연을 따로 측정할 때)
+    def warmup(self):
+        pool = self.pool()
+        wait([pool.submit(_local_worker_ready) for _ in range(self.processes)])
+
+    def transcribe(self, audio_bytes, prompt="", audio_format="wav", model=None):
+        pool = self.pool()
+        with api_call("local_stt", request_bytes=len(audio_bytes)):
+            return pool.submit(_local_transcribe, audio_bytes, prompt, self.batch_size, self.beam_size, self.vad).result()
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+STT_ENGINES = {"openai": OpenAITranscribeEngine, "local": LocalWhisperEngine}
+
+# 설정된 전사 엔진 (프로세스당 1개, clients 저장소에 보관 - 벤치마크는 set_client(("stt_engine", 이름), ...)로 주입 가능)
+def get_stt_engine(name=None):
+    name = name or STT_ENGINE
+    if name not in STT_ENGINES:
+        raise ValueError(f"알 수 없는 STT_ENGINE: {name} (가능: {', '.join(STT_ENGINES)})")
+    return get_or_create_client(("stt_engine", name), STT_ENGINES[name])
@@ -1,95 +1,289 @@
 import os
-import io
 import json
+import math
 import time
-import httpx
 import logging
-import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from pathlib import Path
+from bisect import bisect_right
 
-from openai import AzureOpenAI
-from azure.storage.blob import generate_blob_sas, BlobSasPermissions, BlobServiceClient
+from openai import RateLimitError, APIConnectionError, APITimeoutError, InternalServerError
+from azure.storage.blob import generate_blob_sas, BlobSasPermissions
 
 from .audio_processing import (
-    chunk_wav_bytes, get_chunk_offsets,
-    split_batch_script_by_chunks, iso_to_sec, fmt, MAX_SIZE_MB
+    read_wav_header, read_wav_range, read_wav_segments, get_chunk_offsets, plan_audio_chunks, chunk_plan_dict,
+    parse_batch_segments, parse_realtime_segments, render_segment, render_batch_txt, segments_in_range, transcribe_chunk_bytes, encode_transcribe_chunk,
+    align_segments, align_words, segment_words, wav_header,
+    TRANSCRIBE_AUDIO_FORMAT
 )
-from .blob_utils import get_prompt_from_blob, upload_blob
-
-# gpt-4o-transcribe로 오디오 파일 한 개 전사 요청
-def call_gpt4otranscribe(wav_bytes, phrase_str="", gpt_model="gpt-4o-transcribe"):
-    client = AzureOpenAI(
-        azure_endpoint=os.environ["OPENAI_ENDPOINT_URI"],
-        api_key=os.environ["OPENAI_ENDPOINT_KEY"],
-        api_version="2025-03-01-preview",
-        http_client=httpx.Client(verify=False)
-    )
-    file_obj = io.BytesIO(wav_bytes)
-    file_tuple = ("audio.wav", file_obj, "audio/wav")
-    rsp = client.audio.transcriptions.create(
-        file=file_tuple,
-        model=gpt_model,
-        response_format="json",
-        prompt=phrase_str,
-        language="ko",
-        temperature=0.2,
-    )
-    return rsp.to_dict()
+from .blob_utils import get_prompt_from_blob, upload_blob, download_meeting_audio, download_blob_bytes, open_meeting_audio
+from .clients import get_openai_client, get_blob_service, get_http_session, HTTP_TIMEOUTS
+from .stt_engines import get_stt_engine
+from .tokens import count_tokens, pack_lines
+from .metrics import api_call, add_bytes, propagate
+
+GPT4O_TRANSCRIBE_WORKERS = int(os.environ.get("GPT4O_TRANSCRIBE_WORKERS", "4"))  # 청크 동시 전사 개수 (1이면 순차)
+# 청크간 문맥(prompt) 연결 방식
+#   - chain: 이전 청크 전사결과 끝 300자를 다음 청크 prompt로 (순차 실행)
+#   - seed : 이전 청크 끝 SEED_TAIL_SEC초만 먼저 병렬 전사(1차) -> 그 결과를 prompt로 본 전사도 병렬 실행
+#   - none : prompt 없이 병렬 전사
+GPT4O_TRANSCRIBE_CONTEXT = os.environ.get("GPT4O_TRANSCRIBE_CONTEXT", "seed")
+PROMPT_CONTEXT_CHARS = 300
+SEED_TAIL_SEC = 20
+TRANSCRIBE_MODEL = "gpt-4o-transcribe"
+LLM_MODEL = "gpt-4o"  # 병합/요약용 모델
+MERGE_WORKERS = int(os.environ.get("MERGE_WORKERS", "4"))  # 청크 병합 LLM 동시 호출 개수
+# 병합 요청 1건의 입력 토큰 한도(프롬프트 포함): 작은 청크는 묶고 큰 청크는 발화구간 경계로 나눔 (0이면 청크 쌍마다 1건)
+MERGE_REQUEST_TOKENS = int(os.environ.get("MERGE_REQUEST_TOKENS", "8000"))
+MERGE_TXT2_MARGIN = float(os.environ.get("MERGE_TXT2_MARGIN", "0.1"))  # 청크를 나눌 때 조각별 txt2를 앞뒤로 더 포함하는 비율
+# 병합 방식
+#   - llm  : 청크(요청)마다 gpt-4o에 배치 스크립트의 문장을 gpt-4o-transcribe 문장으로 교체 요청
+#   - align: 배치 단어 타임스탬프와 gpt 전사문을 단어 단위로 정렬(difflib)해 화자/시간을 gpt 문장에 옮기고,
+#            배치 단어 일치 비율이 ALIGN_MIN_RATIO 미만인 발화 구간만 LLM 병합 (배치 작업에 표시 단어 타임스탬프 요청)
+MERGE_MODE = os.environ.get("MERGE_MODE", "llm")
+ALIGN_MIN_RATIO = float(os.environ.get("ALIGN_MIN_RATIO", "0.5"))
+BATCH_WORD_TIMESTAMPS = MERGE_MODE == "align"
+MERGE_SYSTEM_PROMPT = "[병합 규칙]에 따라 txt1의 전사문을 txt2의 문장으로 교체하세요."
+OPENAI_MAX_RETRIES = int(os.environ.get("OPENAI_MAX_RETRIES", "5"))  # 429/일시 오류시 재시도 횟수
+# Batch Transcription 상태조회: 처리시간 ≈ 오디오 길이 × BATCH_RTF_ESTIMATE 로 추정, 조회 간격 MIN~MAX초, 최대 대기 DEADLINE초
+BATCH_RTF_ESTIMATE = float(os.environ.get("BATCH_RTF_ESTIMATE", "0.1"))
+BATCH_POLL_MIN_SEC = float(os.environ.get("BATCH_POLL_MIN_SEC", "5"))
+BATCH_POLL_MAX_SEC = float(os.environ.get("BATCH_POLL_MAX_SEC", "60"))
+BATCH_DEADLINE_SEC = float(os.environ.get("BATCH_DEADLINE_SEC", "2700"))
+# 요약: 스크립트가 THRESHOLD 토큰을 넘으면 SECTION 토큰 단위 구간별로 동시에 요약(map) -> 구간 요약을 합쳐 최종 요약(reduce)
+SUMMARY_MAP_THRESHOLD_TOKENS = int(os.environ.get("SUMMARY_MAP_THRESHOLD_TOKENS", "12000"))
+SUMMARY_SECTION_TOKENS = int(os.environ.get("SUMMARY_SECTION_TOKENS", "6000"))
+SUMMARY_WORKERS = int(os.environ.get("SUMMARY_WORKERS", "4"))
+# gpt-4o-transcribe 전사 범위
+#   - full     : 전체 오디오를 청크로 나눠 전사하고 배치 결과와 병합 (gpt4otranscribe + merge)
+#   - selective: 배치 전사가 끝난 뒤 신뢰도 RETRANSCRIBE_MAX_CONFIDENCE 미만 발화 구간만 잘라 전사해 교체 (retranscribe)
+TRANSCRIBE_SCOPE = os.environ.get("TRANSCRIBE_SCOPE", "full")
+RETRANSCRIBE_MAX_CONFIDENCE = float(os.environ.get("RETRANSCRIBE_MAX_CONFIDENCE", "0.7"))
+RETRANSCRIBE_GROUP_SEC = float(os.environ.get("RETRANSCRIBE_GROUP_SEC", "60"))  # 요청 1건에 이어붙이는 구간 오디오 최대 길이
+RETRANSCRIBE_WORKERS = int(os.environ.get("RETRANSCRIBE_WORKERS", "8"))
+RETRANSCRIBE_PAD_SEC = 0.3  # 구간 앞뒤 여유 (이웃 발화 경계까지만)
+RETRANSCRIBE_GAP_SEC = 0.5  # 이어붙인 구간 사이에 넣는 무음
+REALTIME_JOURNAL_FILE = "script_realtime.jsonl"  # 클라이언트가 녹음 중 실시간 전사 결과를 기록해 함께 올리는 파일
+SECTION_SUMMARY_PROMPT = (
+    "다음은 긴 회의 스크립트의 일부(구간 {index}/{total})입니다. "
+    "나중에 전체 회의 요약을 만들 때 쓰이도록 이 구간의 논의 주제, 주요 의견과 발언자, 결정사항, "
+    "후속 조치(담당자/기한)를 빠짐없이 간결하게 정리하세요."
+)
+
+# 오디오 파일 한 개 전사 요청 (audio_format: wav/flac/ogg)
+#   - 기본은 gpt-4o-transcribe API, STT_ENGINE=local이면 로컬 CPU 모델 (stt_engines 참고, 반환 형식은 같음 {"text": ...})
+def call_gpt4otranscribe(audio_bytes, phrase_str="", gpt_model=TRANSCRIBE_MODEL, audio_format="wav"):
+    return get_stt_engine().transcribe(audio_bytes, prompt=phrase_str, audio_format=audio_format, model=gpt_model)
 
-# 파일 크기에 따라 gpt-4o-transcribe 전체/청크별 전사 & blob 업로드
-def stt_gpt4otranscribe(meeting_dir, blob_service, container_name):
+# 전사 결과 캐시 키에 넣는 모델 식별자 (엔진/모델 설정이 바뀌면 gpt4otranscribe 단계를 다시 실행)
+def transcribe_model_id():
+    return get_stt_engine().cache_id(TRANSCRIBE_MODEL)
+
+# wav bytes를 TRANSCRIBE_AUDIO_FORMAT으로 인코딩해 전사 요청
+def transcribe_wav(wav_bytes, phrase_str=""):
+    data, audio_format = encode_transcribe_chunk(wav_bytes)
+    return call_gpt4otranscribe(data, phrase_str=phrase_str, audio_format=audio_format)
+
+# 429 등 오류 응답의 Retry-After(-ms) 헤더를 초 단위로 반환 (없으면 None)
+def retry_after_sec(err):
+    headers = getattr(getattr(err, "response", None), "headers", None) or {}
     try:
-        meta_blob_path = f"{meeting_dir}/meeting_metadata.json"
-        meta_blob = blob_service.get_blob_client(container=container_name, blob=meta_blob_path)
-        meta_data = json.loads(meta_blob.download_blob().readall())
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+# chat completion 호출: 429(rate limit)/일시 오류면 Retry-After만큼(없으면 지수 backoff) 쉬고 재시도
+#   - 반환: (응답, 재시도 횟수), 재시도 대기를 포함한 지연시간/토큰 사용량은 현재 단계 metrics에 기록
+def chat_with_retry(client, max_retries=OPENAI_MAX_RETRIES, **kwargs):
+    attempt = 0
+    with api_call("chat") as call:
+        while True:
+            try:
+                rsp = client.chat.completions.create(**kwargs)
+            except (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError) as e:
+                call["retries"] = attempt
+                if attempt >= max_retries:
+                    raise
+                wait = retry_after_sec(e) or min(2 ** attempt, 60)
+                logging.warning(f"[WARN] {type(e).__name__} -> {wait:.1f}초 후 재시도 ({attempt+1}/{max_retries})")
+                time.sleep(wait)
+                attempt += 1
+                continue
+            call["retries"] = attempt
+            if rsp.usage:
+                call["prompt_tokens"] = rsp.usage.prompt_tokens
+                call["completion_tokens"] = rsp.usage.completion_tokens
+            return rsp, attempt
 
-        wav_blob_path = f"{meeting_dir}/meeting_audio_raw.wav"
-        wav_blob = blob_service.get_blob_client(container=container_name, blob=wav_blob_path)
-        wav_bytes = wav_blob.download_blob().readall()
+# 청크별 문맥 prompt 생성: 각 청크 앞 청크의 끝 tail_sec초만 먼저 병렬 전사해서 사용 (첫 청크는 "")
+#   - load_chunk(start, end): 프레임 구간을 wav bytes로 읽어오는 함수, ranges: 청크별 프레임 구간
+def build_context_seeds(load_chunk, ranges, rate, workers=GPT4O_TRANSCRIBE_WORKERS, tail_sec=SEED_TAIL_SEC):
+    def transcribe_tail(frame_range):
+        start, end = frame_range
+        txt = transcribe_wav(load_chunk(max(start, end - int(tail_sec * rate)), end)).get("text", "")
+        return txt[-PROMPT_CONTEXT_CHARS:] if txt else ""
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        tails = list(pool.map(propagate(transcribe_tail), ranges[:-1]))
+    return [""] + tails
+
+# 오디오 길이에 따라 gpt-4o-transcribe 전체/청크별 전사 & blob 업로드
+#   - audio_file: BlobTrigger에서 한 번만 받아둔(압축 원본이면 디코딩한) wav 파일 핸들(spool). 없으면 직접 다운로드
+#   - 전송 오디오는 TRANSCRIBE_AUDIO_FORMAT으로 인코딩 (청크 크기는 transcribe_chunk_bytes 참고)
+#   - workers / context_mode: 청크 동시 전사 개수와 문맥 연결 방식 (GPT4O_TRANSCRIBE_CONTEXT 참고)
+#   - context_seeds: 청크별 prompt를 외부에서 지정 (예: 배치 전사 결과), 주어지면 1차 전사 생략
+#   - 반환: 저장한 전사결과 blob 경로 목록 (실패시 None)
+def stt_gpt4otranscribe(meeting_dir, blob_service, container_name, audio_file=None,
+                        workers=GPT4O_TRANSCRIBE_WORKERS, context_mode=GPT4O_TRANSCRIBE_CONTEXT, context_seeds=None):
+    try:
+        if audio_file is None:
+            audio_file = download_meeting_audio(blob_service, container_name, meeting_dir)
 
-        file_size_mb = meta_data['wav_metadata']['size_MB']
-        print(f"[INFO] wav 파일 크기: {file_size_mb:.2f} MB")
+        info = read_wav_header(audio_file)
+        chunk_bytes = transcribe_chunk_bytes(info)
+        plan_blob = f"{meeting_dir}/chunk_plan.json"
+        print(f"[INFO] 오디오 길이: {info.frames / info.rate:.0f}s (PCM {info.data_size / (1024 * 1024):.2f} MB), 전송 포맷: {TRANSCRIBE_AUDIO_FORMAT}")
 
-        # 15MB 이하면 한 번에 전사
-        if file_size_mb <= MAX_SIZE_MB:
-            print(f"[INFO] 파일 크기가 {file_size_mb:.2f}MB로 15MB 이하. 청킹없이 바로 전사.")
-            result = call_gpt4otranscribe(wav_bytes)
+        # 청크 한 개 크기 이하면 한 번에 전사 (SILENCE_TRIM_SEC 설정시 긴 무음만 빼고 전송)
+        if info.data_size <= chunk_bytes:
+            print("[INFO] 청크 한도 이하. 청킹없이 바로 전사.")
+            plan = plan_audio_chunks(audio_file, info, chunk_bytes=max(info.data_size, 1), split=False)
+            upload_blob(json.dumps(chunk_plan_dict(plan, info.rate), indent=2), plan_blob, blob_service, container_name, verbose=False)
+            result = transcribe_wav(read_wav_segments(audio_file, info, plan[0].segments))
             transcript_text = result.get("text", "")
             if not transcript_text.strip():
                 print("[WARN] gpt-4o-transcribe 전사 결과가 비어있음!")
             blob_path = f"{meeting_dir}/script_gpt4otranscribe.txt"
             upload_blob(transcript_text, blob_path, blob_service, container_name)
-            return
+            return [blob_path, plan_blob]
 
-        # 15MB 초과면 WAV를 청킹하고 청크별로 순차 전사
-        print("[INFO] 파일 크기가 15MB 초과. 청킹 및 청크별 전사 진행")
-        chunks = chunk_wav_bytes(wav_bytes)
-        prev_text = ""
+        # 청크 한도 초과면 WAV를 청킹하고 청크별로 전사
+        #   - 헤더와 경계 부근 에너지만 읽어 청크 구간(프레임)을 정하고, 각 청크는 전사 직전에 해당 바이트 범위만 읽음
+        #   - 원본 기준 청크 경계는 chunk_plan.json으로 저장 (병합시 배치 전사 분할에 사용)
+        print("[INFO] 청크 한도 초과. 청킹 및 청크별 전사 진행")
+        plan = plan_audio_chunks(audio_file, info, chunk_bytes)
+        plan_info = chunk_plan_dict(plan, info.rate)
+        upload_blob(json.dumps(plan_info, indent=2), plan_blob, blob_service, container_name, verbose=False)
+        print(f"[INFO] 청크 {len(plan)}개, 전송 오디오 {plan_info['sent_sec']:.0f}s / 전체 {plan_info['audio_sec']:.0f}s")
+        ranges = [(c.start, c.end) for c in plan]
         chunks_dir = f"{meeting_dir}/gpt4otranscribe_chunks"
-        for i, chunk in enumerate(chunks):
-            chunk_wav_blob = f"{chunks_dir}/meeting_audio_chunk_{i+1:03}.wav"
-            upload_blob(chunk, chunk_wav_blob, blob_service, container_name)
-            result = call_gpt4otranscribe(chunk, phrase_str=prev_text)
-            txt = result.get("text", "")
-            prev_text = txt[-300:] if txt else ""
+        read_lock = threading.Lock()
+
+        def load_chunk(start, end):  # 여러 스레드가 같은 spool 파일을 공유하므로 seek+read는 잠금 안에서
+            with read_lock:
+                return read_wav_range(audio_file, info, start, end)
+
+        def transcribe_chunk(i, prompt):
+            with read_lock:
+                chunk = read_wav_segments(audio_file, info, plan[i].segments)
+            data, audio_format = encode_transcribe_chunk(chunk)  # 청크는 압축된 상태로 저장/전송
+            chunk_audio_blob = f"{chunks_dir}/meeting_audio_chunk_{i+1:03}.{audio_format}"
+            upload_blob(data, chunk_audio_blob, blob_service, container_name)
+            txt = call_gpt4otranscribe(data, phrase_str=prompt, audio_format=audio_format).get("text", "")
             chunk_txt_blob = f"{chunks_dir}/meeting_audio_chunk_{i+1:03}.txt"
             upload_blob(txt, chunk_txt_blob, blob_service, container_name)
+            return txt
+
+        txt_blobs = [f"{chunks_dir}/meeting_audio_chunk_{i+1:03}.txt" for i in range(len(ranges))] + [plan_blob]
+
+        # chain 모드(또는 workers=1): 이전 청크 결과를 prompt로 넘기며 순차 전사
+        if context_mode == "chain" or workers <= 1:
+            prev_text = ""
+            for i in range(len(ranges)):
+                txt = transcribe_chunk(i, prev_text if context_mode != "none" else "")
+                prev_text = txt[-PROMPT_CONTEXT_CHARS:] if txt else ""
+            return txt_blobs
+
+        # 병렬 모드: 청크별 prompt를 미리 정해두고 동시에 전사 (청크 번호로 파일명이 정해지므로 순서 유지)
+        if context_seeds is None:
+            if context_mode == "seed":
+                context_seeds = build_context_seeds(load_chunk, ranges, info.rate, workers)
+            else:
+                context_seeds = [""] * len(ranges)
+        print(f"[INFO] 청크 {len(ranges)}개 병렬 전사 (workers={workers}, context={context_mode})")
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(propagate(transcribe_chunk), i, context_seeds[i] if i < len(context_seeds) else "")
+                for i in range(len(ranges))
+            ]
+            for f in futures:
+                f.result()
+        return txt_blobs
     except Exception as e:
         print(f"[ERROR] stt_gpt4otranscribe() 전사 실행 중 오류: {e}")
+        return None
 
-# Azure Batch Transcription으로 화자분리+전사 실행 및 결과 저장
-def stt_batch(meeting_id, wav_blob_path, max_num_speakers=5):
-    SPEECH_KEY = os.environ["SPEECH_KEY"]
-    SPEECH_REGION = os.environ["SPEECH_REGION"]
+# 큐 모드 ingest: 청크 구간을 정하고 청크별 전송 오디오를 인코딩해 blob 저장 (전사는 TranscribeChunk 함수가 청크마다 따로)
+#   - context_mode가 none이 아니면 각 청크 끝 tail_sec초도 따로 저장해 다음 청크 prompt(1차 전사)에 사용
+#     (청크를 서로 다른 인스턴스에서 동시에 전사하므로 chain 모드도 seed 방식으로 처리)
+#   - 반환: (청크별 {"audio": 청크 오디오 blob, "tail": 끝부분 오디오 blob 또는 None} 목록, chunk_plan.json 경로)
+def stage_transcribe_chunks(meeting_dir, blob_service, container_name, audio_file,
+                            context_mode=GPT4O_TRANSCRIBE_CONTEXT, tail_sec=SEED_TAIL_SEC):
+    info = read_wav_header(audio_file)
+    chunk_bytes = transcribe_chunk_bytes(info)
+    if info.data_size <= chunk_bytes:
+        plan = plan_audio_chunks(audio_file, info, chunk_bytes=max(info.data_size, 1), split=False)
+    else:
+        plan = plan_audio_chunks(audio_file, info, chunk_bytes)
+    plan_blob = f"{meeting_dir}/chunk_plan.json"
+    upload_blob(json.dumps(chunk_plan_dict(plan, info.rate), indent=2), plan_blob, blob_service, container_name, verbose=False)
+
+    chunks_dir = f"{meeting_dir}/gpt4otranscribe_chunks"
+    chunks = []
+    for i, c in enumerate(plan):
+        data, audio_format = encode_transcribe_chunk(read_wav_segments(audio_file, info, c.segments))
+        audio_blob = f"{chunks_dir}/meeting_audio_chunk_{i+1:03}.{audio_format}"
+        upload_blob(data, audio_blob, blob_service, container_name, verbose=False)
+        tail_blob = None
+        if context_mode != "none" and i < len(plan) - 1:
+            tail = read_wav_range(audio_file, info, max(c.start, c.end - int(tail_sec * info.rate)), c.end)
+            data, audio_format = encode_transcribe_chunk(tail)
+            tail_blob = f"{chunks_dir}/meeting_audio_chunk_{i+1:03}_tail.{audio_format}"
+            upload_blob(data, tail_blob, blob_service, container_name, verbose=False)
+        chunks.append({"audio": audio_blob, "tail": tail_blob})
+    print(f"[INFO] 청크 {len(chunks)}개 준비 완료 (전송 포맷: {TRANSCRIBE_AUDIO_FORMAT}, context={context_mode})")
+    return chunks, plan_blob
+
+# 큐 모드: ingest가 저장한 청크 오디오 한 개 전사 -> meeting_audio_chunk_NNN.txt
+#   - 앞 청크 끝부분(tail)이 있으면 먼저 전사해 prompt로 사용 (inline seed 모드와 같은 문맥)
+#   - 오류는 그대로 올려서 큐 메시지 재시도로 이 청크만 다시 실행
+def transcribe_chunk_blob(chunks, index, blob_service, container_name):
+    prompt = ""
+    tail_blob = chunks[index - 1]["tail"] if index > 0 else None
+    if tail_blob:
+        tail = download_blob_bytes(blob_service, container_name, tail_blob)
+        txt = call_gpt4otranscribe(tail, audio_format=tail_blob.rsplit(".", 1)[-1]).get("text", "")
+        prompt = txt[-PROMPT_CONTEXT_CHARS:] if txt else ""
+    audio_blob = chunks[index]["audio"]
+    data = download_blob_bytes(blob_service, container_name, audio_blob)
+    txt = call_gpt4otranscribe(data, phrase_str=prompt, audio_format=audio_blob.rsplit(".", 1)[-1]).get("text", "")
+    if not txt.strip():
+        print(f"[WARN] gpt-4o-transcribe 전사 결과가 비어있음: {audio_blob}")
+    txt_blob = f"{audio_blob.rsplit('.', 1)[0]}.txt"
+    upload_blob(txt, txt_blob, blob_service, container_name)
+    return [txt_blob]
+
+# Speech REST API 루트와 공통 헤더
+def speech_api():
+    api_root = f"https://{os.environ['SPEECH_REGION']}.api.cognitive.microsoft.com/speechtotext/v3.2"
+    headers = {
+        "Ocp-Apim-Subscription-Key": os.environ["SPEECH_KEY"],
+        "Content-Type": "application/json"
+    }
+    return api_root, headers
+
+# Azure Batch Transcription 작업 등록만 하고 작업 ID(tid) 반환 (실패시 None)
+def submit_batch(wav_blob_path, max_num_speakers=5):
     BLOB_ACCOUNT_NAME = os.environ["BLOB_ACCOUNT_NAME"]
     BLOB_ACCOUNT_KEY = os.environ["BLOB_ACCOUNT_KEY"]
     BLOB_CONTAINER_NAME = os.environ["BLOB_CONTAINER_NAME"]
 
-    blob_service = BlobServiceClient(
-        account_url=f"https://{BLOB_ACCOUNT_NAME}.blob.core.windows.net",
-        credential=BLOB_ACCOUNT_KEY
-    )
+    blob_service = get_blob_service()
     audio_sas_token = generate_blob_sas(
         account_name=BLOB_ACCOUNT_NAME,
         container_name=BLOB_CONTAINER_NAME,
@@ -102,13 +296,9 @@ def stt_batch(meeting_id, wav_blob_path, max_num_speakers=5):
     blob_client = blob_service.get_blob_client(container=BLOB_CONTAINER_NAME, blob=wav_blob_path)
     if not blob_client.exists():
         print("ERROR: 오디오 파일이 존재하지 않습니다.", wav_blob_path)
-        return
+        return None
 
-    api_root = f"https://{SPEECH_REGION}.api.cognitive.microsoft.com/speechtotext/v3.2"
-    headers = {
-        "Ocp-Apim-Subscription-Key": SPEECH_KEY,
-        "Content-Type": "application/json"
-    }
+    api_root, headers = speech_api()
     job_name = Path(wav_blob_path).stem
     job_body = {
         "displayName": job_name,
@@ -120,63 +310,270 @@ def stt_batch(meeting_id, wav_blob_path, max_num_speakers=5):
             "segmentation": {"mode": "Time", "segmentationSilenceTimeoutMs": 7000}
         }
     }
-    res = requests.post(f"{api_root}/transcriptions", headers=headers, json=job_body, verify=False)
+    if BATCH_WORD_TIMESTAMPS:
+        job_body["properties"]["displayFormWordLevelTimestampsEnabled"] = True
+    with api_call("speech.submit"):
+        res = get_http_session().post(f"{api_root}/transcriptions", headers=headers, json=job_body, timeout=HTTP_TIMEOUTS)
     if not res.ok:
         print("[ERROR] Batch job 등록 실패", res.text)
-        return
+        return None
     tid = res.json()["self"].split("/")[-1]
+    logging.info(f"[INFO] Batch STT 작업 등록: {tid}")
+    return tid
+
+# 배치 작업 상태조회 간격(초)을 차례로 생성
+#   - 오디오 길이 × BATCH_RTF_ESTIMATE 로 완료 예상시각을 잡고, 그 전에는 예상시각까지 최대 BATCH_POLL_MAX_SEC 간격으로,
+#     예상시각이 지나면 BATCH_POLL_MIN_SEC부터 2배씩 늘려가며(최대 BATCH_POLL_MAX_SEC) 조회
+def batch_poll_delays(audio_sec=None, rtf=None, min_sec=None, max_sec=None):
+    rtf = BATCH_RTF_ESTIMATE if rtf is None else rtf
+    min_sec = BATCH_POLL_MIN_SEC if min_sec is None else min_sec
+    max_sec = BATCH_POLL_MAX_SEC if max_sec is None else max_sec
+    remaining = (audio_sec or 0) * rtf
+    while remaining > min_sec:
+        delay = min(remaining, max_sec)
+        remaining -= delay
+        yield delay
+    delay = min_sec
     while True:
-        status_resp = requests.get(f"{api_root}/transcriptions/{tid}", headers=headers, verify=False).json()
+        yield delay
+        delay = min(delay * 2, max_sec)
+
+# Batch Transcription 작업 상태 조회 (응답 JSON, status: NotStarted/Running/Succeeded/Failed)
+def batch_job_status(tid):
+    api_root, headers = speech_api()
+    with api_call("speech.status"):
+        return get_http_session().get(f"{api_root}/transcriptions/{tid}", headers=headers, timeout=HTTP_TIMEOUTS).json()
+
+# Batch Transcription 작업 삭제 (대기시간 초과 등으로 포기할 때)
+def delete_batch_job(tid):
+    api_root, headers = speech_api()
+    get_http_session().delete(f"{api_root}/transcriptions/{tid}", headers=headers, timeout=HTTP_TIMEOUTS)
+
+# 등록된 Batch Transcription 작업 완료까지 대기 후 결과(json/txt) blob 저장
+#   - audio_sec: 오디오 길이(초), 조회 간격 추정에 사용 / deadline_sec: 이 시간이 지나도 안 끝나면 작업 삭제 후 포기
+#   - 반환: 저장한 blob 경로 목록 (실패시 None)
+def wait_batch(tid, wav_blob_path, audio_sec=None, deadline_sec=None):
+    deadline_sec = BATCH_DEADLINE_SEC if deadline_sec is None else deadline_sec
+    t0 = time.time()
+    delays = batch_poll_delays(audio_sec)
+    while True:
+        status_resp = batch_job_status(tid)
         status = status_resp.get("status")
-        logging.info(f"[INFO] Batch STT 진행상태: {status}")
+        elapsed = time.time() - t0
+        logging.info(f"[INFO] Batch STT 진행상태: {status} ({elapsed:.0f}s 경과)")
         if status in {"Succeeded", "Failed"}:
             break
-        time.sleep(30)
+        if elapsed >= deadline_sec:
+            print(f"[ERROR] Batch STT 대기시간 초과({deadline_sec:.0f}s), 작업 삭제: {tid}")
+            delete_batch_job(tid)
+            return None
+        time.sleep(min(next(delays), max(deadline_sec - elapsed, 1)))
     if status != "Succeeded":
         print(f"[ERROR] Batch STT 실패: {status_resp}")
-        return
-    files_resp = requests.get(f"{api_root}/transcriptions/{tid}/files", headers=headers, verify=False).json()
-    values = files_resp.get("values", [])
+        return None
+    return collect_batch(tid, wav_blob_path)
 
-    # json -> txt 변환 (포맷 통일)
-    def json2txt_bytes(data_bytes):
-        data = json.loads(data_bytes)
-        lines = []
-        for p in data.get("recognizedPhrases", []):
-            t = fmt(iso_to_sec(p["offset"]))
-            dur = iso_to_sec(p["duration"])
-            best = p["nBest"][0]
-            lines.append(f"[({t})] speaker-{p.get('speaker','?')} : {best['display'].strip()}  [{dur:.2f} s, {best['confidence']*100:.1f} %]")
-        return "\n".join(lines)
+# 완료된 Batch Transcription 작업 결과(json/txt)를 회의 폴더에 저장 (폴링/웹훅 완료 공통)
+#   - 반환: 저장한 blob 경로 목록 (실패시 None)
+def collect_batch(tid, wav_blob_path):
+    BLOB_CONTAINER_NAME = os.environ["BLOB_CONTAINER_NAME"]
+    blob_service = get_blob_service()
+    session = get_http_session()
+    api_root, headers = speech_api()
+    with api_call("speech.files"):
+        files_resp = session.get(f"{api_root}/transcriptions/{tid}/files", headers=headers, timeout=HTTP_TIMEOUTS).json()
+    values = files_resp.get("values", [])
 
     # 결과 파일(json/txt) blob에 업로드
     for f in values:
         url = f.get("links", {}).get("contentUrl")
         if not url or not f['name'].endswith('.json'):
             continue
-        data = requests.get(url, verify=False).content
+        with api_call("speech.result"):
+            data = session.get(url, timeout=HTTP_TIMEOUTS).content
+        add_bytes(read=len(data))
         meeting_dir = os.path.dirname(wav_blob_path)
         json_blob_path = f"{meeting_dir}/script_batch.json"
         txt_blob_path = f"{meeting_dir}/script_batch_extracted.txt"
         upload_blob(data, json_blob_path, blob_service, BLOB_CONTAINER_NAME)
-        upload_blob(json2txt_bytes(data), txt_blob_path, blob_service, BLOB_CONTAINER_NAME)
+        upload_blob(render_batch_txt(parse_batch_segments(data)), txt_blob_path, blob_service, BLOB_CONTAINER_NAME)  # json -> txt (포맷 통일)
         print(f"[OK] batch_script.json / script_batch_extracted.txt 저장 완료: {meeting_dir}")
-        break
+        return [json_blob_path, txt_blob_path]
+    print(f"[ERROR] Batch STT 결과 파일 없음: {tid}")
+    return None
+
+# Speech 서비스에 배치 완료 웹훅 등록 (Speech 리소스당 1회, BatchCallback 함수 URL 지정)
+#   - secret을 주면 서비스가 요청 본문 HMAC-SHA256 서명을 X-MicrosoftSpeechServices-Signature 헤더로 보냄
+def register_batch_webhook(callback_url, secret=None):
+    api_root, headers = speech_api()
+    body = {
+        "displayName": "aimeeting-batch-completion",
+        "webUrl": callback_url,
+        "events": {"transcriptionCompletion": True},
+        "description": "Batch transcription 완료시 BatchCallback 함수 호출",
+    }
+    if secret:
+        body["properties"] = {"secret": secret}
+    res = get_http_session().post(f"{api_root}/webhooks", headers=headers, json=body, timeout=HTTP_TIMEOUTS)
+    res.raise_for_status()
+    return res.json()
+
+# Azure Batch Transcription으로 화자분리+전사 실행 및 결과 저장 (등록 + 완료대기)
+def stt_batch(meeting_id, wav_blob_path, max_num_speakers=5, audio_sec=None):
+    tid = submit_batch(wav_blob_path, max_num_speakers)
+    if tid:
+        return wait_batch(tid, wav_blob_path, audio_sec=audio_sec)
+    return None
 
 import re
 
-# batch/gpt4otranscribe 청크별 스크립트를 LLM으로 병합, 최종 txt 저장 -> script_final.txt
-def merge(meeting_dir, blob_service, container_name, gpt_model="gpt-4o"):
-    # 오디오 청크 구간 구하기
-    wav_blob_path = f"{meeting_dir}/meeting_audio_raw.wav"
-    wav_bytes = blob_service.get_blob_client(container_name, wav_blob_path).download_blob().readall()
-    chunk_offsets = get_chunk_offsets(wav_bytes)
+SENTENCE_END = re.compile(r"[.?!。]\s+|\n")
+
+# text[pos] 근처 문장 경계 (forward=True면 pos 이후 첫 경계, 아니면 pos 이전 마지막 경계)
+def sentence_boundary(text, pos, forward):
+    pos = min(max(pos, 0), len(text))
+    if forward:
+        m = SENTENCE_END.search(text, pos)
+        return m.end() if m else len(text)
+    ends = [m.end() for m in SENTENCE_END.finditer(text, 0, pos)]
+    return ends[-1] if ends else 0
 
-    # 배치 전사 스크립트 청크별로 분할
-    batch_txt_path = f"{meeting_dir}/script_batch_extracted.txt"
-    batch_txt = blob_service.get_blob_client(container_name, batch_txt_path).download_blob().readall().decode("utf-8")
-    batch_chunks = split_batch_script_by_chunks(batch_txt, chunk_offsets)
+# 청크 한 개를 입력 토큰 avail 이하 조각들로 나눔 (발화구간 경계 기준)
+#   - txt2(gpt 전사문)는 시각 정보가 없으므로 조각의 txt1 글자수 비율 위치에서 문장 경계로 자르고, 앞뒤로 margin 비율만큼 더 포함
+#     (병합 규칙상 txt1 줄만 출력하므로 남는 txt2는 무시되고, 모자라면 문장이 누락되므로 넉넉하게 자름)
+def split_merge_unit(lines, line_tokens, gtxt, avail, margin):
+    b_tokens, g_tokens = sum(line_tokens), count_tokens(gtxt)
+    pieces = max(2, math.ceil((b_tokens + g_tokens * (1 + 2 * margin)) / max(1, avail)))
+    target = b_tokens / pieces
+    groups, current, used = [], [], 0
+    for j, n in enumerate(line_tokens):
+        if current and used + n > target and len(groups) < pieces - 1:
+            groups.append(current)
+            current, used = [], 0
+        current.append(j)
+        used += n
+    groups.append(current)
 
+    total_chars = sum(len(line) for line in lines) or 1
+    units, done_chars = [], 0
+    for group in groups:
+        chars = sum(len(lines[j]) for j in group)
+        lo = (done_chars / total_chars - margin) * len(gtxt)
+        hi = ((done_chars + chars) / total_chars + margin) * len(gtxt)
+        done_chars += chars
+        start = sentence_boundary(gtxt, int(lo), forward=False)
+        end = sentence_boundary(gtxt, int(hi), forward=True)
+        units.append((group, gtxt[start:end].strip()))
+    return units
+
+# 병합 요청 계획: 청크별 (배치 발화구간, gpt 전사문) 쌍을 입력 토큰 budget에 맞춰 묶거나 나눔 (로컬 토크나이저 기준)
+#   - 이어지는 작은 청크는 한 요청으로 묶고(왕복 횟수↓), budget을 넘는 청크는 발화구간 경계로 나눔(출력 잘림/지연 방지)
+#   - gpt 청크가 없는 청크는 LLM 없이 배치 결과를 그대로 쓰므로 단독 요청(txt2 "")
+#   - overhead: 프롬프트 템플릿/시스템 메시지 토큰 수, budget <= 0 이면 청크 쌍마다 1건 (기존 방식)
+#   - 반환: [{"chunks": [청크번호...], "segments": [발화구간 인덱스...], "txt2": str, "tokens": 예상 입력 토큰}]
+def plan_merge_requests(segs, chunk_offsets, gpt_chunks, budget=MERGE_REQUEST_TOKENS, overhead=0, margin=MERGE_TXT2_MARGIN):
+    avail = budget - overhead
+    units = []  # (청크번호, 발화구간 인덱스, txt2, 토큰 수)
+    for i, (start, end) in enumerate(chunk_offsets):
+        indices = segments_in_range(segs, start, end)
+        if not indices:
+            continue  # 배치 청크가 빈 경우는 건너뜀
+        gtxt = gpt_chunks[i].strip() if i < len(gpt_chunks) else ""
+        lines = [render_segment(segs, j) for j in indices]
+        line_tokens = [count_tokens(line) + 1 for line in lines]
+        tokens = sum(line_tokens) + count_tokens(gtxt)
+        if budget <= 0 or not gtxt or tokens <= avail:
+            units.append((i + 1, indices, gtxt, tokens))
+            continue
+        for group, piece in split_merge_unit(lines, line_tokens, gtxt, avail, margin):
+            units.append((i + 1, [indices[j] for j in group], piece,
+                          sum(line_tokens[j] for j in group) + count_tokens(piece)))
+
+    requests, current = [], None
+    for chunk, indices, gtxt, tokens in units:
+        joinable = (current is not None and budget > 0 and gtxt and current["txt2"]
+                    and current["tokens"] + tokens <= avail)
+        if not joinable:
+            current = {"chunks": [], "segments": [], "txt2": "", "tokens": 0}
+            requests.append(current)
+        if chunk not in current["chunks"]:
+            current["chunks"].append(chunk)
+        seen = set(current["segments"])  # 청크 경계에 걸친 발화구간은 한 요청 안에서 한 번만
+        current["segments"] += [j for j in indices if j not in seen]
+        current["txt2"] = f"{current['txt2']}\n{gtxt}".strip()
+        current["tokens"] += tokens
+    return requests
+
+# 정렬 병합(MERGE_MODE=align)에서 일치 비율이 낮은 발화만 LLM 병합 요청으로 묶음
+#   - 이어지는 저신뢰 발화는 한 요청으로 (입력 토큰 budget을 넘으면 나눔), txt2는 해당 발화에 정렬된 gpt 문장 + 앞뒤 발화 1개씩
+#   - 반환 형식은 plan_merge_requests와 같음
+def plan_fallback_requests(segs, low, aligned, chunk_offsets, budget=MERGE_REQUEST_TOKENS, overhead=0):
+    chunk_starts = [start for start, _ in chunk_offsets]
+    spans = []
+    for i in low:
+        if spans and spans[-1][-1] == i - 1:
+            spans[-1].append(i)
+        else:
+            spans.append([i])
+    requests = []
+    for span in spans:
+        pieces, current, used = [], [], 0
+        for i in span:
+            n = count_tokens(render_segment(segs, i)) + count_tokens(aligned.get(i, "")) + 1
+            if current and budget > 0 and used + n > budget - overhead:
+                pieces.append(current)
+                current, used = [], 0
+            current.append(i)
+            used += n
+        pieces.append(current)
+        for piece in pieces:
+            context = [piece[0] - 1] + piece + [piece[-1] + 1]
+            txt2 = " ".join(aligned[i] for i in context if i in aligned).strip()
+            chunks = sorted({max(1, bisect_right(chunk_starts, segs.offsets[i])) for i in piece})
+            tokens = sum(count_tokens(render_segment(segs, i)) + 1 for i in piece) + count_tokens(txt2)
+            requests.append({"chunks": chunks, "segments": piece, "txt2": txt2 if any(i in aligned for i in piece) else "",
+                             "tokens": tokens})
+    return requests
+
+# 정렬 병합 결과 조립: LLM으로 다시 병합한 발화는 그 결과로, 나머지는 정렬된 gpt 문장(없으면 배치 문장)으로 시간순 출력
+def assemble_aligned(segs, aligned, low, requests, merged_texts):
+    replaced = {req["segments"][0]: text for req, text in zip(requests, merged_texts)}
+    covered = {i for req in requests for i in req["segments"]}
+    low = set(low)
+    lines = []
+    for i in range(len(segs.texts)):
+        if i in replaced:
+            if replaced[i]:
+                lines.append(replaced[i])
+        elif i not in covered:
+            lines.append(render_segment(segs, i, aligned[i] if i in aligned and i not in low else None))
+    return lines
+
+# batch/gpt4otranscribe 청크별 스크립트를 LLM으로 병합, 최종 txt 저장 -> script_final.txt
+#   - 청크 쌍을 입력 토큰 MERGE_REQUEST_TOKENS 기준으로 묶거나 나눈 병합 요청(plan_merge_requests)을 workers개까지 동시에 보내고,
+#     결과는 요청(청크) 순서대로 이어붙임
+#   - MERGE_MODE=align: 단어 정렬로 병합하고 일치 비율이 낮은 발화만 LLM 요청 (align_segments, plan_fallback_requests)
+#   - 요청별 청크/지연시간/토큰/재시도 횟수 -> merge_stats.json
+#   - baseline: 화자/시간 기준이 되는 전사 (batch: script_batch.json, realtime: 클라이언트 실시간 전사 journal)
+def merge(meeting_dir, blob_service, container_name, gpt_model=LLM_MODEL, audio_file=None, workers=MERGE_WORKERS,
+          baseline="batch"):
+    # 오디오 청크 구간 구하기: gpt4otranscribe 단계가 저장한 chunk_plan.json(원본 시각 기준 경계) 우선
+    #   - 없으면 wav로 다시 계산 (get_chunk_offsets: SILENCE_TRIM_SEC는 경계에 영향 없어 무시,
+    #     OVERLAP_SEC > 0 이면 크기 단위 고정 구간이라 gpt4otranscribe 단계 청크와 다를 수 있음)
+    plan_blob = f"{meeting_dir}/chunk_plan.json"
+    if blob_service.get_blob_client(container=container_name, blob=plan_blob).exists():
+        plan = json.loads(download_blob_bytes(blob_service, container_name, plan_blob))
+        chunk_offsets = [(c["start"], c["end"]) for c in plan["chunks"]]
+    else:
+        if audio_file is None:
+            audio_file = download_meeting_audio(blob_service, container_name, meeting_dir)
+        chunk_offsets = get_chunk_offsets(audio_file)
+
+    # 배치 전사 결과(json)를 발화구간 배열로 파싱해 청크별로 분할 (txt 재파싱 없이)
+    if baseline == "realtime":
+        batch_segs = parse_realtime_segments(download_blob_bytes(blob_service, container_name, f"{meeting_dir}/{REALTIME_JOURNAL_FILE}"))
+    else:
+        batch_segs = parse_batch_segments(download_blob_bytes(blob_service, container_name, f"{meeting_dir}/script_batch.json"))
     # gpt-4o 청크 스크립트 정렬
     gpt_chunks_dir = f"{meeting_dir}/gpt4otranscribe_chunks"
     def chunk_sort_key(name):  # 청크 파일명에서 인덱스 추출
@@ -188,84 +585,269 @@ def merge(meeting_dir, blob_service, container_name, gpt_model="gpt-4o"):
         if b.name.endswith(".txt")
     ], key=chunk_sort_key)
 
+    # 청킹 없이 한 번에 전사한 경우(청크 한도 이하)는 전체 전사 결과가 청크 1개
+    single_blob = f"{meeting_dir}/script_gpt4otranscribe.txt"
+    if not txt_blobs and blob_service.get_blob_client(container=container_name, blob=single_blob).exists():
+        txt_blobs = [single_blob]
+
     gpt_chunks = [
-        blob_service.get_blob_client(container_name, name).download_blob().readall().decode("utf-8")
+        download_blob_bytes(blob_service, container_name, name).decode("utf-8")
         for name in txt_blobs
     ]
 
-    print(f"[DEBUG] batch_chunks={len(batch_chunks)}, gpt_chunks={len(gpt_chunks)}")
-    if len(batch_chunks) != len(gpt_chunks):
-        logging.warning(f"[WARN] 청크 개수 불일치: batch={len(batch_chunks)}, gpt={len(gpt_chunks)}")
+    print(f"[DEBUG] batch_chunks={len(chunk_offsets)}, gpt_chunks={len(gpt_chunks)}")
+    if len(chunk_offsets) != len(gpt_chunks):
+        logging.warning(f"[WARN] 청크 개수 불일치: batch={len(chunk_offsets)}, gpt={len(gpt_chunks)}")
 
     prompt_template = get_prompt_from_blob(blob_service, container_name, "prompt_merge.txt")
+    overhead = count_tokens(prompt_template.format(txt1="", txt2="")) + count_tokens(MERGE_SYSTEM_PROMPT)
+    if MERGE_MODE == "align":
+        t0 = time.perf_counter()
+        aligned, ratios = align_segments(batch_segs, chunk_offsets, gpt_chunks)
+        low = [i for i in sorted(ratios) if ratios[i] < ALIGN_MIN_RATIO]
+        requests = plan_fallback_requests(batch_segs, low, aligned, chunk_offsets, overhead=overhead)
+        logging.info(f"[INFO] 정렬 병합: 발화 {len(ratios)}개 중 저신뢰 {len(low)}개 -> LLM 요청 {len(requests)}건 "
+                     f"({time.perf_counter() - t0:.3f}s)")
+    else:
+        requests = plan_merge_requests(batch_segs, chunk_offsets, gpt_chunks, overhead=overhead)
+        logging.info(f"[INFO] 병합 요청 계획: 청크 {len(chunk_offsets)}개 -> 요청 {len(requests)}건 (한도 {MERGE_REQUEST_TOKENS} 토큰)")
 
     # 각 청크 쌍을 LLM에게 병합 요청하여 최종 스크립트 생성
-    client = AzureOpenAI(
-        api_version="2025-01-01-preview",
-        azure_endpoint=os.environ["OPENAI_ENDPOINT_URI"],
-        api_key=os.environ["OPENAI_ENDPOINT_KEY"],
-        http_client=httpx.Client(verify=False)
-    )
+    client = get_openai_client("2025-01-01-preview").with_options(max_retries=0)  # 재시도는 chat_with_retry에서 처리
 
-    final_lines = []
-    for i in range(len(batch_chunks)):
-        btxt = batch_chunks[i].strip()
-        gtxt = gpt_chunks[i].strip() if i < len(gpt_chunks) else ""
-        if not btxt:
-            continue  # 배치 청크가 빈 경우는 건너뜀
+    def merge_request(i):
+        req = requests[i]
+        btxt = render_batch_txt(batch_segs, req["segments"]).strip()
+        gtxt = req["txt2"]
         if not gtxt:
-            final_lines.append(btxt)  # gpt 청크가 없으면 배치 청크만 사용
-            print(f"[DEBUG] gpt 청크 없음, batch 청크 그대로 사용 (i={i})")
-            continue
+            print(f"[DEBUG] gpt 전사문 없음, batch 스크립트 그대로 사용 (청크 {req['chunks']})")
+            return btxt, None  # gpt 청크가 없으면 배치 청크만 사용
         prompt = prompt_template.format(txt1=btxt, txt2=gtxt)
-        logging.info(f"[INFO] 병합 요청: 청크 {i+1}/{len(batch_chunks)}")
-        rsp = client.chat.completions.create(
+        logging.info(f"[INFO] 병합 요청: {i+1}/{len(requests)} (청크 {req['chunks']}, 약 {req['tokens'] + overhead} 토큰)")
+        t0 = time.perf_counter()
+        rsp, retries = chat_with_retry(
+            client,
             model=gpt_model,
             messages=[
-                {"role": "system", "content": "[병합 규칙]에 따라 txt1의 전사문을 txt2의 문장으로 교체하세요."},
+                {"role": "system", "content": MERGE_SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
             ],
             temperature=0.25  # LLM의 결과 변동성 최소화
         )
-        merged_chunk = rsp.choices[0].message.content.strip()
-        final_lines.append(merged_chunk)
+        stat = {
+            "request": i + 1,
+            "chunks": req["chunks"],
+            "segments": len(req["segments"]),
+            "estimated_tokens": req["tokens"] + overhead,
+            "latency_sec": round(time.perf_counter() - t0, 3),
+            "retries": retries,
+            "prompt_tokens": rsp.usage.prompt_tokens if rsp.usage else None,
+            "completion_tokens": rsp.usage.completion_tokens if rsp.usage else None,
+        }
+        logging.info(f"[INFO] 병합 완료: 요청 {i+1} ({stat['latency_sec']}s, tokens={stat['prompt_tokens']}/{stat['completion_tokens']})")
+        return rsp.choices[0].message.content.strip(), stat
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        results = list(pool.map(propagate(merge_request), range(len(requests))))  # map은 입력(요청) 순서대로 결과 반환
+    if MERGE_MODE == "align":
+        final_lines = assemble_aligned(batch_segs, aligned, low, requests, [merged for merged, _ in results])
+    else:
+        final_lines = [merged for merged, _ in results if merged]
+    merge_stats = [stat for _, stat in results if stat]
 
     # 최종 스크립트 파일 저장
     final_script = "\n".join(final_lines).strip()
     final_script_path = f"{meeting_dir}/script_final.txt"
     upload_blob(final_script, final_script_path, blob_service, container_name)
     print(f"[OK] script_final.txt 저장 완료: {final_script_path}")
+    upload_blob(json.dumps(merge_stats, ensure_ascii=False, indent=2), f"{meeting_dir}/merge_stats.json", blob_service, container_name)
+    return [final_script_path]
+
+# 재전사할 구간: 신뢰도가 max_confidence 미만인 발화를 이어지는 것끼리(최대 max_sec) 묶고 앞뒤 pad_sec 여유
+#   - 여유는 이웃 발화 경계를 넘지 않음 (발화 단위로 잘라야 gpt 전사문을 발화별로 다시 나눌 수 있음)
+#   - 신뢰도를 알 수 없는 발화(nan, 실시간 journal에 신뢰도 없음)는 재전사하지 않음
+#   - 반환: [(시작초, 끝초, [발화구간 인덱스...]), ...]
+def low_confidence_spans(segs, max_confidence=RETRANSCRIBE_MAX_CONFIDENCE, pad_sec=RETRANSCRIBE_PAD_SEC,
+                         max_sec=RETRANSCRIBE_GROUP_SEC):
+    def end_of(i):
+        return segs.offsets[i] + segs.durations[i]
+
+    runs = []
+    for i in range(len(segs.texts)):
+        if math.isnan(segs.confidences[i]) or segs.confidences[i] >= max_confidence:
+            continue
+        if runs and runs[-1][-1] == i - 1 and end_of(i) - segs.offsets[runs[-1][0]] <= max_sec:
+            runs[-1].append(i)
+        else:
+            runs.append([i])
+    spans = []
+    for run in runs:
+        first, last = run[0], run[-1]
+        start, end = segs.offsets[first], max(end_of(i) for i in run)
+        prev_end = end_of(first - 1) if first > 0 else 0.0
+        next_start = segs.offsets[last + 1] if last + 1 < len(segs.texts) else float("inf")
+        spans.append((max(start - pad_sec, min(prev_end, start)), min(end + pad_sec, max(next_start, end)), run))
+    return spans
 
+# 재전사 구간을 요청 단위로 묶음 (구간 사이 무음 포함 max_sec 이하, 시간순)
+def group_spans(spans, max_sec=RETRANSCRIBE_GROUP_SEC, gap_sec=RETRANSCRIBE_GAP_SEC):
+    groups, used = [], 0.0
+    for span in spans:
+        length = span[1] - span[0]
+        if groups and used + gap_sec + length <= max_sec:
+            groups[-1].append(span)
+            used += gap_sec + length
+        else:
+            groups.append([span])
+            used = length
+    return groups
+
+# 선택 재전사(TRANSCRIBE_SCOPE=selective): 배치(또는 실시간) 전사에서 신뢰도가 낮은 발화 구간만 gpt-4o-transcribe로 다시 전사해 교체
+#   -> script_final.txt (merge와 같은 산출물이라 요약 단계는 그대로)
+#   - 구간들을 RETRANSCRIBE_GROUP_SEC 길이까지 무음을 사이에 두고 이어붙여 요청 수를 줄이고, 요청들은 workers개까지 동시에 전송
+#   - 요청별 전사문은 포함된 발화들의 배치 단어열과 정렬(align_words)해 발화별로 나눔 (배정된 단어가 없는 발화는 배치 문장 유지)
+#   - 요청이 실패하면 그 요청의 발화들은 기준 전사 문장 유지 (오류는 retranscribe_stats.json의 요청별 error에 기록)
+#   - 요청별 오디오 길이/지연 -> retranscribe_stats.json
+def retranscribe(meeting_dir, blob_service, container_name, audio_file=None, baseline="batch", workers=RETRANSCRIBE_WORKERS):
+    if baseline == "realtime":
+        segs = parse_realtime_segments(download_blob_bytes(blob_service, container_name, f"{meeting_dir}/{REALTIME_JOURNAL_FILE}"))
+    else:
+        segs = parse_batch_segments(download_blob_bytes(blob_service, container_name, f"{meeting_dir}/script_batch.json"))
+    groups = group_spans(low_confidence_spans(segs))
+    if groups and audio_file is None:
+        audio_file = open_meeting_audio(blob_service, container_name, meeting_dir)  # wav 원본이면 재전사 구간만 범위 읽기
+    info = read_wav_header(audio_file) if groups else None
+    read_lock = threading.Lock()
+
+    def transcribe_group(g):
+        spans = groups[g]
+        gap = bytes(int(RETRANSCRIBE_GAP_SEC * info.rate) * info.block_align)
+        parts = []
+        with read_lock:  # 여러 스레드가 같은 spool 파일을 공유
+            for start, end, _ in spans:
+                parts.append(read_wav_range(audio_file, info, int(start * info.rate), min(int(end * info.rate), info.frames))[44:])
+        pcm = gap.join(parts)
+        data, audio_format = encode_transcribe_chunk(wav_header(len(pcm), info.rate, info.channels, info.bits) + pcm)
+        first = spans[0][2][0]
+        prompt = segs.texts[first - 1][-PROMPT_CONTEXT_CHARS:] if first > 0 else ""  # 바로 앞 발화를 문맥으로
+        stat = {
+            "request": g + 1,
+            "segments": sum(len(run) for _, _, run in spans),
+            "audio_sec": round(len(pcm) / info.block_align / info.rate, 3),
+        }
+        t0 = time.perf_counter()
+        try:
+            txt = call_gpt4otranscribe(data, phrase_str=prompt, audio_format=audio_format).get("text", "")
+        except Exception as e:
+            # 요청 1건 실패로 병합 단계 전체를 실패시키지 않음 (해당 구간은 기준 전사 문장 유지)
+            stat.update(latency_sec=round(time.perf_counter() - t0, 3), error=str(e))
+            logging.error(f"[ERROR] 선택 재전사 요청 {g + 1} 실패 -> 기준 전사 문장 유지: {e}")
+            return {}, stat
+        stat["latency_sec"] = round(time.perf_counter() - t0, 3)
+        bwords = [(w, i) for _, _, run in spans for i in run for w, _ in segment_words(segs, i) if w]
+        assigned, _ = align_words(bwords, txt)
+        return {i: " ".join(words) for i, words in assigned.items()}, stat
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        results = list(pool.map(propagate(transcribe_group), range(len(groups))))
+    replaced = {i: text for texts, _ in results for i, text in texts.items()}
+    stats = [stat for _, stat in results]
+    low = sum(stat["segments"] for stat in stats)
+    sent_sec = sum(stat["audio_sec"] for stat in stats)
+    failed = sum(1 for stat in stats if "error" in stat)
+    unknown = sum(1 for c in segs.confidences if math.isnan(c))
+    logging.info(f"[INFO] 선택 재전사: 발화 {len(segs.texts)}개 중 저신뢰 {low}개(신뢰도 없음 {unknown}개 제외), "
+                 f"요청 {len(groups)}건(실패 {failed}건), 전송 오디오 {sent_sec:.0f}s")
+
+    final_script = "\n".join(render_segment(segs, i, replaced.get(i)) for i in range(len(segs.texts))).strip()
+    final_script_path = f"{meeting_dir}/script_final.txt"
+    upload_blob(final_script, final_script_path, blob_service, container_name)
+    print(f"[OK] script_final.txt 저장 완료 (선택 재전사): {final_script_path}")
+    upload_blob(json.dumps({"segments": len(segs.texts), "low_confidence_segments": low, "unknown_confidence_segments": unknown,
+                            "sent_sec": round(sent_sec, 3), "failed_requests": failed, "requests": stats}, ensure_ascii=False, indent=2),
+                f"{meeting_dir}/retranscribe_stats.json", blob_service, container_name)
+    return [final_script_path]
+
+# 병합 단계(script_final.txt) 실행 함수와 먼저 완료 기록돼야 하는 단계 (baseline: batch / realtime)
+def merge_step(baseline="batch"):
+    if TRANSCRIBE_SCOPE == "selective":
+        return retranscribe, ["batch"] if baseline == "batch" else []
+    return merge, ["gpt4otranscribe", "batch"] if baseline == "batch" else ["gpt4otranscribe"]
+
+
+# 긴 스크립트를 줄 단위로 SUMMARY_SECTION_TOKENS 이하 구간으로 나눠 구간별 요약을 동시에 생성 (구간 순서 유지)
+def summarize_sections(client, script, gpt_model=LLM_MODEL, section_tokens=SUMMARY_SECTION_TOKENS, workers=SUMMARY_WORKERS):
+    sections = ["\n".join(lines) for lines in pack_lines(script.splitlines(), section_tokens)]
+
+    def summarize_section(i):
+        rsp, _ = chat_with_retry(
+            client,
+            model=gpt_model,
+            messages=[
+                {"role": "system", "content": SECTION_SUMMARY_PROMPT.format(index=i + 1, total=len(sections))},
+                {"role": "user", "content": sections[i]}
+            ],
+            temperature=0.2
+        )
+        return rsp.choices[0].message.content.strip()
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        return list(pool.map(propagate(summarize_section), range(len(sections))))
 
 # 최종 스크립트 파일로 회의 요약 생성 및 저장 --> summary.txt
-def summarize(meeting_dir, blob_service, container_name, gpt_model="gpt-4o"):
-    final_script_blob = f"{meeting_dir}/script_final.txt"
-    summary_blob = f"{meeting_dir}/summary.txt"
+#   - 스크립트가 SUMMARY_MAP_THRESHOLD_TOKENS(로컬 토크나이저 기준)를 넘으면 구간별 요약 -> 통합 요약
+#   - script_name / summary_name: 요약할 스크립트와 저장할 요약 파일명 (초안 요약은 script_realtime.txt -> summary_draft.txt)
+#   - 반환: 저장한 blob 경로 목록 (실패시 None)
+def summarize(meeting_dir, blob_service, container_name, gpt_model=LLM_MODEL,
+              script_name="script_final.txt", summary_name="summary.txt"):
+    final_script_blob = f"{meeting_dir}/{script_name}"
+    summary_blob = f"{meeting_dir}/{summary_name}"
 
     try:
-        final_script = blob_service.get_blob_client(container=container_name, blob=final_script_blob).download_blob().readall().decode("utf-8")
+        final_script = download_blob_bytes(blob_service, container_name, final_script_blob).decode("utf-8")
         if not final_script.strip():
-            print("[WARN] script_final.txt가 비어있음 -> summary를 생성불가")
-            return
+            print(f"[WARN] {script_name}가 비어있음 -> summary를 생성불가")
+            return None
 
         prompt = get_prompt_from_blob(blob_service, container_name, "prompt_summarize.txt")
 
-        client = AzureOpenAI(
-            api_version="2025-01-01-preview",
-            azure_endpoint=os.environ["OPENAI_ENDPOINT_URI"],
-            api_key=os.environ["OPENAI_ENDPOINT_KEY"],
-            http_client=httpx.Client(verify=False)
-        )
-        response = client.chat.completions.create(
+        client = get_openai_client("2025-01-01-preview").with_options(max_retries=0)  # 재시도는 chat_with_retry에서 처리
+        n_tokens = count_tokens(final_script)
+        user_content = final_script
+        if n_tokens > SUMMARY_MAP_THRESHOLD_TOKENS:
+            # 긴 회의: 구간별 요약을 먼저 만들고(map) 그 요약들로 최종 요약(reduce)
+            section_summaries = summarize_sections(client, final_script, gpt_model)
+            print(f"[INFO] 스크립트 {n_tokens} 토큰 -> 구간 {len(section_summaries)}개 요약 후 통합")
+            user_content = "아래는 회의 스크립트를 시간 순서대로 구간별 요약한 내용입니다.\n\n" + "\n\n".join(
+                f"[구간 {i+1}]\n{text}" for i, text in enumerate(section_summaries)
+            )
+        response, _ = chat_with_retry(
+            client,
             model=gpt_model,
             messages=[
                 {"role": "system", "content": prompt},
-                {"role": "user", "content": final_script}
+                {"role": "user", "content": user_content}
             ],
             temperature=0.2
         )
         summary = response.choices[0].message.content.strip()
-        blob_service.get_blob_client(container=container_name, blob=summary_blob).upload_blob(summary.encode('utf-8'), overwrite=True)
-        print(f"[OK] summary.txt 저장 완료: {summary_blob}")
+        upload_blob(summary, summary_blob, blob_service, container_name, verbose=False)
+        print(f"[OK] {summary_name} 저장 완료: {summary_blob}")
+        return [summary_blob]
     except Exception as e:
         print(f"[ERROR] summary 생성 중 에러: {e}")
+        return None
+
+# 클라이언트 실시간 전사 journal로 초안 스크립트/요약 생성 -> script_realtime.txt, summary_draft.txt
+#   - 추가 전사 없이 요약 호출만 하므로 업로드 직후 몇 분 안에 초안 요약 제공 (최종 요약은 병합 후 summary.txt)
+#   - 반환: 저장한 blob 경로 목록 (journal이 비었거나 실패시 None)
+def draft_from_realtime(meeting_dir, blob_service, container_name, gpt_model=LLM_MODEL):
+    segs = parse_realtime_segments(download_blob_bytes(blob_service, container_name, f"{meeting_dir}/{REALTIME_JOURNAL_FILE}"))
+    if not segs.texts:
+        print("[WARN] 실시간 전사 journal이 비어있음 -> 초안 요약 생략")
+        return None
+    script_blob = f"{meeting_dir}/script_realtime.txt"
+    upload_blob(render_batch_txt(segs), script_blob, blob_service, container_name)
+    outputs = summarize(meeting_dir, blob_service, container_name, gpt_model,
+                        script_name="script_realtime.txt", summary_name="summary_draft.txt")
+    return [script_blob] + outputs if outputs else None
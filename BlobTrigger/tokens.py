@@ -0,0 +1,43 @@
+import os
+import logging
+import threading
+
+import tiktoken
+
+TOKENIZER_ENCODING = os.environ.get("TOKENIZER_ENCODING", "o200k_base")  # gpt-4o 계열 토크나이저
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+# 로컬 토크나이저(tiktoken) 로드 (프로세스당 1회). 인코딩 파일을 못 받는 환경이면 None
+def get_encoding():
+    global _encoding
+    with _encoding_lock:
+        if _encoding is None:
+            try:
+                _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+            except Exception as e:
+                logging.warning(f"[WARN] tiktoken 로드 실패, 근사 토큰수 사용: {e}")
+                _encoding = False
+        return _encoding or None
+
+# 텍스트 토큰 수 (토크나이저가 없으면 UTF-8 바이트수/3 근사 - 한국어 기준 보수적으로 큰 값)
+def count_tokens(text):
+    enc = get_encoding()
+    if enc is None:
+        return len(text.encode("utf-8")) // 3 + 1
+    return len(enc.encode(text, disallowed_special=()))
+
+# 줄 단위로 묶어 섹션당 budget 토큰 이하가 되도록 분할 (한 줄이 budget보다 크면 그 줄만 단독 섹션)
+def pack_lines(lines, budget):
+    sections, current, used = [], [], 0
+    for line in lines:
+        n = count_tokens(line) + 1  # 줄바꿈 몫
+        if current and used + n > budget:
+            sections.append(current)
+            current, used = [], 0
+        current.append(line)
+        used += n
+    if current:
+        sections.append(current)
+    return sections
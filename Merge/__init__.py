@@ -0,0 +1,10 @@
+import json
+import logging
+import azure.functions as func
+from ..BlobTrigger.queue_pipeline import handle_merge
+
+# pipeline-merge 큐 메시지({"meeting_dir", "run_id"})로 전사 2종 병합 -> 요약 큐로 넘김
+def main(msg: func.QueueMessage):
+    message = json.loads(msg.get_body().decode("utf-8"))
+    logging.info(f"[Merge] 병합 시작: {message['meeting_dir']}")
+    handle_merge(message)
@@ -0,0 +1,10 @@
+import json
+import logging
+import azure.functions as func
+from ..BlobTrigger.queue_pipeline import handle_summarize
+
+# pipeline-summarize 큐 메시지({"meeting_dir", "run_id"})로 최종 스크립트 요약
+def main(msg: func.QueueMessage):
+    message = json.loads(msg.get_body().decode("utf-8"))
+    logging.info(f"[Summarize] 요약 시작: {message['meeting_dir']}")
+    handle_summarize(message)
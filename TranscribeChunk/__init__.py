@@ -0,0 +1,11 @@
+import json
+import logging
+import azure.functions as func
+from ..BlobTrigger.queue_pipeline import handle_transcribe_chunk
+
+# transcribe-chunk 큐 메시지({"meeting_dir", "run_id", "index"})로 청크 1개 전사
+#   - 청크마다 메시지가 따로라 여러 인스턴스로 나눠 실행되고, 실패하면 이 청크만 재시도
+def main(msg: func.QueueMessage):
+    message = json.loads(msg.get_body().decode("utf-8"))
+    logging.info(f"[TranscribeChunk] 청크 전사 시작: {message['meeting_dir']} #{message['index'] + 1} (dequeue {msg.dequeue_count}회)")
+    handle_transcribe_chunk(message)
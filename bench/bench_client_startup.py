@@ -0,0 +1,91 @@
+"""
+    클라이언트 시작 시간 벤치마크: client/main.py의 모듈 import(첫 화면 전까지)에 걸리는 시간과 불러온 무거운 모듈 확인
+
+        - 새 프로세스에서 --repeat회 `import main` 시간 측정 → p50/p95
+        - 첫 화면 전에 startup.HEAVY_MODULES(sounddevice, Speech SDK, Storage SDK, numpy, soundfile)가 로드되면 실패 처리
+        - sounddevice가 설치된 PC면 입력 장치 확인(probe_input_devices) 시간도 측정
+        - --max-sec를 넘거나 무거운 모듈이 로드되면 종료코드 1 (CI/빌드 전 회귀 확인용)
+        - 실행: python bench/bench_client_startup.py [--repeat 5] [--max-sec 0.5]
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+CLIENT_DIR = os.path.join(os.path.dirname(BENCH_DIR), "client")
+
+CHILD_IMPORT = """
+import sys, time, json
+t0 = time.perf_counter()
+import main
+sec = time.perf_counter() - t0
+from startup import HEAVY_MODULES
+print(json.dumps({"import_sec": sec, "heavy": [m for m in HEAVY_MODULES if m in sys.modules]}))
+"""
+
+CHILD_DEVICES = """
+import time, json
+import sounddevice as sd
+from record import probe_input_devices
+t0 = time.perf_counter()
+devices = sd.query_devices()
+query_sec = time.perf_counter() - t0
+t0 = time.perf_counter()
+ok = probe_input_devices(sd, devices)
+print(json.dumps({"devices": len(devices), "inputs": len(ok), "query_sec": query_sec, "probe_sec": time.perf_counter() - t0}))
+"""
+
+def run_child(code):
+    """
+        client 폴더 기준 새 프로세스에서 코드 실행 후 마지막 줄 JSON 반환 (실패하면 None, 오류 마지막 줄 출력)
+    """
+    out = subprocess.run([sys.executable, "-c", code], cwd=CLIENT_DIR, capture_output=True, text=True,
+                         env=dict(os.environ, PYTHONPATH=CLIENT_DIR, PYTHONDONTWRITEBYTECODE="1"))
+    if out.returncode != 0:
+        print(f"[ERROR] {(out.stderr.strip().splitlines() or [''])[-1]}")
+        return None
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--max-sec", type=float, default=0.5, help="import 시간 p95 한도(초)")
+    parser.add_argument("--json", help="결과 저장 경로")
+    args = parser.parse_args()
+
+    runs = [r for r in (run_child(CHILD_IMPORT) for _ in range(args.repeat)) if r]
+    if not runs:
+        sys.exit(1)
+    secs = sorted(r["import_sec"] for r in runs)
+    heavy = sorted({m for r in runs for m in r["heavy"]})
+    result = {
+        "runs": len(runs),
+        "import_p50_sec": round(secs[len(secs) // 2], 3),
+        "import_p95_sec": round(secs[min(len(secs) - 1, int(len(secs) * 0.95))], 3),
+        "heavy_modules": heavy,
+    }
+    print(f"  import main: p50 {result['import_p50_sec']:.3f}s / p95 {result['import_p95_sec']:.3f}s ({len(runs)}회)"
+          + (f", 첫 화면 전 로드된 무거운 모듈: {heavy}" if heavy else ""))
+
+    try:
+        import sounddevice  # noqa: F401
+        devices = run_child(CHILD_DEVICES)
+    except (ImportError, OSError):
+        devices = None
+        print("  입력 장치 확인: sounddevice(PortAudio) 없음, 건너뜀")
+    if devices:
+        result["devices"] = devices
+        print(f"  입력 장치 확인: 장치 {devices['devices']}개 중 입력 {devices['inputs']}개, "
+              f"목록 {devices['query_sec']:.3f}s, 장치 확인 {devices['probe_sec']:.3f}s")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if heavy or result["import_p95_sec"] > args.max_sec:
+        print(f"[FAIL] 시작 시간 회귀 (한도 {args.max_sec}s, 무거운 모듈 {heavy or '없음'})")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
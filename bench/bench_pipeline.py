@@ -0,0 +1,225 @@
+"""
+    파이프라인 오프라인 벤치마크: BlobTrigger.main 전체를 가짜 Blob/OpenAI/Speech 서비스로 실행
+
+        - 합성 wav(기본 10/30/60/120분)마다 별도 프로세스에서 --repeat회 실행해
+          처리량(오디오 초/실행 초), 실행시간 p50/p95, 단계별 시간, API 지연 p50/p95, 최대 RSS(MB) 비교
+        - 서비스 지연은 실제 값 기준 모델에 --time-scale을 곱해 sleep (기본 0.01 = 100배 축소)
+        - 청킹/동시성/캐시 설정 비교는 --env KEY=VALUE (예: --env GPT4O_TRANSCRIBE_WORKERS=8)
+        - --env PIPELINE_MODE=queue: 단계 큐를 메모리 큐로 대신해 --queue-workers개 스레드로 처리 (함수 인스턴스 수 흉내)
+        - 실행: python bench/bench_pipeline.py [--minutes 10,30,60,120] [--repeat 3] [--json 결과.json]
+"""
+import os
+import sys
+import json
+import time
+import re
+import base64
+import argparse
+import tempfile
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+from bench_wav_chunker import make_synthetic_wav, peak_rss_mb  # noqa: E402
+
+CONTAINER = "meeting"
+MEETING_DIR = "bench_meeting"
+PROMPT_MERGE = "[병합 규칙] txt1의 화자/시간 줄을 유지하고 문장만 txt2로 교체\n\n[txt1]\n{txt1}\n\n[txt2]\n{txt2}\n"
+PROMPT_SUMMARIZE = "회의 스크립트를 읽고 안건, 결정사항, 후속 조치를 요약하세요."
+
+def bench_env(time_scale, overrides):
+    """
+        가짜 서비스용 환경변수 (BlobTrigger 모듈 상수가 import 시점에 읽으므로 import 전에 설정)
+    """
+    env = {
+        "BLOB_ACCOUNT_NAME": "benchaccount",
+        "BLOB_ACCOUNT_KEY": base64.b64encode(b"bench-account-key").decode(),
+        "BLOB_CONTAINER_NAME": CONTAINER,
+        "SPEECH_REGION": "bench",
+        "SPEECH_KEY": "bench",
+        "OPENAI_ENDPOINT_URI": "https://fake-openai",
+        "OPENAI_ENDPOINT_KEY": "bench",
+        # 배치 상태조회 간격/추정도 지연 축소 비율에 맞춤
+        "BATCH_RTF_ESTIMATE": str(0.1 * time_scale),
+        "BATCH_POLL_MIN_SEC": str(5 * time_scale),
+        "BATCH_POLL_MAX_SEC": str(60 * time_scale),
+    }
+    env.update(overrides)
+    return env
+
+def run_child(args):
+    """
+        하위 프로세스에서 파이프라인 1회 실행 후 결과를 JSON 한 줄로 출력
+    """
+    os.environ.update(bench_env(args.time_scale, dict(kv.split("=", 1) for kv in args.env)))
+    import BlobTrigger
+    from BlobTrigger.clients import set_client
+    from BlobTrigger import queues, queue_pipeline
+    from fake_services import (
+        FakeBlobService, FakeOpenAI, FakeSpeechSession, FakeInputStream, FakeQueues, Latency, fake_realtime_journal
+    )
+
+    ts = args.time_scale
+    # queue 모드는 청크 오디오를 TranscribeChunk가 다시 읽으므로 보관
+    discard = None if queues.PIPELINE_MODE == "queue" else r"gpt4otranscribe_chunks/.*\.(wav|flac|ogg)$"
+    blob_service = FakeBlobService(latency=Latency(0.02, 0.01, ts), discard=discard)
+    openai_client = FakeOpenAI(
+        transcribe_latency=Latency(1.0, 0.05, ts),  # 호출당 1초 + 오디오 1초당 50ms
+        chat_latency=Latency(1.0, 0.02, ts),        # 호출당 1초 + 출력 토큰당 20ms
+        fail_rate=args.fail_rate,
+    )
+    speech = FakeSpeechSession(blob_service, CONTAINER, rtf=0.1, time_scale=ts,
+                               request_latency=Latency(0.1, 0, ts), fail_rate=args.batch_fail_rate)
+    set_client("blob_service", blob_service)
+    set_client("http_session", speech)
+    for api_version in ("2025-03-01-preview", "2025-01-01-preview"):
+        set_client(("openai", api_version), openai_client)
+    fake_queues = FakeQueues()
+    handlers = {
+        queues.QUEUE_TRANSCRIBE_CHUNK: queue_pipeline.handle_transcribe_chunk,
+        queues.QUEUE_BATCH_POLL: queue_pipeline.handle_batch_poll,
+        queues.QUEUE_MERGE: queue_pipeline.handle_merge,
+        queues.QUEUE_SUMMARIZE: queue_pipeline.handle_summarize,
+    }
+    for name in handlers:
+        set_client(("queue", name), fake_queues.client(name))
+
+    wav_size = os.path.getsize(args.wav)
+    audio_sec = (wav_size - 44) / (16000 * 2)
+    wav_blob = f"{MEETING_DIR}/meeting_audio_raw.wav"
+    blob_service.put(CONTAINER, "prompt_merge.txt", PROMPT_MERGE)
+    blob_service.put(CONTAINER, "prompt_summarize.txt", PROMPT_SUMMARIZE)
+    if args.realtime_journal:
+        blob_service.put(CONTAINER, f"{MEETING_DIR}/script_realtime.jsonl", fake_realtime_journal(audio_sec))
+    blob_service.put_file(CONTAINER, wav_blob, args.wav)  # 원본 wav는 메모리에 올리지 않고 다시 읽을 때만 파일에서 읽음
+    blob_service.put(CONTAINER, f"{MEETING_DIR}/meeting_metadata.json", json.dumps({
+        "num_participants": 3,
+        "wav_metadata": {"samplerate": 16000, "duration_sec": audio_sec, "size_MB": round(wav_size / (1024 * 1024), 2)},
+    }))
+
+    base_rss = peak_rss_mb()
+    stream = FakeInputStream(args.wav, f"{CONTAINER}/{wav_blob}")
+    t0 = time.perf_counter()
+    BlobTrigger.main(stream)
+    stream.close()
+    if queues.PIPELINE_MODE == "queue":
+        fake_queues.run(handlers, workers=args.queue_workers)
+    wall = time.perf_counter() - t0
+
+    # metrics.json + (queue 모드) 단계 함수별 metrics_*.json, 청크별 단계는 가장 오래 걸린 청크 기준으로 묶음
+    stages, stage_walls = [], {}
+    for (container, name), data in sorted(blob_service.store.items()):
+        if container == CONTAINER and re.fullmatch(rf"{MEETING_DIR}/metrics(_\w+)?\.json", name):
+            stages += json.loads(data).get("stages", [])
+    for stage in stages:
+        key = re.sub(r"_\d+$", "", stage["stage"])
+        stage_walls[key] = max(stage_walls.get(key, 0), stage["wall_sec"])
+    api_latencies = {}
+    for stage in stages:
+        for name, api in stage["apis"].items():
+            a = api_latencies.setdefault(name, {"calls": 0, "retries": 0, "p50": [], "p95": []})
+            a["calls"] += api["calls"]
+            a["retries"] += api["retries"]
+            a["p50"].append(api["latency_sec"]["p50"])
+            a["p95"].append(api["latency_sec"]["p95"])
+    print(json.dumps({
+        "audio_sec": round(audio_sec, 1),
+        "wall_sec": round(wall, 3),
+        "throughput": round(audio_sec / wall, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "base_rss_mb": round(base_rss, 1),
+        "ok": blob_service.get(CONTAINER, f"{MEETING_DIR}/summary.txt") is not None,
+        "draft": blob_service.get(CONTAINER, f"{MEETING_DIR}/summary_draft.txt") is not None,
+        "stages": stage_walls,
+        "queue_calls": fake_queues.calls,
+        "poison": len(fake_queues.poison),
+        "apis": {
+            name: {"calls": a["calls"], "retries": a["retries"],
+                   "p50": max(a["p50"]), "p95": max(a["p95"])}  # 단계별 값 중 큰 쪽
+            for name, a in api_latencies.items()
+        },
+    }, ensure_ascii=False))
+
+def summarize_runs(minutes, runs):
+    """
+        같은 길이 반복 실행 결과 요약 (실행시간 p50/p95, 처리량 중앙값, 최대 RSS 최댓값)
+    """
+    from BlobTrigger.metrics import percentile
+    walls = [r["wall_sec"] for r in runs]
+    return {
+        "minutes": minutes,
+        "runs": len(runs),
+        "ok": all(r["ok"] for r in runs),
+        "wall_p50": percentile(walls, 50),
+        "wall_p95": percentile(walls, 95),
+        "throughput_p50": percentile([r["throughput"] for r in runs], 50),
+        "peak_rss_mb": max(r["peak_rss_mb"] for r in runs),
+        "stages": runs[-1]["stages"],
+        "apis": runs[-1]["apis"],
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--minutes", default="10,30,60,120", help="합성 wav 길이(분) 목록")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--time-scale", type=float, default=0.01, help="서비스 지연 축소 비율")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="chat 호출 429 비율")
+    parser.add_argument("--batch-fail-rate", type=float, default=0.0, help="배치 작업 Failed 비율")
+    parser.add_argument("--realtime-journal", action="store_true", help="클라이언트 실시간 전사 journal도 함께 업로드")
+    parser.add_argument("--queue-workers", type=int, default=8, help="queue 모드 동시 처리 메시지 수")
+    parser.add_argument("--env", action="append", default=[], help="파이프라인 설정 덮어쓰기 KEY=VALUE")
+    parser.add_argument("--json", help="결과 저장 경로 (CI 비교용)")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--wav", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    child_args = ["--time-scale", str(args.time_scale), "--fail-rate", str(args.fail_rate),
+                  "--batch-fail-rate", str(args.batch_fail_rate), "--queue-workers", str(args.queue_workers)]
+    if args.realtime_journal:
+        child_args.append("--realtime-journal")
+    for kv in args.env:
+        child_args += ["--env", kv]
+
+    results = []
+    for minutes in [float(m) for m in args.minutes.split(",")]:
+        fd, wav_path = tempfile.mkstemp(suffix=".wav")
+        os.close(fd)
+        try:
+            make_synthetic_wav(wav_path, minutes / 60)
+            runs = []
+            for _ in range(args.repeat):
+                out = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--child", "--wav", wav_path] + child_args,
+                    capture_output=True, text=True
+                )
+                if out.returncode != 0:
+                    print(f"[ERROR] {minutes:g}분 실행 실패: {out.stderr.strip().splitlines()[-1:]}")
+                    continue
+                runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+            if not runs:
+                continue
+            r = summarize_runs(minutes, runs)
+            results.append(r)
+            print(f"  {minutes:>5g}분: 실행 p50 {r['wall_p50']:7.2f}s / p95 {r['wall_p95']:7.2f}s, "
+                  f"처리량 {r['throughput_p50']:8.1f} 오디오초/초, peak RSS {r['peak_rss_mb']:7.1f} MB"
+                  + ("" if r["ok"] else "  [요약 없음]"))
+            print("         단계: " + ", ".join(f"{k} {v:.2f}s" for k, v in r["stages"].items()))
+            print("         API : " + ", ".join(
+                f"{k} x{v['calls']} p50 {v['p50']:.2f}s p95 {v['p95']:.2f}s" + (f" (재시도 {v['retries']})" if v["retries"] else "")
+                for k, v in r["apis"].items()))
+        finally:
+            os.remove(wav_path)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"time_scale": args.time_scale, "env": args.env, "results": results}, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+    전사 엔진 처리량 오프라인 벤치마크: 같은 합성 오디오를 STT_ENGINE별로 call_gpt4otranscribe에 넣어 비교
+
+        - 합성 wav(--minutes)를 --chunk-sec초 청크로 나눠 TRANSCRIBE_AUDIO_FORMAT으로 인코딩한 뒤 --workers개 스레드로 동시 전사
+        - 엔진마다 별도 프로세스에서 실행: 처리량(오디오 초/실행 초), 코어당 처리량, CPU 1초당 오디오 초, 최대 RSS(MB)
+        - openai: 가짜 OpenAI 클라이언트(호출당 1초 + 오디오 1초당 50ms 지연 × --time-scale, 기본 1.0 = 실제 지연 기준)
+        - local : faster-whisper 설치와 모델(LOCAL_STT_MODEL, 모델명이면 HF 캐시에 미리 받아두거나 변환된 폴더 경로)이 있어야 실행
+                  faster-whisper가 없으면 건너뜀(SKIP), 그 밖의 엔진 오류는 실패(FAIL, 종료코드 1)
+                  합성 신호는 말소리가 아니므로 VAD를 끄고(LOCAL_STT_VAD=false) 모든 구간을 디코딩한 값으로 측정
+        - 코어 수: local은 프로세스 × 스레드(최대 CPU 수), openai는 1 (응답 대기뿐이라 클라이언트 CPU는 거의 안 씀)
+        - 실행: python bench/bench_stt_engines.py [--engines openai,local] [--minutes 10] [--env LOCAL_STT_PROCESSES=4]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import importlib.util
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+from bench_wav_chunker import make_synthetic_wav, peak_rss_mb  # noqa: E402
+
+def cpu_sec():
+    """
+        현재 프로세스 + 종료된 자식 프로세스(로컬 엔진 워커)의 CPU 사용 시간(초)
+    """
+    import resource
+    total = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total
+
+def run_child(args):
+    """
+        하위 프로세스에서 엔진 1개로 전체 청크 전사 후 결과를 JSON 한 줄로 출력
+    """
+    os.environ.update({
+        "STT_ENGINE": args.engine,
+        "OPENAI_ENDPOINT_URI": "https://fake-openai",
+        "OPENAI_ENDPOINT_KEY": "bench",
+        "LOCAL_STT_VAD": "false",
+    })
+    os.environ.update(dict(kv.split("=", 1) for kv in args.env))
+    from BlobTrigger.clients import set_client
+    from BlobTrigger.audio_processing import read_wav_header, chunk_frame_ranges, read_wav_range, encode_transcribe_chunk
+    from BlobTrigger.stt_engines import get_stt_engine, LocalWhisperEngine
+    from BlobTrigger.stt_utils import call_gpt4otranscribe
+    from fake_services import FakeOpenAI, Latency
+
+    set_client(("openai", "2025-03-01-preview"), FakeOpenAI(transcribe_latency=Latency(1.0, 0.05, args.time_scale)))
+    with open(args.wav, "rb") as f:
+        info = read_wav_header(f)
+        chunk_bytes = int(args.chunk_sec * info.rate) * info.block_align
+        chunks = [encode_transcribe_chunk(read_wav_range(f, info, s, e)) for s, e in chunk_frame_ranges(info, chunk_bytes)]
+    audio_sec = info.frames / info.rate
+
+    engine = get_stt_engine()
+    if isinstance(engine, LocalWhisperEngine) and importlib.util.find_spec("faster_whisper") is None:
+        print(json.dumps({"engine": args.engine, "skipped": "faster-whisper 미설치 (pip install faster-whisper)"}, ensure_ascii=False))
+        return
+    t0 = time.perf_counter()
+    if isinstance(engine, LocalWhisperEngine):
+        engine.warmup()  # 워커 프로세스 시작 + 모델 로드는 처리량에서 제외하고 따로 기록
+        cores = min(os.cpu_count() or 1, engine.processes * engine.cpu_threads)
+    else:
+        cores = 1
+    load_sec = time.perf_counter() - t0
+
+    cpu0 = cpu_sec()
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as ex:
+        texts = list(ex.map(lambda c: call_gpt4otranscribe(c[0], audio_format=c[1]).get("text", ""), chunks))
+    wall = time.perf_counter() - t0
+    if isinstance(engine, LocalWhisperEngine):
+        engine.close()  # 워커 프로세스를 종료시켜야 RUSAGE_CHILDREN에 CPU 시간이 잡힘
+    used_cpu = cpu_sec() - cpu0
+
+    print(json.dumps({
+        "engine": args.engine,
+        "audio_sec": round(audio_sec, 1),
+        "chunks": len(chunks),
+        "load_sec": round(load_sec, 3),
+        "wall_sec": round(wall, 3),
+        "cores": cores,
+        "throughput": round(audio_sec / wall, 2),
+        "throughput_per_core": round(audio_sec / wall / cores, 2),
+        "audio_sec_per_cpu_sec": round(audio_sec / used_cpu, 1) if used_cpu else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "text_chars": sum(len(t) for t in texts),
+    }, ensure_ascii=False))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--engines", default="openai,local", help="비교할 STT_ENGINE 목록")
+    parser.add_argument("--minutes", type=float, default=10, help="합성 wav 길이(분)")
+    parser.add_argument("--chunk-sec", type=float, default=300, help="전사 요청 1건의 오디오 길이(초)")
+    parser.add_argument("--workers", type=int, default=4, help="동시 전사 요청 수 (GPT4O_TRANSCRIBE_WORKERS)")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="가짜 API 지연 축소 비율")
+    parser.add_argument("--env", action="append", default=[], help="엔진 설정 덮어쓰기 KEY=VALUE")
+    parser.add_argument("--json", help="결과 저장 경로")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--engine", help=argparse.SUPPRESS)
+    parser.add_argument("--wav", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    child_args = ["--chunk-sec", str(args.chunk_sec), "--workers", str(args.workers), "--time-scale", str(args.time_scale)]
+    for kv in args.env:
+        child_args += ["--env", kv]
+
+    results, failed = [], []
+    fd, wav_path = tempfile.mkstemp(suffix=".wav")
+    os.close(fd)
+    try:
+        make_synthetic_wav(wav_path, args.minutes / 60)
+        for engine in args.engines.split(","):
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", "--engine", engine, "--wav", wav_path] + child_args,
+                capture_output=True, text=True
+            )
+            if out.returncode != 0:
+                failed.append(engine)
+                print(f"[FAIL] {engine}: {(out.stderr.strip().splitlines() or [''])[-1]}")
+                continue
+            r = json.loads(out.stdout.strip().splitlines()[-1])
+            if r.get("skipped"):
+                print(f"[SKIP] {engine}: {r['skipped']}")
+                continue
+            results.append(r)
+            print(f"  {engine:>7}: {r['audio_sec']:g}초/{r['chunks']}청크, 실행 {r['wall_sec']:7.2f}s (준비 {r['load_sec']:.2f}s), "
+                  f"처리량 {r['throughput']:7.2f} 오디오초/초, 코어당 {r['throughput_per_core']:7.2f} ({r['cores']}코어), "
+                  f"CPU 1초당 {r['audio_sec_per_cpu_sec']} 오디오초, peak RSS {r['peak_rss_mb']:7.1f} MB")
+    finally:
+        os.remove(wav_path)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"minutes": args.minutes, "env": args.env, "results": results}, f, ensure_ascii=False, indent=2)
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
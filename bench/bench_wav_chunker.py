@@ -0,0 +1,142 @@
+"""
+    wav 청킹 벤치마크: 기존 pydub 디코딩 방식 vs 헤더 기반 바이트범위 청커
+
+        - 합성 16kHz/16bit/mono wav(기본 2시간)를 임시파일로 만들고, 방식별로 별도 프로세스에서 실행해
+          청킹 + 오프셋 계산 시간과 최대 RSS(MB)를 비교
+        - 실행: python bench/bench_wav_chunker.py [--hours 2] [--wav 경로]
+        - pydub은 비교 기준으로만 쓰므로 함수앱 requirements.txt에는 없음 (pip install pydub 후 실행)
+"""
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import importlib.util
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+RATE = 16000
+MAX_SIZE_MB = 15
+CHUNK_SIZE_BYTES = MAX_SIZE_MB * 1024 * 1024
+
+def peak_rss_mb():
+    """
+        현재 프로세스의 최대 RSS(MB)
+    """
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def make_synthetic_wav(path, hours):
+    """
+        1초 단위 패턴 신호로 합성 wav 생성 (메모리에 전체를 올리지 않고 순차 기록)
+    """
+    import wave
+    import struct
+    import math
+    sec_frames = b"".join(struct.pack("<h", int(8000 * math.sin(2 * math.pi * 220 * i / RATE))) for i in range(RATE))
+    with wave.open(path, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(RATE)
+        for _ in range(int(hours * 3600)):
+            w.writeframes(sec_frames)
+
+def run_pydub(wav_path):
+    """
+        기존 방식: 전체 디코딩 후 구간마다 export (청킹), 오프셋 계산을 위해 한 번 더 디코딩
+    """
+    from pydub import AudioSegment
+    with open(wav_path, "rb") as f:
+        wav_bytes = f.read()
+    audio = AudioSegment.from_file(io.BytesIO(wav_bytes), format="wav")
+    total_ms = len(audio)
+    chunk_ms = int(CHUNK_SIZE_BYTES / (RATE * 2) * 1000)
+    n_chunks = 0
+    start = 0
+    while start < total_ms:
+        end = min(start + chunk_ms, total_ms)
+        buf = io.BytesIO()
+        audio[start:end].export(buf, format="wav")
+        n_chunks += 1
+        start = end
+    del audio
+    audio = AudioSegment.from_file(io.BytesIO(wav_bytes), format="wav")
+    offsets = [(s / 1000, min(s + chunk_ms, len(audio)) / 1000) for s in range(0, len(audio), chunk_ms)]
+    return n_chunks, len(offsets)
+
+def run_header(wav_path):
+    """
+        신규 방식: 파일 핸들에서 헤더만 읽어 구간을 정하고, 청크마다 해당 바이트 범위만 읽음
+    """
+    from BlobTrigger.audio_processing import iter_wav_chunks, get_chunk_offsets
+    with open(wav_path, "rb") as f:
+        n_chunks = sum(1 for _ in iter_wav_chunks(f, CHUNK_SIZE_BYTES))
+        offsets = get_chunk_offsets(f, CHUNK_SIZE_BYTES)
+    return n_chunks, len(offsets)
+
+METHODS = {"pydub": run_pydub, "header": run_header}
+
+def run_child(method, wav_path):
+    """
+        하위 프로세스에서 방식 하나만 실행하고 결과를 JSON 한 줄로 출력
+            - BlobTrigger 모듈 import 비용은 미리 지불하고, import 직후 RSS를 기준선으로 함께 기록 (pydub은 run_pydub 안에서만 import)
+    """
+    import BlobTrigger.audio_processing  # noqa: F401
+    base_rss = peak_rss_mb()
+    t0 = time.perf_counter()
+    n_chunks, n_offsets = METHODS[method](wav_path)
+    print(json.dumps({
+        "method": method,
+        "sec": round(time.perf_counter() - t0, 3),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "base_rss_mb": round(base_rss, 1),
+        "chunks": n_chunks,
+        "offsets": n_offsets,
+    }))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hours", type=float, default=2.0)
+    parser.add_argument("--wav", help="기존 wav 파일 사용 (없으면 합성 파일 생성)")
+    parser.add_argument("--child", choices=list(METHODS), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.wav)
+        return
+
+    tmp_path = None
+    wav_path = args.wav
+    if not wav_path:
+        fd, tmp_path = tempfile.mkstemp(suffix=".wav")
+        os.close(fd)
+        print(f"[INFO] 합성 wav 생성 중 ({args.hours}시간)...", flush=True)
+        make_synthetic_wav(tmp_path, args.hours)
+        wav_path = tmp_path
+    try:
+        print(f"[INFO] 대상 파일: {wav_path} ({os.path.getsize(wav_path) / (1024 * 1024):.1f} MB)")
+        for method in METHODS:
+            if method == "pydub" and importlib.util.find_spec("pydub") is None:
+                print("[SKIP] pydub 미설치 -> 기존 방식 비교 생략 (pip install pydub 후 다시 실행)")
+                continue
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", method, "--wav", wav_path],
+                capture_output=True, text=True
+            )
+            if out.returncode != 0:
+                print(f"[ERROR] {method} 실패: {out.stderr.strip().splitlines()[-1:]}")
+                continue
+            r = json.loads(out.stdout.strip().splitlines()[-1])
+            print(f"  {r['method']:>6}: {r['sec']:8.3f} s, peak RSS {r['peak_rss_mb']:8.1f} MB "
+                  f"(import 후 {r['base_rss_mb']:.1f} MB), 청크 {r['chunks']}개")
+    finally:
+        if tmp_path:
+            os.remove(tmp_path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,409 @@
+"""
+    오프라인 벤치마크용 가짜 서비스 (Blob / Azure OpenAI / Speech batch REST)
+
+        - 실제 SDK가 호출하는 메서드만 흉내내며, 지연시간은 time_scale을 곱해 실제 sleep
+        - BlobTrigger.clients.set_client()로 클라이언트 저장소에 넣어 파이프라인 코드를 그대로 실행
+"""
+import io
+import os
+import re
+import json
+import time
+import random
+import threading
+from types import SimpleNamespace
+from urllib.parse import urlparse
+
+import heapq
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import httpx
+import soundfile as sf
+from openai import RateLimitError
+from azure.core.exceptions import ResourceExistsError
+
+PCM_BYTES_PER_SEC = 16000 * 2  # 16kHz/16bit/mono
+
+class Latency:
+    """
+        지연시간 모델: base + per_unit × 단위수 (초), time_scale로 전체 축소/확대
+    """
+    def __init__(self, base=0.0, per_unit=0.0, time_scale=1.0):
+        self.base = base
+        self.per_unit = per_unit
+        self.time_scale = time_scale
+
+    def sleep(self, units=0):
+        delay = (self.base + self.per_unit * units) * self.time_scale
+        if delay > 0:
+            time.sleep(delay)
+
+# ---------------------------------------------------------------- Blob (Azurite 대용, 메모리 저장)
+
+class FakeDownloader:
+    def __init__(self, data):
+        self.data = data
+
+    def readall(self):
+        return self.data
+
+    def readinto(self, stream):
+        stream.write(self.data)
+        return len(self.data)
+
+class FakeBlobClient:
+    def __init__(self, service, container, name):
+        self.service = service
+        self.container = container
+        self.name = name
+
+    def upload_blob(self, data, overwrite=False, **kwargs):
+        if hasattr(data, "read"):
+            data = data.read()
+        data = bytes(data)
+        self.service.latency.sleep(len(data) / (1024 * 1024))
+        with self.service.lock:
+            if not overwrite and (self.container, self.name) in self.service.store:
+                raise ResourceExistsError(f"blob 있음: {self.container}/{self.name}")
+            keep = not (self.service.discard and re.search(self.service.discard, self.name))
+            self.service.store[(self.container, self.name)] = data if keep else len(data)
+
+    def delete_blob(self, **kwargs):
+        with self.service.lock:
+            self.service.store.pop((self.container, self.name), None)
+
+    def download_blob(self, offset=None, length=None, **kwargs):
+        with self.service.lock:
+            data = self.service.store.get((self.container, self.name))
+            path = self.service.files.get((self.container, self.name))
+        if path is not None:
+            with open(path, "rb") as f:
+                f.seek(offset or 0)
+                data = f.read(length if length is not None else -1)
+            self.service.latency.sleep(len(data) / (1024 * 1024))
+            return FakeDownloader(data)
+        if data is None:
+            raise FileNotFoundError(f"blob 없음: {self.container}/{self.name}")
+        if isinstance(data, int):
+            raise RuntimeError(f"내용을 보관하지 않은 blob: {self.container}/{self.name}")
+        if offset is not None:
+            data = data[offset:offset + length if length is not None else None]
+        self.service.latency.sleep(len(data) / (1024 * 1024))
+        return FakeDownloader(data)
+
+    def exists(self):
+        with self.service.lock:
+            return (self.container, self.name) in self.service.store
+
+    def get_blob_properties(self, **kwargs):
+        return SimpleNamespace(size=self.service.size(self.container, self.name))
+
+class FakeContainerClient:
+    def __init__(self, service, container):
+        self.service = service
+        self.container = container
+
+    def list_blobs(self, name_starts_with=""):
+        with self.service.lock:
+            names = sorted(n for c, n in self.service.store if c == self.container and n.startswith(name_starts_with))
+        return [SimpleNamespace(name=n) for n in names]
+
+class FakeBlobService:
+    """
+        BlobServiceClient 대용: 컨테이너/blob 이름 -> bytes 메모리 저장
+            - latency: 호출당 기본 지연 + MB당 지연
+            - discard: 이름이 이 정규식에 맞는 blob은 크기만 기록 (청크 wav 등 다시 읽지 않는 대용량 산출물이
+              벤치마크 프로세스 메모리를 차지하지 않도록)
+            - put_file: 로컬 파일을 blob으로 등록 (내용은 메모리에 올리지 않고 다운로드/범위 읽기 때 파일에서 읽음)
+    """
+    def __init__(self, latency=None, discard=None):
+        self.store = {}
+        self.files = {}
+        self.lock = threading.Lock()
+        self.latency = latency or Latency()
+        self.discard = discard
+
+    def get_blob_client(self, container, blob):
+        return FakeBlobClient(self, container, blob)
+
+    def get_container_client(self, container):
+        return FakeContainerClient(self, container)
+
+    def put(self, container, name, data):
+        self.store[(container, name)] = data.encode("utf-8") if isinstance(data, str) else data
+
+    def put_size(self, container, name, size):
+        self.store[(container, name)] = size
+
+    def put_file(self, container, name, path):
+        self.store[(container, name)] = os.path.getsize(path)
+        self.files[(container, name)] = path
+
+    def get(self, container, name):
+        return self.store.get((container, name))
+
+    def size(self, container, name):
+        data = self.store.get((container, name))
+        return data if isinstance(data, int) else len(data or b"")
+
+# ---------------------------------------------------------------- Azure OpenAI
+
+def fake_sentence(i):
+    return f"{i}번째 발언에서 회의 안건과 일정, 담당자를 논의했습니다."
+
+class FakeTranscriptions:
+    def __init__(self, owner):
+        self.owner = owner
+
+    def create(self, file, model=None, **kwargs):
+        data = file[1].read() if isinstance(file, tuple) else file.read()
+        audio_sec = sf.info(io.BytesIO(data)).duration  # wav/flac/ogg 모두 길이 기준
+        self.owner.count("transcribe")
+        self.owner.transcribe_latency.sleep(audio_sec)
+        text = " ".join(fake_sentence(i) for i in range(int(audio_sec // 5)))
+        return SimpleNamespace(to_dict=lambda: {"text": text})
+
+class FakeCompletions:
+    def __init__(self, owner):
+        self.owner = owner
+
+    def create(self, model=None, messages=(), **kwargs):
+        self.owner.count("chat")
+        if self.owner.fail_rate and self.owner.rng.random() < self.owner.fail_rate:
+            response = httpx.Response(429, headers={"retry-after-ms": str(int(self.owner.retry_after_ms))},
+                                      request=httpx.Request("POST", "https://fake-openai/chat/completions"))
+            raise RateLimitError("fake rate limit", response=response, body=None)
+        user = messages[-1]["content"] if messages else ""
+        prompt_tokens = len(user.encode("utf-8")) // 3 + 1
+        # 병합 요청이면 batch 쪽(txt1) 줄을 그대로 돌려주고, 요약이면 앞부분만 돌려줌
+        lines = [l for l in user.splitlines() if l.startswith("[(")]
+        content = "\n".join(lines) if lines else user[:1000]
+        completion_tokens = len(content.encode("utf-8")) // 3 + 1
+        self.owner.chat_latency.sleep(completion_tokens)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens),
+        )
+
+class FakeOpenAI:
+    """
+        AzureOpenAI 대용: audio.transcriptions.create / chat.completions.create
+            - transcribe_latency: 호출당 기본 + 오디오 초당 지연
+            - chat_latency: 호출당 기본 + 출력 토큰당 지연
+            - fail_rate: chat 호출이 429(Retry-After-ms)로 실패할 확률
+    """
+    def __init__(self, transcribe_latency=None, chat_latency=None, fail_rate=0.0, retry_after_ms=50, seed=0):
+        self.transcribe_latency = transcribe_latency or Latency()
+        self.chat_latency = chat_latency or Latency()
+        self.fail_rate = fail_rate
+        self.retry_after_ms = retry_after_ms
+        self.rng = random.Random(seed)
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.audio = SimpleNamespace(transcriptions=FakeTranscriptions(self))
+        self.chat = SimpleNamespace(completions=FakeCompletions(self))
+
+    def with_options(self, **kwargs):
+        return self
+
+    def count(self, name):
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+# ---------------------------------------------------------------- Speech batch transcription REST
+
+def iso_duration(sec):
+    return f"PT{sec:.2f}S"
+
+def fake_batch_json(audio_sec, speakers=3, phrase_sec=5.0, words=False):
+    """
+        배치 전사 결과(json) 합성: phrase_sec초 간격 발화, 화자 순환, 신뢰도 0.55~0.95
+            - words=True: 표시 단어 타임스탬프(displayWords)도 포함 (발화 길이를 단어 수로 균등 분할)
+    """
+    phrases = []
+    n = int(audio_sec // phrase_sec)
+    for i in range(n):
+        best = {"confidence": 0.55 + 0.4 * ((i * 7) % 10) / 9, "display": fake_sentence(i)}
+        if words:
+            tokens = best["display"].split()
+            step = phrase_sec * 0.9 / len(tokens)
+            best["displayWords"] = [
+                {"displayText": t, "offsetInTicks": int((i * phrase_sec + k * step) * 1e7), "durationInTicks": int(step * 1e7)}
+                for k, t in enumerate(tokens)
+            ]
+        phrases.append({
+            "offset": iso_duration(i * phrase_sec),
+            "duration": iso_duration(phrase_sec * 0.9),
+            "speaker": i % speakers + 1,
+            "nBest": [best],
+        })
+    return json.dumps({"recognizedPhrases": phrases}, ensure_ascii=False).encode("utf-8")
+
+def fake_realtime_journal(audio_sec, speakers=3, phrase_sec=5.0):
+    """
+        클라이언트 실시간 전사 journal(script_realtime.jsonl) 합성: 배치 결과와 같은 발화 간격, 화자 "Guest-N"
+    """
+    rows = [
+        {"speaker": f"Guest-{i % speakers + 1}", "offset_sec": i * phrase_sec, "duration_sec": phrase_sec * 0.9,
+         "text": fake_sentence(i), "confidence": 0.8}
+        for i in range(int(audio_sec // phrase_sec))
+    ]
+    return "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in rows).encode("utf-8")
+
+class FakeResponse:
+    def __init__(self, status_code=200, payload=None, content=b""):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self._payload = payload
+        self.content = content if payload is None else json.dumps(payload).encode("utf-8")
+        self.text = self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return self._payload if self._payload is not None else json.loads(self.content)
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+class FakeSpeechSession:
+    """
+        requests.Session 대용 (Speech REST v3.2 transcriptions 일부)
+            - 등록된 wav blob 크기로 오디오 길이를 구하고, 오디오 길이 × rtf × time_scale 후 Succeeded
+            - fail_rate: 작업이 Failed로 끝날 확률
+    """
+    def __init__(self, blob_service, container, rtf=0.1, time_scale=1.0, request_latency=None, fail_rate=0.0, seed=0):
+        self.blob_service = blob_service
+        self.container = container
+        self.rtf = rtf
+        self.time_scale = time_scale
+        self.request_latency = request_latency or Latency()
+        self.fail_rate = fail_rate
+        self.rng = random.Random(seed)
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def count(self, name):
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def post(self, url, json=None, **kwargs):
+        self.count("post")
+        self.request_latency.sleep()
+        if url.endswith("/webhooks"):
+            return FakeResponse(201, {"self": "https://fake-speech/webhooks/1"})
+        wav_blob = urlparse(json["contentUrls"][0]).path.split("/", 2)[2]
+        audio_sec = max(0, self.blob_service.size(self.container, wav_blob) - 44) / PCM_BYTES_PER_SEC
+        max_speakers = json.get("properties", {}).get("diarization", {}).get("speakers", {}).get("maxCount", 3)
+        with self.lock:
+            tid = f"job{len(self.jobs) + 1:04}"
+            self.jobs[tid] = {
+                "ready_at": time.time() + audio_sec * self.rtf * self.time_scale,
+                "audio_sec": audio_sec,
+                "speakers": max_speakers,
+                "failed": self.rng.random() < self.fail_rate,
+                "words": json.get("properties", {}).get("displayFormWordLevelTimestampsEnabled", False),
+            }
+        return FakeResponse(201, {"self": f"https://fake-speech/speechtotext/v3.2/transcriptions/{tid}"})
+
+    def get(self, url, **kwargs):
+        self.count("get")
+        self.request_latency.sleep()
+        m = re.search(r"/transcriptions/(\w+)(/files)?$", url)
+        if url.startswith("fake://result/"):
+            job = self.jobs[url.rsplit("/", 1)[-1]]
+            return FakeResponse(200, content=fake_batch_json(job["audio_sec"], min(job["speakers"], 3), words=job["words"]))
+        tid, files = m.group(1), m.group(2)
+        job = self.jobs.get(tid)
+        if job is None:
+            return FakeResponse(404, {"error": "not found"})
+        if files:
+            return FakeResponse(200, {"values": [{"name": f"{tid}_0.json", "links": {"contentUrl": f"fake://result/{tid}"}}]})
+        if time.time() < job["ready_at"]:
+            return FakeResponse(200, {"status": "Running"})
+        return FakeResponse(200, {"status": "Failed" if job["failed"] else "Succeeded"})
+
+    def delete(self, url, **kwargs):
+        self.count("delete")
+        self.jobs.pop(url.rstrip("/").rsplit("/", 1)[-1], None)
+        return FakeResponse(204, {})
+
+# ---------------------------------------------------------------- Storage 큐 (PIPELINE_MODE=queue)
+
+class FakeQueueClient:
+    def __init__(self, owner, name):
+        self.owner = owner
+        self.name = name
+
+    def send_message(self, content, visibility_timeout=None, **kwargs):
+        self.owner.put(self.name, content, visibility_timeout or 0)
+
+    def create_queue(self, **kwargs):
+        pass
+
+class FakeQueues:
+    """
+        QueueClient 대용: 큐 이름별 메시지를 visibility_timeout(초) 뒤에 꺼냄
+            - run(handlers, workers): 모든 큐가 빌 때까지 메시지를 꺼내 큐별 함수를 스레드 풀에서 실행
+              (함수가 예외를 내면 max_dequeue회까지 다시 넣음 - queueTrigger 재시도 흉내, 초과분은 poison에 기록)
+    """
+    def __init__(self, max_dequeue=5):
+        self.max_dequeue = max_dequeue
+        self.heap = []
+        self.seq = 0
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.poison = []
+
+    def client(self, name):
+        return FakeQueueClient(self, name)
+
+    def put(self, name, body, delay_sec=0, dequeue=0):
+        with self.lock:
+            self.seq += 1
+            heapq.heappush(self.heap, (time.time() + delay_sec, self.seq, name, body, dequeue))
+
+    def _process(self, handlers, name, body, dequeue):
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+        try:
+            handlers[name](json.loads(body))
+        except Exception as e:
+            if dequeue + 1 < self.max_dequeue:
+                self.put(name, body, 0, dequeue + 1)
+            else:
+                self.poison.append((name, body, repr(e)))
+
+    def run(self, handlers, workers=4):
+        inflight = set()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while True:
+                now = time.time()
+                with self.lock:
+                    while self.heap and self.heap[0][0] <= now and len(inflight) < workers:
+                        _, _, name, body, dequeue = heapq.heappop(self.heap)
+                        inflight.add(pool.submit(self._process, handlers, name, body, dequeue))
+                    next_due = self.heap[0][0] if self.heap else None
+                if not inflight and next_due is None:
+                    return
+                timeout = 0.01 if next_due is None else max(0.001, min(next_due - now, 0.05))
+                done, inflight = wait(inflight, timeout=timeout, return_when=FIRST_COMPLETED)
+                for f in done:
+                    f.result()
+
+# ---------------------------------------------------------------- 트리거 입력
+
+class FakeInputStream:
+    """
+        func.InputStream 대용 (name, length + 파일 읽기)
+    """
+    def __init__(self, path, name):
+        self.name = name
+        self.length = os.path.getsize(path)
+        self._f = open(path, "rb")
+
+    def read(self, size=-1):
+        return self._f.read(size)
+
+    def close(self):
+        self._f.close()
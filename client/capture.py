@@ -0,0 +1,130 @@
+import os
+import io
+import queue
+import tempfile
+import threading
+import numpy as np
+import soundfile as sf
+
+ENCODE_FORMATS = {"flac": ("FLAC", "PCM_16"), "ogg": ("OGG", "OPUS")}  # 업로드 압축 포맷 -> (soundfile format, subtype)
+
+class CaptureBuffer:
+    """
+        녹음 PCM(int16)을 최대 녹음시간 크기로 미리 잡아둔 디스크 기반 memmap 배열에 기록
+
+            - write(): PortAudio 콜백에서 호출. 미리 할당된 배열에 복사만 함 (콜백마다 새 ndarray 할당 X)
+            - 콜백이 기록한 구간은 sink별 큐로 넘기고, sink(스트리밍 업로드, Speech push stream 등) 호출은
+              sink마다 따로 둔 소비 스레드에서 처리 → 네트워크가 멈춰도 콜백이나 다른 sink는 막히지 않음
+            - sink가 예외를 내면 그 블록만 버리고 소비 스레드는 계속 동작 (sink별 첫 오류만 출력, 버린 블록 수는 stats())
+            - 콜백 status의 input overflow/underflow 횟수 집계 → stats()
+            - 녹음 데이터는 RAM이 아니라 임시파일에 있으므로 2시간 녹음도 메모리 사용량이 일정함
+    """
+    def __init__(self, max_seconds, rate=16000, channels=1, on_audio=None):
+        self.rate = rate
+        self.channels = channels
+        self.max_frames = int(max_seconds * rate)
+        self.frames = 0
+        self.overflows = 0
+        self.underflows = 0
+        self.dropped_frames = 0
+        self.sink_dropped_blocks = 0
+        self._stats_lock = threading.Lock()
+        fd, self.path = tempfile.mkstemp(prefix="meeting_rec_", suffix=".pcm")
+        os.close(fd)
+        self.data = np.memmap(self.path, dtype=np.int16, mode="w+", shape=(self.max_frames, channels))
+        self._sinks = []
+        if on_audio:
+            self.add_sink(on_audio)
+
+    def add_sink(self, on_audio):
+        """
+            녹음된 PCM 블록(bytes)을 받을 함수 등록 (녹음 시작 전에 호출)
+        """
+        q = queue.SimpleQueue()
+        thread = threading.Thread(target=self._consume, args=(q, on_audio), daemon=True)
+        thread.start()
+        self._sinks.append((q, thread))
+
+    def count_status(self, status):
+        if status:
+            self.overflows += int(bool(status.input_overflow))
+            self.underflows += int(bool(status.input_underflow))
+
+    def write(self, indata):
+        start = self.frames
+        n = min(len(indata), self.max_frames - start)
+        if n < len(indata):
+            self.dropped_frames += len(indata) - n
+        if n <= 0:
+            return
+        self.data[start:start + n] = indata[:n]
+        self.frames = start + n
+        for q, _ in self._sinks:
+            q.put((start, start + n))
+
+    def _consume(self, q, on_audio):
+        failed = False
+        while True:
+            item = q.get()
+            if item is None:
+                break
+            start, end = item
+            try:
+                on_audio(self.data[start:end].tobytes())
+            except Exception as e:
+                with self._stats_lock:
+                    self.sink_dropped_blocks += 1
+                if not failed:
+                    print(f"[WARN] 오디오 전달 실패 ({getattr(on_audio, '__qualname__', on_audio)}): {e} -> 이후 실패 블록은 건너뜀")
+                failed = True
+
+    def close(self):
+        """
+            남은 구간을 sink로 모두 넘긴 뒤 소비 스레드 종료
+        """
+        for q, _ in self._sinks:
+            q.put(None)
+        for _, thread in self._sinks:
+            thread.join()
+
+    def view(self):
+        return self.data[:self.frames]
+
+    def to_wav_bytes(self):
+        buffer = io.BytesIO()
+        sf.write(buffer, self.view(), self.rate, format='WAV')
+        return buffer.getvalue()
+
+    def encode(self, audio_format, block_sec=10):
+        """
+            녹음 데이터를 flac(무손실) / ogg(Opus) bytes로 인코딩
+                - memmap에서 block_sec초씩 읽어 인코딩하므로 원본 PCM 전체를 RAM에 올리지 않음
+        """
+        fmt, subtype = ENCODE_FORMATS[audio_format]
+        buffer = io.BytesIO()
+        data = self.view()
+        block = self.rate * block_sec
+        with sf.SoundFile(buffer, 'w', self.rate, self.channels, subtype, format=fmt) as f:
+            for start in range(0, len(data), block):
+                f.write(data[start:start + block])
+        return buffer.getvalue()
+
+    def stats(self):
+        return {
+            "recorded_sec": self.frames / self.rate,
+            "input_overflows": self.overflows,
+            "input_underflows": self.underflows,
+            "dropped_frames": self.dropped_frames,
+            "sink_dropped_blocks": self.sink_dropped_blocks,
+        }
+
+    def release(self):
+        """
+            memmap 해제 후 임시파일 삭제
+        """
+        data, self.data = self.data, None
+        del data
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
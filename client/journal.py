@@ -0,0 +1,44 @@
+import os
+import json
+import threading
+
+JOURNAL_DIR = os.path.join(os.path.expanduser("~"), "AIMeetingAgent", "journal")
+JOURNAL_BLOB_NAME = "script_realtime.jsonl"  # 서버(BlobTrigger)가 초안 요약/병합 기준으로 읽는 파일명
+
+class TranscriptJournal:
+    """
+        실시간 전사 결과(화자/시작초/길이/문장)를 로컬 jsonl 파일에 한 줄씩 추가 기록 (append-only)
+
+            - append(): Speech SDK 콜백 스레드에서 호출. 한 줄 쓰고 바로 flush (프로그램이 중간에 꺼져도 그때까지의 기록 유지)
+            - 시작초는 녹음 파일 기준 (일시정지 구간은 push stream에 안 들어가므로 녹음 파일과 시간이 맞음)
+            - 업로드: upload.upload_realtime_journal() -> {meeting_dir}/script_realtime.jsonl
+    """
+    def __init__(self, meeting_id, journal_dir=JOURNAL_DIR):
+        os.makedirs(journal_dir, exist_ok=True)
+        self.path = os.path.join(journal_dir, f"{meeting_id}.jsonl")
+        self.count = 0
+        self._lock = threading.Lock()
+        self._f = open(self.path, "a", encoding="utf-8")
+
+    def append(self, speaker, offset_sec, duration_sec, text, confidence=None):
+        row = {
+            "speaker": speaker,
+            "offset_sec": round(offset_sec, 3),
+            "duration_sec": round(duration_sec, 3),
+            "text": text,
+            "confidence": confidence,
+        }
+        with self._lock:
+            if self._f.closed:
+                return
+            self._f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            self._f.flush()
+            self.count += 1
+
+    def close(self):
+        with self._lock:
+            self._f.close()
+
+    def read_bytes(self):
+        with open(self.path, "rb") as f:
+            return f.read()
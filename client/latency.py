@@ -0,0 +1,46 @@
+import time
+import threading
+from bisect import bisect_left
+
+class LatencyProbe:
+    """
+        실시간 전사 지연 측정: 오디오 캡처 시각 -> Speech SDK 이벤트(transcribing/transcribed) 수신 시각
+
+            - mark(frame_end): 오디오 콜백에서 블록 기록 직후 호출. 블록 끝 프레임 위치와 캡처 시각만 list에 추가
+            - observe(kind, end_sec): 이벤트 콜백에서 발화 끝 시각(push stream 기준 초)으로 호출
+              → 그 프레임이 캡처된 시각과 지금의 차이를 지연으로 기록
+            - summary(): 이벤트 종류별 지연 p50/p95/최대(초)와 측정 개수 (회의 메타데이터에 같이 올려 장비별 튜닝에 사용)
+    """
+    def __init__(self, rate=16000, block_ms=None):
+        self.rate = rate
+        self.block_ms = block_ms
+        self.frame_ends = []
+        self.times = []
+        self.latencies = {}
+        self._lock = threading.Lock()
+
+    def mark(self, frame_end):
+        self.frame_ends.append(frame_end)
+        self.times.append(time.monotonic())
+
+    def observe(self, kind, end_sec):
+        now = time.monotonic()
+        n = len(self.times)
+        i = bisect_left(self.frame_ends, int(end_sec * self.rate), 0, n)
+        if i >= n:
+            return  # 아직 기록되지 않은 위치 (스트림 기준 시각 오차)
+        with self._lock:
+            self.latencies.setdefault(kind, []).append(now - self.times[i])
+
+    def summary(self):
+        with self._lock:
+            latencies = {k: sorted(v) for k, v in self.latencies.items()}
+        result = {"block_ms": self.block_ms}
+        for kind, values in latencies.items():
+            result[kind] = {
+                "count": len(values),
+                "p50_sec": round(values[len(values) // 2], 3),
+                "p95_sec": round(values[min(len(values) - 1, int(len(values) * 0.95))], 3),
+                "max_sec": round(values[-1], 3),
+            }
+        return result
@@ -1,18 +1,48 @@
 import time
+STARTUP_T0 = time.perf_counter()  # 시작 시간 측정 기준 (다른 import보다 먼저)
 from datetime import datetime
-from azure.storage.blob import BlobServiceClient
 from utils import create_meeting_obj
-from record import record_and_get_wav_bytes
-from upload import upload_to_blob
+from record import record_and_get_wav_bytes, CAPTURE_BLOCK_MS
+from upload import (
+    upload_to_blob, upload_meeting_metadata, upload_realtime_journal, get_pcm_wav_metadata, StreamingWavUploader,
+    UploadJournal, pending_upload_journals, resume_pending_uploads
+)
+from journal import TranscriptJournal
+from latency import LatencyProbe
+from startup import StartupTimer, preload_modules
+# 무거운 SDK(sounddevice, Speech, Storage, numpy/soundfile)는 사용하는 함수 안에서 import (첫 화면까지 시간 단축)
 
 BLOB_ACCOUNT_NAME = "aimeet"
 BLOB_ACCOUNT_KEY = "6Vrfnw+Mdl6GF8z822vX8zerN8KS4BcnHl/7hy549Y9w6TzBNHZwcrPBGqarhFS8jCCRn3YdLvhB+AStddc3Dw=="
 BLOB_CONTAINER_NAME = "meeting"
+STREAM_UPLOAD = True  # 녹음하면서 4MB 단위로 바로 업로드 (False면 녹음 종료 후 한 번에 업로드), 어느 쪽이든 끊기면 다음 실행에서 이어 올림
+AUDIO_UPLOAD_FORMAT = "wav"  # "flac"(무손실, 약 1/2) / "ogg"(Opus, 약 1/10): 녹음 종료 후 인코딩해 업로드 (스트리밍 업로드 사용 안 함)
+
+def new_blob_service():
+    """
+        Blob 서비스 클라이언트 (Storage SDK는 여기서 처음 import)
+    """
+    from azure.storage.blob import BlobServiceClient
+    return BlobServiceClient(
+        account_url=f"https://{BLOB_ACCOUNT_NAME}.blob.core.windows.net",
+        credential=BLOB_ACCOUNT_KEY
+    )
 
 if __name__ == "__main__":
-    
+
+    startup = StartupTimer(STARTUP_T0)
     print("안녕하세요, AI Meeting Agent 입니다.", flush=True) # pyinstaller문제(input() 바로 안뜨는문제) 해결
-    time.sleep(0.1)  
+    time.sleep(0.1)
+    # 첫 질문에 답하는 동안 녹음/업로드에 쓸 SDK를 미리 로드
+    preload_modules()
+    startup.check_first_prompt()
+    # 지난 실행에서 업로드 도중 꺼진 회의가 있으면 이어서 올림 (이미 올라간 블록은 건너뜀)
+    pending = pending_upload_journals()
+    if pending and input(f"이전에 끝나지 않은 업로드가 {len(pending)}건 있습니다. 이어서 올릴까요? [Y/N]: ").strip().lower() == "y":
+        try:
+            resume_pending_uploads(new_blob_service(), pending)
+        except Exception as e:
+            print(f"\n[ERROR] 이어 올리기 실패 (다음 실행시 다시 시도): {e}")
     resp = input("회의 녹음을 시작할까요? [Y/N]: ").strip().lower()
     if resp != "y":
         print("녹음 취소.. 곧 종료됩니다.", flush=True)
@@ -20,8 +50,35 @@ if __name__ == "__main__":
         exit(0)
 
     meeting_obj = create_meeting_obj()
-    wav_bytes = record_and_get_wav_bytes()
-    if not wav_bytes:
+    meeting_dir = f"{datetime.now().strftime('%Y%m%d')}/{meeting_obj['id']}"
+    blob_service = new_blob_service()
+
+    # 실시간 전사 결과는 로컬 journal에 계속 기록해두고 오디오와 함께 업로드 (서버에서 초안 요약/병합 기준으로 사용)
+    journal = TranscriptJournal(meeting_obj['id'])
+    # 캡처 -> 실시간 전사 지연은 회의 메타데이터에 같이 올림 (설치 장비별 CAPTURE_BLOCK_MS 조정용)
+    probe = LatencyProbe(block_ms=CAPTURE_BLOCK_MS)
+    uploader = None
+    try:
+        if STREAM_UPLOAD and AUDIO_UPLOAD_FORMAT == "wav":
+            # 녹음 중 프로그램이 꺼져도 로컬 사본과 stage 기록으로 다음 실행에서 이어 올림 (메타데이터도 같이 기록)
+            upload_journal = UploadJournal(meeting_dir)
+            upload_journal.update(metadata=meeting_obj)
+            uploader = StreamingWavUploader(blob_service, BLOB_CONTAINER_NAME, f"{meeting_dir}/meeting_audio_raw.wav",
+                                            upload_journal)
+            record_and_get_wav_bytes(on_audio=uploader.write, keep_buffer=False, on_transcript=journal.append, probe=probe,
+                                     startup=startup)
+            has_data = uploader.data_bytes > 0
+        else:
+            wav_bytes = record_and_get_wav_bytes(audio_format=AUDIO_UPLOAD_FORMAT, on_transcript=journal.append, probe=probe,
+                                                 startup=startup)
+            has_data = bool(wav_bytes)
+    finally:
+        journal.close()
+    meeting_obj['realtime_latency'] = probe.summary()
+    meeting_obj['startup_timing'] = startup.summary()
+    if not has_data:
+        if uploader:
+            uploader.abort()
         print("데이터 없음."); time.sleep(2); exit(0)
 
     while True:
@@ -35,14 +92,28 @@ if __name__ == "__main__":
         print("범위를 고려해 화자 수를 다시 입력해주세요.")
 
     if input("\n회의 녹음파일을 업로드할까요? 업로드시 스크립트와 요약문이 추출됩니다. [Y/N]: ").strip().lower() == "y":
-        blob_service = BlobServiceClient(
-            account_url=f"https://{BLOB_ACCOUNT_NAME}.blob.core.windows.net",
-            credential=BLOB_ACCOUNT_KEY
-        )
-        meeting_dir = f"{datetime.now().strftime('%Y%m%d')}/{meeting_obj['id']}"
-        upload_to_blob(wav_bytes, meeting_obj, blob_service, BLOB_CONTAINER_NAME, meeting_dir)
-        print("파일 업로드 완료. 프로그램이 곧 종료됩니다.")
+        # 네트워크가 끊겨 실패하면 다시 시도 (이미 stage된 블록은 건너뛰고 이어 올림)
+        while True:
+            try:
+                upload_realtime_journal(journal, blob_service, BLOB_CONTAINER_NAME, meeting_dir)
+                if uploader:
+                    # 메타데이터를 먼저 올리고 wav를 commit해야 BlobTrigger가 메타데이터를 바로 읽을 수 있음
+                    meeting_obj['wav_metadata'] = get_pcm_wav_metadata(uploader.data_bytes)
+                    uploader.journal.update(metadata=meeting_obj)
+                    upload_meeting_metadata(meeting_obj, blob_service, BLOB_CONTAINER_NAME, meeting_dir)
+                    uploader.finish()
+                else:
+                    upload_to_blob(wav_bytes, meeting_obj, blob_service, BLOB_CONTAINER_NAME, meeting_dir, audio_format=AUDIO_UPLOAD_FORMAT)
+                print("파일 업로드 완료. 프로그램이 곧 종료됩니다.")
+                break
+            except Exception as e:
+                print(f"\n[ERROR] 업로드 실패: {e}")
+                if input("다시 시도할까요? [Y/N]: ").strip().lower() != "y":
+                    print("업로드 중단. 다음 실행시 이어서 올릴 수 있습니다.")
+                    break
         time.sleep(2)
     else:
+        if uploader:
+            uploader.abort()
         print("저장 안 함. 프로그램이 곧 종료됩니다.")
         time.sleep(2)
@@ -1,15 +1,12 @@
-import io
+import os
 import time
 import sys
+import json
+import queue
 import threading
 import platform
-import numpy as np
-import sounddevice as sd
-import soundfile as sf
-from azure.cognitiveservices.speech import SpeechConfig, AudioConfig, ResultReason, PropertyId
-from azure.cognitiveservices.speech.audio import AudioStreamFormat, PushAudioInputStream
-from azure.cognitiveservices.speech import transcription as speechsdk_transcription
 from utils import print_minute_progress
+# sounddevice / Azure Speech SDK / capture(numpy, soundfile)는 첫 화면을 늦추지 않도록 사용하는 함수 안에서 import
 
 RATE = 16000
 CHANNELS = 1
@@ -18,20 +15,113 @@ MAX_DURATION_SECONDS = MAX_DURATION_HOURS * 60 * 60
 
 SPEECH_KEY = "BFTxWwEp2hSxWM8JwEMXcjJ8A1NUEBBE7zoE0AUGnvNYFWqyGTvwJQQJ99BEAC3pKaRXJ3w3AAAYACOGgwE5"
 SPEECH_REGION = "eastasia"
+TICKS_PER_SEC = 10_000_000  # Speech SDK offset/duration 단위(100ns)
+CAPTURE_BLOCK_MS = 50       # 오디오 콜백 블록 크기(ms): 작을수록 실시간 전사 지연↓, 콜백 횟수↑ (LatencyProbe 결과 보고 장비별 조정)
+PROGRESS_INTERVAL_SEC = 0.5 # 메인 루프(진행바/최대 녹음시간 확인) 주기, 일시정지 처리는 키 입력 스레드에서 바로 함
+DEVICE_PROBE_TIMEOUT_SEC = 3.0  # 입력 장치별 확인 대기 한도 (응답 없는 가상 장치는 목록에서 제외)
+DEVICE_PROFILE_PATH = os.path.join(os.path.expanduser("~"), "AIMeetingAgent", "device_profile.json")  # 마지막으로 녹음에 성공한 장치
 
-def list_and_choose_input_device():
+def open_test(sd, device_idx):
     """
-        사용 가능한 마이크 목록을 보여주고, 사용자입력으로 장치 번호를 선택받아 반환
+        장치로 입력 스트림을 실제로 열었다 닫아봄 (실패하면 예외)
     """
-    devices = sd.query_devices()
-    input_devices = []
-    for i, d in enumerate(devices):
-        if d['max_input_channels'] > 0:
+    with sd.InputStream(device=device_idx, channels=CHANNELS, samplerate=RATE):
+        pass
+
+def probe_input_devices(sd, devices, timeout=DEVICE_PROBE_TIMEOUT_SEC):
+    """
+        입력 채널이 있는 장치들을 백그라운드 스레드 1개에서 차례로 열어보고 열리는 장치만 [(번호, 장치정보)]로 반환
+
+            - PortAudio는 여러 스레드에서 동시에 스트림을 열면 안전하지 않으므로 한 번에 한 장치만 엶
+            - 장치마다 timeout 안에 응답이 없으면 멈춘 드라이버로 보고 확인 중단 (그 장치는 제외, 남은 장치는 확인 없이 목록에 넣고 선택시 녹음 전 확인)
+            - 중단 뒤 멈춘 호출이 풀려도 다음 장치는 열지 않음 (메인 스레드의 녹음 스트림과 겹치지 않도록), daemon이라 프로그램 종료도 막지 않음
+    """
+    targets = [i for i, d in enumerate(devices) if d['max_input_channels'] > 0]
+    results = queue.Queue()
+    stop = threading.Event()
+
+    def probe():
+        for i in targets:
+            if stop.is_set():
+                return
             try:
-                with sd.InputStream(device=i, channels=1, samplerate=RATE):
-                    input_devices.append((i, d))
+                open_test(sd, i)
+                results.put((i, True))
             except Exception:
-                continue
+                results.put((i, False))
+
+    threading.Thread(target=probe, daemon=True).start()
+    ok = []
+    for n, i in enumerate(targets):
+        try:
+            _, opened = results.get(timeout=timeout)
+        except queue.Empty:
+            stop.set()
+            unchecked = targets[n + 1:]
+            print(f"[WARN] 응답 없는 입력 장치 제외: [{i}]" + (f", 확인하지 못한 장치: {unchecked}" if unchecked else ""))
+            ok.extend(unchecked)
+            break
+        if opened:
+            ok.append(i)
+    return [(i, devices[i]) for i in ok]
+
+def device_profile(sd, device_idx):
+    """
+        장치 식별 정보 (번호는 장치 추가/제거시 바뀌므로 이름 + 호스트 API로 찾음)
+    """
+    d = sd.query_devices(device_idx)
+    return {"index": device_idx, "name": d['name'], "hostapi": sd.query_hostapis(d['hostapi'])['name']}
+
+def save_device_profile(sd, device_idx, path=DEVICE_PROFILE_PATH):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(device_profile(sd, device_idx), f, ensure_ascii=False)
+    except Exception as e:
+        print(f"[WARN] 장치 정보 저장 실패: {e}")
+
+def cached_input_device(sd, devices, path=DEVICE_PROFILE_PATH):
+    """
+        마지막으로 쓴 장치가 지금도 있고 열리면 그 번호 반환 (없거나 안 열리면 None -> 전체 장치 확인)
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            profile = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    candidates = [i for i, d in enumerate(devices)
+                  if d['name'] == profile.get("name") and d['max_input_channels'] > 0
+                  and sd.query_hostapis(d['hostapi'])['name'] == profile.get("hostapi")]
+    candidates.sort(key=lambda i: i != profile.get("index"))  # 같은 번호 우선
+    for i in candidates:
+        try:
+            open_test(sd, i)
+            return i
+        except Exception:
+            continue
+    return None
+
+def list_and_choose_input_device(startup=None):
+    """
+        사용 가능한 마이크 목록을 보여주고, 사용자입력으로 장치 번호를 선택받아 반환
+
+            - 마지막으로 녹음한 장치가 그대로 있으면 전체 장치 확인 없이 바로 사용할지 물어봄
+            - 전체 확인은 백그라운드 스레드 1개에서 장치를 하나씩 차례로 열어봄 (probe_input_devices, 장치별 대기 한도)
+            - startup: StartupTimer. 장치 확인 시간(device_probe)과 캐시 사용 여부(device_profile) 기록
+    """
+    import sounddevice as sd
+    devices = sd.query_devices()
+    cached = cached_input_device(sd, devices)
+    if startup:
+        startup.set("device_profile", "cached" if cached is not None else "probed")
+    if cached is not None:
+        ans = input(f"지난번 사용한 마이크 [{cached}] {devices[cached]['name']} 로 녹음할까요? (Enter: 예 / n: 다른 장치 선택): ")
+        if ans.strip().lower() != "n":
+            return cached
+    t0 = time.perf_counter()
+    input_devices = probe_input_devices(sd, devices)
+    if startup:
+        startup.set("device_probe_sec", round(time.perf_counter() - t0, 3))
     if not input_devices:
         print()
         print("-"*70)
@@ -67,23 +157,28 @@ def check_input_device_active(device_idx):
     """
         선택한 마이크 장치가 녹음 가능한지 테스트
     """
+    import sounddevice as sd
     try:
-        with sd.InputStream(device=device_idx, channels=CHANNELS, samplerate=RATE):
-            pass
+        open_test(sd, device_idx)
         return True
     except Exception as e:
         print(f"[ERROR] 디바이스 사용 불가: {e}")
         return False
 
-def realtime_from_push_stream(push_stream):
+def realtime_from_push_stream(push_stream, on_transcript=None, probe=None):
     """
         사운드 디바이스로 입력된 PCM오디오 PushAudioInputStream을 실시간으로 Azure Speech에 보내고, 
         인식 결과(화자분리포함) 실시간 출력
 
             - 사용자 발화를 실시간 스트림(PushAudio)을 통해 azure에 보내고 전사/화자분리 결과 바로 출력
+            - on_transcript(speaker, offset_sec, duration_sec, text, confidence): 확정된 발화마다 호출 (예: TranscriptJournal.append)
+            - probe: LatencyProbe. 중간/확정 결과를 받을 때마다 발화 끝 위치의 캡처 시각 대비 지연 기록
     """
+    from azure.cognitiveservices.speech import SpeechConfig, AudioConfig, ResultReason, PropertyId, OutputFormat
+    from azure.cognitiveservices.speech import transcription as speechsdk_transcription
     cfg = SpeechConfig(subscription=SPEECH_KEY, region=SPEECH_REGION)
     cfg.speech_recognition_language = "ko-KR"
+    cfg.output_format = OutputFormat.Detailed  # 결과 json에 신뢰도(NBest) 포함
     cfg.set_property(PropertyId.SpeechServiceResponse_DiarizeIntermediateResults, "true")
     audio_cfg = AudioConfig(stream=push_stream)
     transcriber = speechsdk_transcription.ConversationTranscriber(cfg, audio_cfg)
@@ -96,10 +191,20 @@ def realtime_from_push_stream(push_stream):
         """
         r = evt.result
         if r.reason == ResultReason.RecognizedSpeech:
+            if probe:
+                probe.observe("transcribed", (r.offset + r.duration) / TICKS_PER_SEC)
             speaker = getattr(r, "speaker_id", "Unknown")
             print(f"[{speaker}] {r.text.strip()}")
+            if on_transcript and r.text.strip():
+                on_transcript(speaker, r.offset / TICKS_PER_SEC, r.duration / TICKS_PER_SEC, r.text.strip(), result_confidence(r))
+
+    def on_transcribing(evt):
+        r = evt.result
+        probe.observe("transcribing", (r.offset + r.duration) / TICKS_PER_SEC)
 
     transcriber.transcribed.connect(on_transcribed)
+    if probe:
+        transcriber.transcribing.connect(on_transcribing)
     transcriber.start_transcribing_async()
     try:
         while not stop_event.is_set():
@@ -109,12 +214,57 @@ def realtime_from_push_stream(push_stream):
     finally:
         transcriber.stop_transcribing_async()
 
-def pause_key_listener(paused_flag, stop_flag):
+def result_confidence(result):
+    """
+        인식 결과 json(Detailed 출력)의 첫 후보 신뢰도 (없으면 None)
+    """
+    try:
+        return json.loads(result.json)["NBest"][0]["Confidence"]
+    except (ValueError, KeyError, IndexError, TypeError):
+        return None
+
+class PauseClock:
+    """
+        일시정지/재개 상태와 실제 녹음 경과시간 관리 (키 입력 스레드에서 toggle() 호출)
+
+            - paused: 녹음 콜백과 진행바에 상태 전달용 플래그
+            - resumed: 재개 직후 첫 콜백 무시용 플래그 (pause 해제시 내부 버퍼 중복방지)
+            - 토글 시점에 바로 일시정지 시간을 계산하므로 메인 루프가 자주 깨어나 확인할 필요 없음
+    """
+    def __init__(self):
+        self.paused = threading.Event()
+        self.resumed = threading.Event()
+        self.t0 = time.time()
+        self.total_pause_time = 0.0
+        self.pause_start = None
+        self._lock = threading.Lock()
+
+    def toggle(self):
+        """
+            일시정지 <-> 재개 전환, 일시정지 상태가 되면 True 반환
+        """
+        with self._lock:
+            if self.paused.is_set():
+                self.total_pause_time += time.time() - self.pause_start
+                self.pause_start = None
+                self.resumed.set()
+                self.paused.clear()
+                return False
+            self.pause_start = time.time()
+            self.paused.set()
+            return True
+
+    def recorded_sec(self):
+        with self._lock:
+            paused = time.time() - self.pause_start if self.pause_start is not None else 0.0
+            return time.time() - self.t0 - self.total_pause_time - paused
+
+def pause_key_listener(clock, stop_flag):
     """
         spacebar 입력을 감지해 일시정지/재개 토글, 종료 플래그 신호를 받으면 종료
 
             - 윈도우/맥 나눠서 감지
-            - paused_flag : 메인스레드에서 녹음 콜백과 진행바(1분마다출력)에 상태 전달용플래그
+            - clock : PauseClock. 녹음 콜백과 진행바(1분마다출력)에 상태 전달
             - stop_flag: 메인스레드에 녹음종료시 pause thread도 마무리용 플래그
     """
     if platform.system() == "Windows": # 윈도우
@@ -123,12 +273,7 @@ def pause_key_listener(paused_flag, stop_flag):
             if msvcrt.kbhit():
                 key = msvcrt.getch()
                 if key == b' ':
-                    if paused_flag.is_set():
-                        paused_flag.clear() # clear() : 녹음 시작
-                        print("[녹음 재개]") 
-                    else:
-                        paused_flag.set() # set() : 녹음 일시정지
-                        print("[녹음 일시정지]")
+                    print("[녹음 일시정지]" if clock.toggle() else "[녹음 재개]")
             time.sleep(0.03)
     else: # 맥북용
         import select, tty, termios
@@ -140,34 +285,43 @@ def pause_key_listener(paused_flag, stop_flag):
                 if select.select([sys.stdin], [], [], 0.05)[0]:
                     key = sys.stdin.read(1)
                     if key == " ":
-                        if paused_flag.is_set():
-                            paused_flag.clear()
-                            print("[spacebar] 녹음 재개")
-                        else:
-                            paused_flag.set()
-                            print("[spacebar] 녹음 일시정지")
+                        print("[spacebar] 녹음 일시정지" if clock.toggle() else "[spacebar] 녹음 재개")
         finally:
             termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
 
-def record_and_get_wav_bytes():
+def record_and_get_wav_bytes(on_audio=None, keep_buffer=True, audio_format="wav", on_transcript=None,
+                             block_ms=CAPTURE_BLOCK_MS, probe=None, startup=None):
     """
         전체 녹음/전사 파이프라인의 핵심 함수.
             - 마이크 선택 → 실시간 전사/화자분리
             - spacebar로 일시정지/재개 (진행바와 실제 녹음 모두 일시정지)
             - ctrl+c로 녹음 중단, wav byte로 반환
             - pause 해제시 내부 버퍼 중복방지
+            - on_audio: 녹음된 PCM 블록(bytes)을 받을 함수 (예: 녹음 중 스트리밍 업로드)
+            - keep_buffer=False: 녹음 종료 후 wav bytes를 만들지 않음 (on_audio로만 전달, None 반환)
+            - audio_format: "flac"/"ogg"면 녹음 종료 후 해당 포맷으로 인코딩한 bytes 반환
+            - on_transcript: 실시간 전사로 확정된 발화를 받을 함수 (realtime_from_push_stream 참고)
+            - block_ms: 오디오 콜백 블록 크기(ms)
+            - probe: LatencyProbe. 캡처 -> 실시간 전사 이벤트 지연 측정 (녹음 종료시 요약 출력)
+            - startup: StartupTimer. 장치 확인 시간 기록 (list_and_choose_input_device 참고)
+            - 콜백은 capture 버퍼 복사만 하고, Azure push stream 전송/on_audio 전달은 capture의 sink별 소비 스레드에서 처리
+              (Speech SDK 전송이 멈춰도 콜백이 막히지 않아 입력 오버플로 방지)
     """
-    device_idx = list_and_choose_input_device()
+    import sounddevice as sd
+    from azure.cognitiveservices.speech.audio import AudioStreamFormat, PushAudioInputStream
+    from capture import CaptureBuffer
+
+    device_idx = list_and_choose_input_device(startup)
     if not check_input_device_active(device_idx):
         sys.exit(1)
+    save_device_profile(sd, device_idx)  # 다음 실행에서는 이 장치를 바로 확인
     yn = input(f"\n{device_idx}번을 선택하셨습니다. 해당 장비로 녹음을 시작할까요? [Y/N]: ").strip().lower()
     if yn != "y":
         print("녹음 취소됨."); time.sleep(2); sys.exit(0)
 
-    paused_flag = threading.Event()
+    clock = PauseClock()
     stop_flag = threading.Event()
-    skip_next_callback = threading.Event()  # <-- pause 해제 직후 콜백 스킵용
-    pause_thread = threading.Thread(target=pause_key_listener, args=(paused_flag, stop_flag), daemon=True)
+    pause_thread = threading.Thread(target=pause_key_listener, args=(clock, stop_flag), daemon=True)
     pause_thread.start()
 
     print("\n" + "-"*70)
@@ -182,52 +336,46 @@ def record_and_get_wav_bytes():
     print("      (2) \"마이크를 테스트하세요\"에서 마이크 활성화여부")
     print("-"*70)
 
-    rec_buffers = []
+    capture = CaptureBuffer(MAX_DURATION_SECONDS, rate=RATE, channels=CHANNELS, on_audio=on_audio)
     fmt = AudioStreamFormat(samples_per_second=RATE, bits_per_sample=16, channels=CHANNELS)
     push_stream = PushAudioInputStream(fmt)
-    trans_thread = threading.Thread(target=realtime_from_push_stream, args=(push_stream,), daemon=True)
+    capture.add_sink(push_stream.write)
+    trans_thread = threading.Thread(target=realtime_from_push_stream, args=(push_stream, on_transcript, probe), daemon=True)
     trans_thread.start()
 
     def audio_callback(indata, frames, t, status):
         """
-            sounddevice InputStream 콜백에서 일시정지/녹음 buffer 관리, Azure 전송
+            sounddevice InputStream 콜백에서 일시정지/녹음 buffer 관리
+                - 미리 할당된 capture 버퍼에 복사만 함 (네트워크 I/O 없음)
         """
-        if paused_flag.is_set():
+        capture.count_status(status)
+        if clock.paused.is_set():
             return
-        if skip_next_callback.is_set():
-            skip_next_callback.clear()
+        if clock.resumed.is_set():
+            clock.resumed.clear()  # pause 해제 후 첫 콜백은 indata 무시
             return
-        rec_buffers.append(indata.copy())
-        push_stream.write(indata.tobytes())
+        capture.write(indata)
+        if probe:
+            probe.mark(capture.frames)
 
     stream = sd.InputStream(
         samplerate=RATE, channels=CHANNELS, dtype='int16',
         callback=audio_callback,
-        blocksize=800,  # 빠른 실시간 전사위해 800샘플마다 전송
+        blocksize=RATE * block_ms // 1000,
         device=device_idx
     )
 
-    t0 = time.time()
-    total_pause_time = 0.0
-    pause_start = None
     last_min = -1
     recorded_sec = 0.0
 
     try:
         stream.start()
+        clock.t0 = time.time()
         print("[녹음 시작] * spacebar: 일시정지/재개, ctrl+c: 종료/저장")
         while True:
-            time.sleep(0.05)
-            # 일시정지 시작
-            if paused_flag.is_set() and pause_start is None:
-                pause_start = time.time()
-            # 일시정지 종료(녹음재개)
-            if not paused_flag.is_set() and pause_start is not None:
-                total_pause_time += time.time() - pause_start
-                pause_start = None
-                skip_next_callback.set()   # <--- pause 해제 후 첫 콜백은 indata 무시
-            recorded_sec = time.time() - t0 - total_pause_time
-            if not paused_flag.is_set():
+            time.sleep(PROGRESS_INTERVAL_SEC)
+            recorded_sec = clock.recorded_sec()
+            if not clock.paused.is_set():
                 curr_min = int(recorded_sec // 60)
                 if curr_min != last_min:
                     last_min = curr_min
@@ -241,14 +389,30 @@ def record_and_get_wav_bytes():
         pause_thread.join()
         stream.stop()
         stream.close()
+        capture.close()  # 남은 블록을 push stream/on_audio로 모두 넘긴 뒤
         push_stream.close()
         trans_thread.join(timeout=2)
 
-    if not rec_buffers:
-        print("녹음한 데이터가 없습니다.")
-        return None
-    audio = np.concatenate(rec_buffers, axis=0)
-    buffer = io.BytesIO()
-    sf.write(buffer, audio, RATE, format='WAV')
-    buffer.seek(0)
-    return buffer.getvalue()
+    stats = capture.stats()
+    if stats["input_overflows"] or stats["input_underflows"] or stats["dropped_frames"]:
+        print(f"[WARN] 입력 오버플로 {stats['input_overflows']}회, 언더플로 {stats['input_underflows']}회, "
+              f"누락 프레임 {stats['dropped_frames']}개")
+    if stats["sink_dropped_blocks"]:
+        print(f"[WARN] 실시간 전사/스트리밍 업로드로 넘기지 못한 블록 {stats['sink_dropped_blocks']}개 (녹음 파일에는 포함)")
+    if probe:
+        for kind, lat in probe.summary().items():
+            if isinstance(lat, dict):
+                print(f"[INFO] 실시간 전사 지연({kind}, 블록 {block_ms}ms): p50 {lat['p50_sec']}s, "
+                      f"p95 {lat['p95_sec']}s, 최대 {lat['max_sec']}s ({lat['count']}건)")
+    try:
+        if not keep_buffer:
+            return None
+        if not capture.frames:
+            print("녹음한 데이터가 없습니다.")
+            return None
+        if audio_format != "wav":
+            print(f"[INFO] {audio_format} 인코딩 중...", flush=True)
+            return capture.encode(audio_format)
+        return capture.to_wav_bytes()
+    finally:
+        capture.release()
@@ -0,0 +1,60 @@
+import time
+import threading
+import importlib
+
+# 첫 화면 이후에 필요한 무거운 모듈 (main/record/upload는 이 모듈들을 사용하는 함수 안에서 import)
+HEAVY_MODULES = (
+    "sounddevice",
+    "numpy",
+    "soundfile",
+    "azure.cognitiveservices.speech",
+    "azure.storage.blob",
+)
+FIRST_PROMPT_BUDGET_SEC = 1.0  # 실행 -> 첫 입력 안내까지 이보다 오래 걸리면 경고 (PyInstaller 빈 콘솔 회귀 확인용)
+
+class StartupTimer:
+    """
+        클라이언트 시작 구간 시간 측정 (실행 시각 기준 경과초)
+
+            - mark(name): 해당 시점까지 경과초 기록 (예: first_prompt)
+            - set(name, value): 구간 시간/측정 조건 기록 (예: device_probe_sec, 장치를 캐시에서 찾았는지 - 사용자 입력 대기는 넣지 않음)
+            - summary(): 회의 메타데이터(startup_timing)에 같이 올려 설치 PC별 시작 지연 확인
+    """
+    def __init__(self, t0=None):
+        self.t0 = time.perf_counter() if t0 is None else t0
+        self.values = {}
+
+    def mark(self, name):
+        self.values[f"{name}_sec"] = round(time.perf_counter() - self.t0, 3)
+        return self.values[f"{name}_sec"]
+
+    def set(self, name, value):
+        self.values[name] = value
+
+    def summary(self):
+        return dict(self.values)
+
+    def check_first_prompt(self, budget_sec=FIRST_PROMPT_BUDGET_SEC):
+        """
+            첫 입력 안내 직전에 호출: 경과초 기록 후 예산을 넘으면 경고 출력
+        """
+        sec = self.mark("first_prompt")
+        if sec > budget_sec:
+            print(f"[WARN] 시작 지연 {sec:.2f}s (기준 {budget_sec:.1f}s)", flush=True)
+        return sec
+
+def preload_modules(modules=HEAVY_MODULES):
+    """
+        사용자가 첫 질문에 답하는 동안 무거운 모듈을 백그라운드 스레드에서 미리 import
+            - 실제 사용하는 함수의 import는 이미 로드된 모듈을 바로 가져옴 (동시 import는 모듈별 import lock으로 순서 보장)
+            - 설치되지 않은 모듈은 건너뜀 (오류는 실제 사용하는 곳에서 그대로 발생)
+    """
+    def load():
+        for name in modules:
+            try:
+                importlib.import_module(name)
+            except ImportError:
+                pass
+    thread = threading.Thread(target=load, daemon=True)
+    thread.start()
+    return thread
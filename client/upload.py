@@ -1,13 +1,30 @@
 import io
+import os
 import json
-from azure.storage.blob import ContentSettings
+import time
+import queue
+import random
+import struct
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from utils import human_filesize
-import soundfile as sf
+from journal import JOURNAL_BLOB_NAME
+# Azure Storage SDK / soundfile은 첫 화면을 늦추지 않도록 사용하는 함수 안에서 import
+
+BLOCK_SIZE = 4 * 1024 * 1024
+UPLOAD_WORKERS = 4            # 동시에 올리는 블록 수 (지연이 큰 회선에서도 왕복 대기 대신 대역폭만큼 올라가도록)
+UPLOAD_MAX_RETRIES = 5        # 블록별 재시도 횟수 (SDK 자체 재시도 이후에도 실패한 경우)
+UPLOAD_BACKOFF_SEC = 1.0      # 재시도 대기: 1, 2, 4, ... 초 (최대 UPLOAD_BACKOFF_MAX_SEC, 0.5~1배 무작위)
+UPLOAD_BACKOFF_MAX_SEC = 30.0
+UPLOAD_JOURNAL_DIR = os.path.join(os.path.expanduser("~"), "AIMeetingAgent", "uploads")
+AUDIO_CONTENT_TYPES = {"wav": "audio/wav", "flac": "audio/flac", "ogg": "audio/ogg"}
 
 def get_wav_metadata(wav_bytes):
     """
-        WAV 파일 메타 추출
+        오디오 파일(wav/flac/ogg) 메타 추출
     """
+    import soundfile as sf
     buffer = io.BytesIO(wav_bytes)
     with sf.SoundFile(buffer) as f:
         samplerate = f.samplerate
@@ -19,34 +36,362 @@ def get_wav_metadata(wav_bytes):
         "size_MB": round(size_bytes / (1024 * 1024), 2)
     }
 
-def upload_blob(blob_service, container_name, blob_name, data_bytes, content_type=None):
+def get_pcm_wav_metadata(data_bytes, samplerate=16000, channels=1, bits=16):
+    """
+        스트리밍 업로드한 PCM wav 메타 계산 (wav bytes 없이 데이터 크기로)
+    """
+    size_bytes = 44 + data_bytes
+    return {
+        "samplerate": samplerate,
+        "duration_sec": data_bytes / (samplerate * channels * bits // 8),
+        "size_MB": round(size_bytes / (1024 * 1024), 2)
+    }
+
+def wav_header(data_size, samplerate=16000, channels=1, bits=16):
+    """
+        PCM wav 헤더(44바이트) 생성
+    """
+    block_align = channels * bits // 8
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_size, b"WAVE",
+        b"fmt ", 16, 1, channels, samplerate, samplerate * block_align, block_align, bits,
+        b"data", data_size
+    )
+
+def fix_wav_header(path):
+    """
+        스트리밍 업로드용 로컬 wav 사본의 헤더를 실제 데이터 크기로 고침 (끝의 잘린 프레임은 버림), 데이터 크기 반환
+    """
+    with open(path, "r+b") as f:
+        header = f.read(44)
+        channels, samplerate = struct.unpack_from("<HI", header, 22)
+        block_align, bits = struct.unpack_from("<HH", header, 32)
+        f.seek(0, os.SEEK_END)
+        data_size = (f.tell() - 44) // block_align * block_align
+        f.truncate(44 + data_size)
+        f.seek(0)
+        f.write(wav_header(data_size, samplerate, channels, bits))
+    return data_size
+
+def content_settings(content_type):
+    """
+        blob Content-Type 설정
+    """
+    from azure.storage.blob import ContentSettings
+    return ContentSettings(content_type=content_type)
+
+def block_id(n):
+    """
+        n번째 블록 ID (같은 파일을 다시 올려도 같은 ID -> 미commit 블록 재사용 가능)
+    """
+    return f"{n:08d}"
+
+def is_retryable_upload_error(e):
+    """
+        다시 시도할 만한 업로드 오류인지 (연결 끊김/타임아웃, 408/429/5xx, 전송 중 손상으로 인한 MD5 불일치)
+    """
+    from azure.core.exceptions import AzureError, HttpResponseError
+    if isinstance(e, HttpResponseError) and e.status_code is not None:
+        return e.status_code in (408, 429) or e.status_code >= 500 or getattr(e, "error_code", None) == "Md5Mismatch"
+    return isinstance(e, (AzureError, OSError))
+
+def stage_block_with_retry(blob_client, block_id, chunk, max_retries=UPLOAD_MAX_RETRIES):
+    """
+        블록 1개 stage (validate_content: 요청에 MD5를 붙여 서비스가 받은 내용 검증), 일시 오류면 지수 backoff 후 재시도
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            blob_client.stage_block(block_id, chunk, validate_content=True)
+            return
+        except Exception as e:
+            if attempt == max_retries or not is_retryable_upload_error(e):
+                raise
+            delay = min(UPLOAD_BACKOFF_MAX_SEC, UPLOAD_BACKOFF_SEC * 2 ** attempt) * random.uniform(0.5, 1)
+            print(f"\n[WARN] 블록 {block_id} 업로드 실패, {delay:.1f}초 후 재시도 ({attempt + 1}/{max_retries}): {type(e).__name__}")
+            time.sleep(delay)
+
+def uncommitted_blocks(blob_client):
+    """
+        서비스에 stage됐지만 아직 commit 안 된 블록 {블록 ID: 크기} (blob이 없으면 빈 dict)
+    """
+    from azure.core.exceptions import ResourceNotFoundError
+    try:
+        _, uncommitted = blob_client.get_block_list("uncommitted")
+    except ResourceNotFoundError:
+        return {}
+    return {b.id: b.size for b in uncommitted}
+
+class UploadJournal:
+    """
+        블록 업로드 진행 기록 (회의 폴더별 로컬 json) - 끊긴 업로드를 다시 시작할 때 이미 올린 블록은 건너뜀
+
+            - 내용: 대상 blob, 전체 크기(스트리밍 업로드 중이면 None), 블록 크기, stage 완료한 블록 번호 -> MD5
+            - 재개시 서비스의 미commit 블록 목록(get_block_list)에 같은 크기로 남아 있고 MD5도 같은 블록만 생략
+            - spool(): 올릴 오디오를 로컬에 복사해 두면 프로그램이 꺼져도 다음 실행에서 이어 올림 (pending_upload_journals)
+            - update(metadata=...): 스트리밍 업로드는 메타데이터도 기록해 두고 이어 올릴 때 오디오보다 먼저 올림
+            - done(): commit 후 기록과 로컬 사본 삭제
+    """
+    def __init__(self, meeting_dir, journal_dir=UPLOAD_JOURNAL_DIR):
+        os.makedirs(journal_dir, exist_ok=True)
+        self.meeting_dir = meeting_dir
+        self.path = os.path.join(journal_dir, meeting_dir.replace("/", "_") + ".json")
+        self._lock = threading.Lock()
+        self.state = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def spool_path(self, audio_format):
+        return self.path[:-len(".json")] + f".{audio_format}"
+
+    def spool(self, data_bytes, audio_format):
+        audio_path = self.spool_path(audio_format)
+        with open(audio_path, "wb") as f:
+            f.write(data_bytes)
+        self.update(audio_path=audio_path)
+
+    def update(self, **fields):
+        with self._lock:
+            self.state.update(fields)
+            self._save()
+
+    def begin(self, container_name, blob_name, size, block_size, content_type):
+        """
+            업로드 시작 기록, 같은 blob/크기/블록 크기로 이전에 stage한 블록 {번호: MD5} 반환 (다르면 기록을 새로 시작)
+                - 기록된 크기가 None(스트리밍 업로드 중 종료)이면 크기는 비교하지 않음 (블록 위치가 같고 MD5로 내용 확인)
+        """
+        target = {"meeting_dir": self.meeting_dir, "container_name": container_name, "blob_name": blob_name,
+                  "size": size, "block_size": block_size, "content_type": content_type}
+        with self._lock:
+            same = all(self.state.get(k) == v for k, v in target.items() if not (k == "size" and self.state.get(k) is None))
+            blocks = self.state.get("blocks", {}) if same else {}
+            self.state = dict(self.state, **target, blocks=blocks)
+            self._save()
+            return {int(i): md5 for i, md5 in blocks.items()}
+
+    def blocks(self):
+        with self._lock:
+            return {int(i): md5 for i, md5 in self.state.get("blocks", {}).items()}
+
+    def mark(self, index, md5):
+        with self._lock:
+            self.state["blocks"][str(index)] = md5
+            self._save()
+
+    def done(self):
+        with self._lock:
+            audio_path = self.state.get("audio_path")
+            for path in (self.path, audio_path):
+                if path and os.path.exists(path):
+                    os.remove(path)
+            self.state = {}
+
+def pending_upload_journals(journal_dir=UPLOAD_JOURNAL_DIR):
+    """
+        지난 실행에서 끝나지 않은 업로드 (로컬 사본이 남아 있는 기록만)
+    """
+    if not os.path.isdir(journal_dir):
+        return []
+    journals = []
+    for name in sorted(os.listdir(journal_dir)):
+        if not name.endswith(".json"):
+            continue
+        with open(os.path.join(journal_dir, name), encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("blob_name") and state.get("audio_path") and os.path.exists(state["audio_path"]):
+            journals.append(UploadJournal(state["meeting_dir"], journal_dir))
+    return journals
+
+def upload_blob(blob_service, container_name, blob_name, data_bytes, content_type=None, journal=None, workers=UPLOAD_WORKERS):
     """
-        wav파일 청킹해서 blob 업로드
-    
+        파일을 BLOCK_SIZE 블록으로 나눠 workers개씩 동시에 stage_block 후 commit
+
+            - 블록마다 MD5 검증 + 일시 오류 재시도 (stage_block_with_retry)
+            - journal(UploadJournal)이 있으면 stage한 블록을 기록해, 끊긴 뒤 다시 호출하면 남아 있는 블록은 건너뛰고 이어 올림
     """
     blob_client = blob_service.get_blob_client(container=container_name, blob=blob_name)
-    block_size = 4 * 1024 * 1024
-    uploaded = 0
-    stream = io.BytesIO(data_bytes)
-    block_ids = []
-    while True:
-        chunk = stream.read(block_size)
-        if not chunk: break
-        block_id = f"{len(block_ids):08d}".encode("utf-8")
-        blob_client.stage_block(block_id, chunk)
-        block_ids.append(block_id)
-        uploaded += len(chunk)
-        print(f"\r[UPLOAD] {human_filesize(uploaded)}", end="")
-    blob_client.commit_block_list(block_ids, content_settings=ContentSettings(content_type=content_type))
+    view = memoryview(data_bytes)
+    offsets = range(0, len(data_bytes), BLOCK_SIZE)
+    block_ids = [block_id(i) for i in range(len(offsets))]
+
+    skip = set()
+    prior = journal.begin(container_name, blob_name, len(data_bytes), BLOCK_SIZE, content_type) if journal else {}
+    if prior:
+        remote = uncommitted_blocks(blob_client)
+        for i, md5 in prior.items():
+            chunk = view[offsets[i]:offsets[i] + BLOCK_SIZE]
+            if remote.get(block_ids[i]) == len(chunk) and hashlib.md5(chunk).hexdigest() == md5:
+                skip.add(i)
+    uploaded = sum(min(BLOCK_SIZE, len(data_bytes) - offsets[i]) for i in skip)
+    if skip:
+        print(f"[UPLOAD] 이전 업로드 이어서: {len(skip)}/{len(block_ids)} 블록 ({human_filesize(uploaded)}) 생략")
+    lock = threading.Lock()
+
+    def stage(i):
+        nonlocal uploaded
+        chunk = bytes(view[offsets[i]:offsets[i] + BLOCK_SIZE])
+        stage_block_with_retry(blob_client, block_ids[i], chunk)
+        if journal:
+            journal.mark(i, hashlib.md5(chunk).hexdigest())
+        with lock:
+            uploaded += len(chunk)
+            print(f"\r[UPLOAD] {human_filesize(uploaded)} / {human_filesize(len(data_bytes))}", end="")
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        futures = [ex.submit(stage, i) for i in range(len(block_ids)) if i not in skip]
+        try:
+            for f in futures:
+                f.result()
+        except BaseException:
+            for f in futures:
+                f.cancel()
+            raise
+    blob_client.commit_block_list(block_ids, content_settings=content_settings(content_type))
+    if journal:
+        journal.done()
     print("\n[OK] 업로드 완료")
 
-def upload_to_blob(wav_bytes, meeting_obj, blob_service, container_name, meeting_dir):
+def resume_pending_uploads(blob_service, journals):
     """
-        녹음된 WAV 파일 및 회의 메타데이터 blob에 업로드
+        지난 실행에서 끊긴 업로드를 로컬 사본으로 이어 올림
+
+            - 스트리밍 업로드(녹음 중/commit 전 종료): 사본 wav 헤더를 실제 크기로 고치고, 기록해 둔 메타데이터를 오디오보다 먼저 올림
+            - 그 외에는 메타데이터가 오디오보다 먼저 올라가 있음
+    """
+    for journal in journals:
+        state = journal.state
+        if state.get("size") is None and fix_wav_header(state["audio_path"]) == 0:
+            journal.done()  # 녹음 시작 직후 종료되어 올릴 데이터 없음
+            continue
+        print(f"[UPLOAD] 이어 올리기: {state['blob_name']}")
+        with open(state["audio_path"], "rb") as f:
+            data_bytes = f.read()
+        if state.get("metadata"):
+            meeting_obj = dict(state["metadata"], wav_metadata=get_pcm_wav_metadata(len(data_bytes) - 44))
+            upload_meeting_metadata(meeting_obj, blob_service, state["container_name"], state["meeting_dir"])
+        upload_blob(blob_service, state["container_name"], state["blob_name"], data_bytes,
+                    content_type=state["content_type"], journal=journal)
+
+class StreamingWavUploader:
+    """
+        녹음 중 PCM 데이터를 로컬 wav 사본에 이어 쓰면서 4MB 블록이 찰 때마다 바로 blob에 stage_block (녹음 종료 후 업로드 대기 제거)
+
+            - 블록 배치는 upload_blob과 같음 (wav 파일 전체를 BLOCK_SIZE로 나눈 n번째 구간 = block_id(n)),
+              헤더가 든 0번 블록과 마지막 블록은 크기가 정해지는 finish()에서 올림
+            - write(): 사본에 append만 하고, 블록이 다 차면 업로드 스레드로 블록 번호만 넘김 (네트워크 I/O 없음)
+            - stage한 블록은 journal(UploadJournal)에 MD5와 함께 기록 → 프로그램이 꺼지거나 업로드를 포기해도
+              다음 실행에서 pending_upload_journals / resume_pending_uploads로 이어 올림
+            - 블록마다 MD5 검증 + 일시 오류 재시도, 그래도 실패한 블록은 finish()에서 사본으로 다시 올림
+            - finish(): 사본 헤더를 실제 크기로 고치고 남은 블록 stage → commit_block_list → 사본/기록 삭제 (실패하면 다시 호출 가능)
+            - abort(): 업로드 중단 + 사본/기록 삭제. commit하지 않은 블록은 blob에 반영되지 않고 서비스에서 자동 정리됨
+    """
+    def __init__(self, blob_service, container_name, blob_name, journal, samplerate=16000, channels=1, bits=16,
+                 content_type="audio/wav"):
+        self.blob_client = blob_service.get_blob_client(container=container_name, blob=blob_name)
+        self.journal = journal
+        self.content_type = content_type
+        self.data_bytes = 0
+        self.path = journal.spool_path("wav")
+        self._file = open(self.path, "w+b")
+        self._file.write(wav_header(0, samplerate, channels, bits))  # 자리만 잡아두고 finish()에서 실제 크기로
+        journal.update(audio_path=self.path)
+        journal.begin(container_name, blob_name, None, BLOCK_SIZE, content_type)
+        self._next_block = 1
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._upload_worker, daemon=True)
+        self._thread.start()
+
+    def write(self, pcm_bytes):
+        self._file.write(pcm_bytes)
+        self.data_bytes += len(pcm_bytes)
+        if (self._next_block + 1) * BLOCK_SIZE <= 44 + self.data_bytes:
+            self._file.flush()  # 업로드 스레드가 다른 핸들로 읽음
+            while (self._next_block + 1) * BLOCK_SIZE <= 44 + self.data_bytes:
+                self._queue.put(self._next_block)
+                self._next_block += 1
+
+    def _stage(self, f, i):
+        f.seek(i * BLOCK_SIZE)
+        chunk = f.read(BLOCK_SIZE)
+        stage_block_with_retry(self.blob_client, block_id(i), chunk)
+        self.journal.mark(i, hashlib.md5(chunk).hexdigest())
+
+    def _upload_worker(self):
+        with open(self.path, "rb") as f:
+            while True:
+                i = self._queue.get()
+                if i is None:
+                    break
+                try:
+                    self._stage(f, i)
+                except Exception as e:
+                    print(f"\n[WARN] 블록 {block_id(i)} 업로드 보류 (업로드 단계에서 다시 시도): {e}")
+
+    def _close_spool(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        if not self._file.closed:
+            self._file.close()
+
+    def finish(self):
+        self._close_spool()
+        size = 44 + fix_wav_header(self.path)
+        n_blocks = -(-size // BLOCK_SIZE)
+        staged = self.journal.blocks()
+        with open(self.path, "rb") as f:
+            for i in range(n_blocks):
+                if i not in staged:
+                    self._stage(f, i)
+        self.blob_client.commit_block_list([block_id(i) for i in range(n_blocks)],
+                                           content_settings=content_settings(self.content_type))
+        self.journal.done()
+        print(f"[OK] 업로드 완료 ({human_filesize(size)})")
+
+    def abort(self):
+        self._close_spool()
+        self.journal.done()
+
+def upload_meeting_metadata(meeting_obj, blob_service, container_name, meeting_dir):
+    """
+        회의 메타데이터(JSON) blob에 업로드
     """
-    wav_name = f"{meeting_dir}/meeting_audio_raw.wav"
     json_name = f"{meeting_dir}/meeting_metadata.json"
-    upload_blob(blob_service, container_name, wav_name, wav_bytes, content_type='audio/wav')
-    meeting_obj['wav_metadata'] = get_wav_metadata(wav_bytes)
     json_bytes = json.dumps(meeting_obj, ensure_ascii=False, indent=2).encode('utf-8')
     upload_blob(blob_service, container_name, json_name, json_bytes, content_type='application/json')
+
+def upload_realtime_journal(journal, blob_service, container_name, meeting_dir):
+    """
+        실시간 전사 journal(jsonl)을 오디오와 같은 회의 폴더에 업로드 (오디오보다 먼저 올려야 BlobTrigger가 바로 사용)
+    """
+    if not journal.count:
+        return
+    blob_client = blob_service.get_blob_client(container=container_name, blob=f"{meeting_dir}/{JOURNAL_BLOB_NAME}")
+    blob_client.upload_blob(journal.read_bytes(), overwrite=True,
+                            content_settings=content_settings("application/x-ndjson"))
+    print(f"[OK] 실시간 전사 {journal.count}개 발화 업로드 완료")
+
+def upload_to_blob(wav_bytes, meeting_obj, blob_service, container_name, meeting_dir, audio_format="wav"):
+    """
+        녹음된 오디오 파일(wav/flac/ogg) 및 회의 메타데이터 blob에 업로드
+
+            - 메타데이터를 먼저 올려야 오디오 업로드로 실행되는 BlobTrigger가 메타데이터를 바로 읽을 수 있음
+    """
+    audio_name = f"{meeting_dir}/meeting_audio_raw.{audio_format}"
+    meeting_obj['wav_metadata'] = dict(get_wav_metadata(wav_bytes), format=audio_format)
+    # 업로드 도중 프로그램이 꺼져도 다음 실행에서 이어 올리도록 로컬 사본과 진행 기록을 남김 (완료되면 삭제)
+    journal = UploadJournal(meeting_dir)
+    journal.spool(wav_bytes, audio_format)
+    upload_meeting_metadata(meeting_obj, blob_service, container_name, meeting_dir)
+    upload_blob(blob_service, container_name, audio_name, wav_bytes, content_type=AUDIO_CONTENT_TYPES[audio_format], journal=journal)